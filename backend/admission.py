@@ -0,0 +1,133 @@
+import os
+import math
+import collections
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from prometheus_client import Gauge, Histogram, Counter
+from log_setup import get_rate_limited_logger
+from thread_budget import PIPELINE_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+per_item_logger = get_rate_limited_logger(__name__)     # one rejection message per overload burst
+
+# Limits apply per worker process
+ADMISSION_MAX_CONCURRENT = PIPELINE_CONCURRENCY     # ADMISSION_MAX_CONCURRENT, else split from the core budget
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "16"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30"))
+
+pipeline_queue_depth = Gauge('pipeline_queue_depth', 'Requests waiting for a pipeline slot', multiprocess_mode='livesum')
+pipelines_in_flight = Gauge('pipelines_in_flight', 'Pipelines currently running', multiprocess_mode='livesum')
+pipeline_queue_wait_time = Histogram('pipeline_queue_wait_time', 'Time spent waiting for a pipeline slot',
+                                     buckets=(0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 30, 60))
+pipeline_rejections = Counter('pipeline_rejections', 'Requests rejected by admission control', ['reason'])
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a request cannot be admitted: 429 when the wait queue is full,
+    503 when it waited longer than the queue timeout.
+    """
+
+    def __init__(self, status_code, reason, retry_after):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Caps the number of concurrently running pipelines, with a bounded wait queue and a queue timeout.
+
+    Excess requests are rejected quickly instead of all competing for the CPU and slowing each other
+    down until they time out together.
+    """
+
+    def __init__(self, max_concurrent=ADMISSION_MAX_CONCURRENT, max_queue=ADMISSION_MAX_QUEUE,
+                 queue_timeout=ADMISSION_QUEUE_TIMEOUT):
+        """
+        Parameters:
+        -----------
+        max_concurrent : int
+            Pipelines allowed to run at once.
+        max_queue : int
+            Requests allowed to wait for a slot; further requests get a 429.
+        queue_timeout : float
+            Seconds a request may wait before it gets a 503.
+        """
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self._condition = threading.Condition()
+        self._queue = collections.deque()     # one ticket per waiting request, in arrival order
+        self._service_time = None   # moving average of pipeline run time, for Retry-After
+
+    def retry_after(self):
+        """
+        Seconds a rejected client should wait: roughly the time to drain the current queue.
+        """
+        service_time = self._service_time or 1.0
+        return max(1, math.ceil(service_time * (self.waiting + 1) / self.max_concurrent))
+
+    def _reject(self, status_code, reason):
+        pipeline_rejections.labels(reason=reason).inc()
+        per_item_logger.warning(f"Admission rejected ({reason}): {self.active} running, {self.waiting} waiting.")
+        raise AdmissionRejected(status_code, reason, self.retry_after())
+
+    @contextmanager
+    def admit(self, timeout=None):
+        """
+        Context manager holding a pipeline slot for the duration of the block.
+
+        Parameters:
+        -----------
+        timeout : float, optional
+            Shorter queue timeout for this request (e.g. what is left of its deadline).
+
+        Raises:
+        -------
+        AdmissionRejected
+            If the queue is full or the wait exceeds the queue timeout.
+        """
+        start = time.monotonic()
+        with self._condition:
+            if self.active >= self.max_concurrent or self.waiting > 0:
+                if self.waiting >= self.max_queue:
+                    self._reject(429, "queue_full")
+                # first come, first served: only the head of the queue may take a freed slot, so
+                # neither new arrivals nor other waiters can overtake a request that is already waiting
+                ticket = object()
+                self._queue.append(ticket)
+                self.waiting += 1
+                pipeline_queue_depth.inc()
+                try:
+                    queue_timeout = self.queue_timeout if timeout is None else min(self.queue_timeout, timeout)
+                    deadline = start + queue_timeout
+                    while self.active >= self.max_concurrent or self._queue[0] is not ticket:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._reject(503, "queue_timeout")
+                        self._condition.wait(remaining)
+                finally:
+                    self._queue.remove(ticket)
+                    self.waiting -= 1
+                    pipeline_queue_depth.dec()
+                    self._condition.notify_all()    # the next request is now at the head
+            self.active += 1
+            pipelines_in_flight.inc()
+        pipeline_queue_wait_time.observe(time.monotonic() - start)
+
+        run_start = time.monotonic()
+        try:
+            yield
+        finally:
+            run_time = time.monotonic() - run_start
+            with self._condition:
+                self.active -= 1
+                pipelines_in_flight.dec()
+                self._service_time = run_time if self._service_time is None else 0.8 * self._service_time + 0.2 * run_time
+                self._condition.notify_all()
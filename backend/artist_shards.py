@@ -0,0 +1,132 @@
+# artist_shards.py
+# Per-artist shards for the incremental DVC stages: each stage keeps one CSV per artist plus a manifest
+# recording what every shard was built from, so a run only redoes the artists whose inputs changed.
+
+import os
+import re
+import json
+import shutil
+import hashlib
+import pandas as pd
+
+SHARD_ROOT = os.getenv("ARTIST_SHARD_DIR", "artist_shards")
+LYRICS_SHARD_DIR = os.path.join(SHARD_ROOT, "lyrics")
+VECTOR_SHARD_DIR = os.path.join(SHARD_ROOT, "vectors")
+MANIFEST_FILE = "manifest.json"
+LYRICS_COLUMNS = ["artist", "track", "lyrics"]
+VECTOR_COLUMNS = ["artist", "track", "lyrics", "esa_vector", "esa_version"]
+
+
+def shard_file(artist):
+    """
+    Shard file name of an artist: a readable slug plus a hash of the exact name, so names that
+    slug the same (e.g. "AC/DC" and "AC DC") do not collide.
+    """
+    slug = re.sub(r"[^a-z0-9]+", "-", artist.lower()).strip("-")[:60] or "artist"
+    return f"{slug}-{hashlib.sha1(artist.encode('utf-8')).hexdigest()[:8]}.csv"
+
+
+def file_hash(path):
+    """
+    Content hash of a shard, recorded by the stages that consume it.
+    """
+    with open(path, "rb") as file:
+        return hashlib.md5(file.read()).hexdigest()
+
+
+def read_manifest(shard_dir):
+    """
+    The manifest of a shard directory: artist name -> entry (with at least a 'tracks' count and,
+    for non-empty artists, the 'shard' file name). Empty if the directory has none yet.
+    """
+    path = os.path.join(shard_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as file:
+        return json.load(file)["artists"]
+
+
+def write_manifest(shard_dir, artists):
+    """
+    Replace the manifest atomically and delete shard files no entry refers to any more.
+
+    Parameters:
+    -----------
+    shard_dir : str
+        The shard directory.
+    artists : dict
+        Artist name -> manifest entry.
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    tmp_path = os.path.join(shard_dir, MANIFEST_FILE + ".tmp")
+    with open(tmp_path, "w") as file:
+        json.dump({"artists": artists}, file, indent=1, sort_keys=True)
+    os.replace(tmp_path, os.path.join(shard_dir, MANIFEST_FILE))
+
+    referenced = {entry["shard"] for entry in artists.values() if entry.get("shard")}
+    for name in os.listdir(shard_dir):
+        if name.endswith(".csv") and name not in referenced:
+            os.remove(os.path.join(shard_dir, name))
+
+
+def write_shard(shard_dir, artist, df):
+    """
+    Write one artist's rows to its shard (atomically, so an interrupted run never leaves a partial shard).
+
+    Returns:
+    --------
+    str
+        The shard file name.
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    name = shard_file(artist)
+    tmp_path = os.path.join(shard_dir, name + ".tmp")
+    df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, os.path.join(shard_dir, name))
+    return name
+
+
+def read_shard(shard_dir, entry):
+    """
+    Rows of one manifest entry (an empty frame for artists without tracks).
+    """
+    if not entry.get("shard"):
+        return pd.DataFrame()
+    return pd.read_csv(os.path.join(shard_dir, entry["shard"]))
+
+
+def merge_shards(shard_dir, artists, output_file, columns):
+    """
+    Write the combined view of a shard directory: the shards of `artists`, in that order, concatenated
+    byte for byte below one header, so the merge never parses the rows.
+
+    Parameters:
+    -----------
+    shard_dir : str
+        The shard directory.
+    artists : list of str
+        Artists to include, in output order; artists without a shard are skipped.
+    output_file : str
+        Combined CSV, replaced atomically.
+    columns : list of str
+        Header written when there is no shard at all.
+
+    Returns:
+    --------
+    int
+        Number of shards merged.
+    """
+    manifest = read_manifest(shard_dir)
+    shards = [manifest[artist]["shard"] for artist in artists if manifest.get(artist, {}).get("shard")]
+    tmp_path = output_file + ".tmp"
+    with open(tmp_path, "wb") as output:
+        if not shards:
+            output.write((",".join(columns) + "\n").encode("utf-8"))
+        for i, name in enumerate(shards):
+            with open(os.path.join(shard_dir, name), "rb") as shard:
+                header = shard.readline()
+                if i == 0:
+                    output.write(header)
+                shutil.copyfileobj(shard, output)
+    os.replace(tmp_path, output_file)
+    return len(shards)
@@ -0,0 +1,62 @@
+import time
+import argparse
+import tracemalloc
+import numpy as np
+from generate_soundtrack import assign_songs_to_scenes
+
+# this script benchmarks dense Hungarian assignment against pruned sparse matching
+
+
+def random_esa_vectors(rng, n, dim):
+    """
+    ESA-like vectors: non-negative and skewed towards a few strong concepts.
+    """
+    return rng.random((n, dim)) ** 4
+
+
+def time_call(fn, repeats):
+    """
+    Best wall-clock time of `repeats` calls, peak traced memory (MB) and the last result.
+    """
+    best, result = float("inf"), None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn()
+    peak_mb = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    return best, peak_mb, result
+
+
+def main(scene_counts, track_counts, dim=75, repeats=3, reuse_penalty=0.05, seed=5402):
+    rng = np.random.default_rng(seed)
+    print(f"{'scenes':>6} {'tracks':>7} {'dense_s':>9} {'sparse_s':>9} {'reuse_s':>9} {'speedup':>8} "
+          f"{'dense_MB':>9} {'sparse_MB':>9} {'same_total':>10}")
+
+    for n_scenes in scene_counts:
+        for n_tracks in track_counts:
+            scenes = random_esa_vectors(rng, n_scenes, dim)
+            tracks = random_esa_vectors(rng, n_tracks, dim)
+
+            dense_time, dense_mb, (_, dense_total, _) = time_call(
+                lambda: assign_songs_to_scenes(scenes, tracks), repeats)
+            sparse_time, sparse_mb, (_, sparse_total, _) = time_call(
+                lambda: assign_songs_to_scenes(scenes, tracks, mode="sparse"), repeats)
+            reuse_time, _, _ = time_call(
+                lambda: assign_songs_to_scenes(scenes, tracks, mode="sparse", reuse_penalty=reuse_penalty), repeats)
+
+            print(f"{n_scenes:>6} {n_tracks:>7} {dense_time:>9.4f} {sparse_time:>9.4f} {reuse_time:>9.4f} "
+                  f"{dense_time / sparse_time:>7.1f}x {dense_mb:>9.1f} {sparse_mb:>9.1f} "
+                  f"{str(np.isclose(dense_total, sparse_total)):>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency of dense vs sparse scene-to-song assignment.")
+    parser.add_argument("--scenes", type=int, nargs="+", default=[10, 50, 100, 200])
+    parser.add_argument("--tracks", type=int, nargs="+", default=[100, 1000, 10000, 50000])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    main(args.scenes, args.tracks, repeats=args.repeats)
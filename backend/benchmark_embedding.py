@@ -0,0 +1,110 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+# this script measures MiniLM sentence throughput under the CPU inference settings in process_storyline
+# (int8 dynamic quantisation, length-bucketed batching, intra-op threads) and checks that the scene
+# boundaries on the MPST sample match the float32 baseline
+# every setting runs in a fresh process because the settings are read at model load
+
+
+def run_single(data_file, sample_size, repeats):
+    """
+    Encode the sampled storylines with the settings from the environment and print
+    sentences per second and the scene boundaries of every storyline as JSON.
+    """
+    from nltk.tokenize import sent_tokenize
+    from benchmark_segmenters import load_storylines
+    from process_storyline import (clean_text, encode_sentences, get_sentence_model, resolve_segmenter,
+                                   scene_boundaries)
+
+    texts = load_storylines(data_file, sample_size)
+    story_sentences = [sent_tokenize(clean_text(text)) for text in texts]
+    all_sentences = [sentence for sentences in story_sentences for sentence in sentences]
+    _, similarity_threshold = resolve_segmenter("minilm")
+
+    start = time.perf_counter()
+    get_sentence_model()
+    load_s = time.perf_counter() - start
+
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        embeddings = encode_sentences(all_sentences, "minilm")
+        timings.append(time.perf_counter() - start)
+
+    boundaries = []
+    offset = 0
+    for sentences in story_sentences:
+        boundaries.append(scene_boundaries(embeddings[offset:offset + len(sentences)], similarity_threshold))
+        offset += len(sentences)
+
+    print(json.dumps({
+        "sentences": len(all_sentences),
+        "load_seconds": load_s,
+        "sentences_per_second": len(all_sentences) / min(timings),
+        "boundaries": boundaries,
+    }))
+
+
+def boundary_agreement(baseline, candidate):
+    """
+    Fraction of storylines with identical boundaries, and the F1 of the boundary positions.
+    """
+    identical = sum(b == c for b, c in zip(baseline, candidate)) / len(baseline)
+    true_positives = sum(len(set(b) & set(c)) for b, c in zip(baseline, candidate))
+    n_baseline = sum(len(b) for b in baseline)
+    n_candidate = sum(len(c) for c in candidate)
+    if n_baseline + n_candidate == 0:
+        return identical, 1.0
+    return identical, 2 * true_positives / (n_baseline + n_candidate)
+
+
+def main(data_file, sample_size, repeats, threads, min_f1):
+    settings = [("fp32", "fixed"), ("fp32", "bucketed"), ("int8", "fixed"), ("int8", "bucketed")]
+
+    baseline = None
+    failed = False
+    print(f"{'weights':>7} {'batching':>8} {'threads':>7} {'load_s':>7} {'sent/s':>8} {'identical':>9} {'f1':>6}")
+    for thread_count in threads:
+        for weights, batching in settings:
+            env = dict(os.environ,
+                       MINILM_QUANTIZE="1" if weights == "int8" else "0",
+                       MINILM_TOKEN_BUDGET=os.getenv("MINILM_TOKEN_BUDGET", "4096") if batching == "bucketed" else "0",
+                       MINILM_THREADS=str(thread_count))
+            output = subprocess.run(
+                [sys.executable, __file__, "--single", "--data", data_file, "--sample-size", str(sample_size),
+                 "--repeats", str(repeats)],
+                capture_output=True, text=True, check=True, env=env
+            ).stdout.strip().splitlines()[-1]
+            result = json.loads(output)
+
+            # the first setting (float32, fixed batches) is the reference for the parity check
+            if baseline is None:
+                baseline = result["boundaries"]
+            identical, f1 = boundary_agreement(baseline, result["boundaries"])
+            failed = failed or f1 < min_f1
+            print(f"{weights:>7} {batching:>8} {thread_count or 'default':>7} {result['load_seconds']:>7.2f} "
+                  f"{result['sentences_per_second']:>8.0f} {identical:>9.3f} {f1:>6.3f}")
+
+    if failed:
+        print(f"Scene boundaries diverge from the float32 baseline (F1 below {min_f1}).")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MiniLM CPU inference throughput and scene-boundary parity.")
+    parser.add_argument("--data", default="mpst_full_data.csv")
+    parser.add_argument("--sample-size", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--threads", type=int, nargs="+", default=[0, 1, 2, 4])
+    parser.add_argument("--min-f1", type=float, default=0.95, help="minimum boundary F1 against float32")
+    parser.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.single:
+        run_single(args.data, args.sample_size, args.repeats)
+    else:
+        main(args.data, args.sample_size, args.repeats, args.threads, args.min_f1)
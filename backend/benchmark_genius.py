@@ -0,0 +1,100 @@
+import os
+import sys
+import time
+import argparse
+import subprocess
+import concurrent.futures
+import requests
+
+# this script compares the HTTP calls and latency of get_artist_top_tracks with the previous
+# implementation (search_artist followed by a title search per song) against genius_stub.py,
+# a local stand-in for the Genius API that adds a fixed latency to every response
+
+
+def legacy_top_tracks(artist_name, top_n=10):
+    """
+    The previous get_artist_top_tracks: search_artist (which already scrapes every song's lyrics)
+    and then a fresh title search plus lyrics scrape per song, without the artist name.
+    """
+    from genius_handler import get_genius_client, clean_title, clean_lyrics
+
+    genius = get_genius_client()
+
+    def get_lyrics(track_name, retries=3):
+        track_name = clean_title(track_name)
+        for attempt in range(retries):
+            track = genius.search_song(title=track_name)
+            if track and track.lyrics:
+                return [artist_name, track_name, clean_lyrics(track.lyrics)]
+        return None
+
+    artist = genius.search_artist(artist_name=artist_name, max_songs=top_n, sort="popularity",
+                                  get_full_info=False, per_page=top_n)
+    results = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(5, len(artist.songs))) as executor:
+        futures = [executor.submit(get_lyrics, song.title) for song in artist.songs]
+        for future in concurrent.futures.as_completed(futures):
+            if future.result():
+                results.append(future.result())
+    return results
+
+
+def wrong_artist_tracks(artist_name, tracks):
+    """
+    Number of returned tracks whose lyrics belong to another artist's song of the same title.
+    """
+    return sum(artist_name not in lyrics for _, _, lyrics in tracks)
+
+
+def main(artists, top_n, port, latency):
+    base_url = f"http://127.0.0.1:{port}"
+    os.environ.update({
+        "GENIUS_API_URL": f"{base_url}/v1/",
+        "GENIUS_PUBLIC_API_URL": f"{base_url}/api/",
+        "GENIUS_WEB_URL": f"{base_url}/web/",
+        "GENIUS_ACCESS_TOKEN": os.getenv("GENIUS_ACCESS_TOKEN") or "stub",
+    })
+    from genius_handler import get_artist_top_tracks
+
+    stub = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "genius_stub.py"),
+                             "--port", str(port), "--latency", str(latency)])
+    try:
+        for _ in range(100):
+            try:
+                requests.get(f"{base_url}/stats", timeout=1)
+                break
+            except requests.ConnectionError:
+                time.sleep(0.1)
+
+        print(f"{'implementation':>14} {'artist':>14} {'tracks':>6} {'wrong':>5} {'http_calls':>10} {'seconds':>8}  calls by endpoint")
+        totals = {}
+        for name, fetch in [("search_artist", legacy_top_tracks), ("direct", get_artist_top_tracks)]:
+            for artist in artists:
+                requests.post(f"{base_url}/reset")
+                start = time.perf_counter()
+                tracks = fetch(artist, top_n=top_n)
+                seconds = time.perf_counter() - start
+                calls = requests.get(f"{base_url}/stats").json()
+                n_calls = sum(calls.values())
+                calls_total, seconds_total = totals.get(name, (0, 0.0))
+                totals[name] = (calls_total + n_calls, seconds_total + seconds)
+                by_endpoint = ", ".join(f"{k}={v}" for k, v in calls.items() if v)
+                print(f"{name:>14} {artist:>14} {len(tracks):>6} {wrong_artist_tracks(artist, tracks):>5} "
+                      f"{n_calls:>10} {seconds:>8.2f}  {by_endpoint}")
+
+        print()
+        for name, (n_calls, seconds) in totals.items():
+            print(f"{name:>14}: {n_calls} HTTP calls, {seconds:.2f}s for {len(artists)} artists")
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP calls and latency of the Genius top-tracks lookup.")
+    parser.add_argument("--artists", nargs="+", default=["Dua Lipa", "Adele", "Lionel Richie"])
+    parser.add_argument("--top-n", type=int, default=10)
+    parser.add_argument("--port", type=int, default=8091)
+    parser.add_argument("--latency", type=float, default=0.1, help="stub seconds per response")
+    args = parser.parse_args()
+    main(args.artists, args.top_n, args.port, args.latency)
@@ -0,0 +1,80 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import subprocess
+import tempfile
+import pandas as pd
+
+# this script measures the wall time of the incremental fetch_artist_lyrics and generate_esa_vectors stages
+# (and the merge) for a full build, for adding one artist to the list and for a run without changes,
+# at several catalog sizes
+# Genius is replaced by a stand-in that sleeps --genius-seconds per artist and returns tracks whose lyrics
+# are drawn from the local catalog, so the ESA work per track is real
+# every size runs in a fresh process and a fresh shard directory
+
+
+def run_single(artists, tracks_per_artist, genius_seconds, catalog_file):
+    """
+    Time the stages for `artists` synthetic artists and print the timings as JSON.
+    """
+    import dvc_fetch_artist_lyrics as fetch
+    from dvc_generate_esa_vectors import update_vector_shards
+    from artist_shards import merge_shards, LYRICS_COLUMNS, VECTOR_COLUMNS
+
+    lyrics = pd.read_csv(catalog_file)['lyrics'].astype(str).tolist()
+
+    def top_tracks(artist_name, top_n=10, timeout=None):
+        time.sleep(genius_seconds)
+        number = int(artist_name.rsplit(" ", 1)[1])
+        return [(artist_name, f"Track {i}", lyrics[(number * tracks_per_artist + i) % len(lyrics)])
+                for i in range(min(top_n, tracks_per_artist))]
+
+    fetch.get_artist_top_tracks = top_tracks
+    work = tempfile.mkdtemp(prefix="incremental_dvc_")
+    artists_file = os.path.join(work, "artists.txt")
+    lyrics_dir, vector_dir = os.path.join(work, "lyrics"), os.path.join(work, "vectors")
+
+    def build(count):
+        with open(artists_file, "w") as f:
+            f.write("\n".join(f"Artist {i}" for i in range(count)))
+        names = fetch.read_artists(artists_file)
+        start = time.perf_counter()
+        fetched = fetch.update_lyrics_shards(artists_file, lyrics_dir, seed_file=None)["fetched"]
+        vectorized = update_vector_shards(lyrics_dir, vector_dir, os.path.join(work, "metrics.json"))["esa_vectors_generated"]
+        merge_shards(lyrics_dir, names, os.path.join(work, "data.csv"), LYRICS_COLUMNS)
+        merge_shards(vector_dir, names, os.path.join(work, "vectors.csv"), VECTOR_COLUMNS)
+        return {"seconds": time.perf_counter() - start, "fetched": fetched, "vectorized": vectorized}
+
+    try:
+        print(json.dumps({"full": build(artists), "add_one": build(artists + 1), "unchanged": build(artists + 1)}))
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+def main(sizes, tracks_per_artist, genius_seconds, catalog_file):
+    print(f"{'artists':>7} {'run':>9} {'fetched':>7} {'vectorized':>10} {'seconds':>8}")
+    for artists in sizes:
+        output = subprocess.run(
+            [sys.executable, __file__, "--single", str(artists), "--tracks-per-artist", str(tracks_per_artist),
+             "--genius-seconds", str(genius_seconds), "--catalog", catalog_file],
+            capture_output=True, text=True, check=True
+        ).stdout.strip().splitlines()[-1]
+        for run, result in json.loads(output).items():
+            print(f"{artists:>7} {run:>9} {result['fetched']:>7} {result['vectorized']:>10} {result['seconds']:>8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incremental DVC stage times for full, one-artist and empty changes.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--tracks-per-artist", type=int, default=10)
+    parser.add_argument("--genius-seconds", type=float, default=0.5, help="simulated Genius time per artist")
+    parser.add_argument("--catalog", default="scraped_artist_data.csv", help="source of the synthetic lyrics")
+    parser.add_argument("--single", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.single:
+        run_single(args.single, args.tracks_per_artist, args.genius_seconds, args.catalog)
+    else:
+        main(args.sizes, args.tracks_per_artist, args.genius_seconds, args.catalog)
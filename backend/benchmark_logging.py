@@ -0,0 +1,118 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import concurrent.futures
+
+# this script measures the pipeline overhead of logging: no logging, the previous synchronous
+# FileHandler setup, and the queued setup from log_setup (with and without rate-limited per-item messages)
+# every setting runs in a fresh process because the logging setup is process-wide
+# Genius is replaced by the lyrics in the local catalog, so only CPU work and logging are timed
+
+SETTINGS = {
+    # name: (logging setup, LOG_RATE_LIMIT_INTERVAL)
+    "off": ("off", "0"),
+    "sync": ("sync", "0"),
+    "queued": ("queued", "0"),
+    "queued+rate_limited": ("queued", "10"),
+}
+
+
+def catalog_top_tracks(catalog_file):
+    """
+    Stand-in for get_artist_top_tracks that serves the lyrics stored in the catalog.
+    """
+    import pandas as pd
+
+    catalog = pd.read_csv(catalog_file, usecols=["artist", "track", "lyrics"]).dropna()
+    by_artist = {artist: rows[["artist", "track", "lyrics"]].values.tolist() for artist, rows in catalog.groupby("artist")}
+    fallback = catalog[["artist", "track", "lyrics"]].values.tolist()
+
+    def top_tracks(artist_name, top_n=10, timeout=None):
+        return (by_artist.get(artist_name) or fallback)[:top_n]
+    return top_tracks
+
+
+def run_single(setup, data_file, catalog_file, sample_size, concurrency, repeats):
+    """
+    Run the sampled storylines through the pipeline with one logging setup and print the time per
+    storyline, the log lines the pipeline wrote (over all repeats) and the cost of one hot-path log call as JSON.
+    """
+    import logging
+    log_file = os.path.join(tempfile.mkdtemp(), "debug.log")
+    if setup == "off":
+        logging.disable(logging.CRITICAL)
+    elif setup == "sync":
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s",
+                            filename=log_file, filemode="w")
+    else:
+        from log_setup import configure_logging
+        configure_logging(filename=log_file)
+
+    import pipeline
+    from benchmark_segmenters import load_storylines
+
+    pipeline.get_artist_top_tracks = catalog_top_tracks(catalog_file)
+    texts = load_storylines(data_file, sample_size)
+    pipeline.run_soundtrack_pipeline(texts[0], segmenter="esa")     # warm-up: load the models
+
+    timings = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            list(executor.map(lambda text: pipeline.run_soundtrack_pipeline(text, segmenter="esa"), texts))
+            timings.append(time.perf_counter() - start)
+
+    # a per-item log call on its own, repeated: its cost on the request thread is below the pipeline's run-to-run noise
+    from log_setup import get_rate_limited_logger
+    per_item_logger = get_rate_limited_logger("benchmark")
+    n_calls = 20000
+    start = time.perf_counter()
+    for i in range(n_calls):
+        per_item_logger.info(f"benchmark log call {i}")
+    us_per_call = 1e6 * (time.perf_counter() - start) / n_calls
+
+    if setup == "queued":
+        from log_setup import stop_logging
+        stop_logging()
+    logging.shutdown()
+    lines = sum("benchmark log call" not in line for line in open(log_file)) if os.path.exists(log_file) else 0
+    print(json.dumps({"ms_per_storyline": 1000 * min(timings) / len(texts), "log_lines": lines,
+                      "us_per_log_call": us_per_call}))
+
+
+def main(data_file, catalog_file, sample_size, concurrency, repeats):
+    print(f"{'logging':>20} {'threads':>7} {'ms/storyline':>12} {'overhead':>8} {'log_lines':>9} {'us/log_call':>11}")
+    baseline = None
+    for threads in concurrency:
+        for name, (setup, interval) in SETTINGS.items():
+            env = dict(os.environ, LOG_RATE_LIMIT_INTERVAL=interval, TRACE_EXPORTER="none")
+            output = subprocess.run(
+                [sys.executable, __file__, "--single", setup, "--data", data_file, "--catalog", catalog_file,
+                 "--sample-size", str(sample_size), "--concurrency", str(threads), "--repeats", str(repeats)],
+                capture_output=True, text=True, check=True, env=env
+            ).stdout.strip().splitlines()[-1]
+            result = json.loads(output)
+            if name == "off":
+                baseline = result["ms_per_storyline"]
+            overhead = result["ms_per_storyline"] / baseline - 1
+            print(f"{name:>20} {threads:>7} {result['ms_per_storyline']:>12.1f} {overhead:>+8.1%} {result['log_lines']:>9} "
+                  f"{result['us_per_log_call']:>11.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pipeline overhead of logging setups.")
+    parser.add_argument("--data", default="mpst_full_data.csv")
+    parser.add_argument("--catalog", default="esa_vectors_all_lyrics.csv")
+    parser.add_argument("--sample-size", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--single", choices=["off", "sync", "queued"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.single:
+        run_single(args.single, args.data, args.catalog, args.sample_size, args.concurrency[0], args.repeats)
+    else:
+        main(args.data, args.catalog, args.sample_size, args.concurrency, args.repeats)
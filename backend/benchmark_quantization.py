@@ -0,0 +1,67 @@
+import sys
+import time
+import argparse
+import numpy as np
+from model import load_artist_esa_vectors, find_nearest_neighbors
+from quantization import QuantizedVectors, normalise_rows
+
+# this script reports memory, speed and top-k agreement of quantised artist vectors
+# against the float64 NearestNeighbors baseline on the catalog
+
+
+def python_list_bytes(vectors):
+    """
+    Approximate memory of vectors held as Python lists of floats.
+    """
+    return sum(sys.getsizeof(vector) + sum(sys.getsizeof(x) for x in vector) for vector in vectors)
+
+
+def overlap_at_k(approx, exact):
+    """
+    Mean fraction of the exact top-k present in the approximate top-k.
+    """
+    k = exact.shape[1]
+    return float(np.mean([len(set(a) & set(e)) / k for a, e in zip(approx, exact)]))
+
+
+def main(catalog_file, k=10, n_queries=500, noise=0.05, seed=5402):
+    entries = [entry for entry in load_artist_esa_vectors(catalog_file) if len(entry['esa_vector']) > 0]
+    list_vectors = [np.asarray(entry['esa_vector']).reshape(-1).tolist() for entry in entries]
+    vectors = np.array(list_vectors)
+
+    # Queries: perturbed catalog vectors, like story vectors close to some artist's lyrics
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.integers(0, len(vectors), size=n_queries)] + rng.random((n_queries, vectors.shape[1])) * noise
+
+    start = time.perf_counter()
+    baseline = np.vstack([find_nearest_neighbors(query, list_vectors, k) for query in queries])
+    baseline_ms = (time.perf_counter() - start) * 1000 / n_queries
+
+    exact_vectors = normalise_rows(vectors)
+    print(f"catalog: {len(vectors)} vectors x {vectors.shape[1]} dims, {n_queries} queries, k={k}")
+    print(f"baseline NearestNeighbors (Python lists): {python_list_bytes(list_vectors) / 1e6:.2f} MB, {baseline_ms:.3f} ms/query")
+    print(f"{'dtype':>8} {'rerank':>6} {'MB':>8} {'saved':>7} {'ms/query':>9} {'speedup':>8} {'top1':>6} {'overlap@k':>9}")
+
+    for dtype in ("float64", "float32", "float16", "int8"):
+        quantized = QuantizedVectors(vectors, dtype=dtype)
+        for rerank in (False, True):
+            if rerank and dtype == "float64":
+                continue
+            start = time.perf_counter()
+            indices, _ = quantized.top_k(queries, k=k, exact_vectors=exact_vectors if rerank else None)
+            ms = (time.perf_counter() - start) * 1000 / n_queries
+
+            megabytes = (quantized.nbytes + (exact_vectors.nbytes if rerank else 0)) / 1e6
+            saved = 1 - megabytes / (vectors.nbytes / 1e6)
+            top1 = float(np.mean(indices[:, 0] == baseline[:, 0]))
+            print(f"{dtype:>8} {str(rerank):>6} {megabytes:>8.3f} {saved:>6.0%} {ms:>9.4f} "
+                  f"{baseline_ms / ms:>7.0f}x {top1:>6.3f} {overlap_at_k(indices, baseline):>9.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Quantised artist-vector memory, speed and top-k agreement.")
+    parser.add_argument("--catalog", default="esa_vectors_all_lyrics.csv")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+    main(args.catalog, k=args.k, n_queries=args.queries)
@@ -0,0 +1,281 @@
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+# this script reports time and memory curves of the main components on synthetic data from 1k to 1M
+# (tracks in the catalog, candidate tracks or ESA concepts), to show which one breaks first as the catalog grows
+# memory is the peak RSS growth of the Python process over the timed step (for ingest, of the Spark driver only)
+# every (component, size) runs in a fresh process, stopped at a timeout or an RSS limit; a component
+# that fails at one size is not run at the larger ones
+# the datasets are written once per size by synthetic_data.py into --data-dir and reused
+
+N_STORYLINES = 20
+N_QUERIES = 100
+N_SCENES = 20
+
+# component: (what `size` counts, the unit of the per-item time)
+COMPONENTS = {
+    "recommender_load_csv": ("catalog tracks", "track"),
+    "recommender_load_parquet": ("catalog tracks", "track"),
+    "recommender_predict": ("catalog tracks", "query"),
+    "assign_dense": ("candidate tracks", "call"),
+    "assign_sparse": ("candidate tracks", "call"),
+    "esa_compile": ("concepts", "concept"),
+    "esa_vectorize": ("concepts", "storyline"),
+    "ingest": ("catalog tracks", "track"),
+}
+CATALOG_COMPONENTS = {"recommender_load_csv", "recommender_load_parquet", "recommender_predict",
+                      "assign_dense", "assign_sparse", "ingest"}
+CONCEPT_COMPONENTS = {"esa_compile", "esa_vectorize"}
+
+
+def rss_mb(field):
+    """
+    VmRSS (current) or VmHWM (peak) of this process from /proc; unlike ru_maxrss, the peak is not
+    inherited from the parent process.
+    """
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def reset_peak_rss():
+    """
+    Reset VmHWM to the current RSS (Linux 4.0+), so the peak only covers what runs next.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def dataset_dir(data_dir, size):
+    return os.path.join(data_dir, str(size))
+
+
+def prepare_dataset(data_dir, size, components):
+    """
+    Write the synthetic catalog and/or concept corpus of one size, unless already there.
+    """
+    from synthetic_data import write_synthetic_dataset
+
+    directory = dataset_dir(data_dir, size)
+    n_tracks = size if CATALOG_COMPONENTS & set(components) else None
+    n_concepts = size if CONCEPT_COMPONENTS & set(components) else None
+    if n_tracks and os.path.exists(os.path.join(directory, "catalog.parquet")):
+        n_tracks = None
+    if n_concepts and os.path.exists(os.path.join(directory, "corpus.json")):
+        n_concepts = None
+    n_storylines = None if os.path.exists(os.path.join(directory, "storylines.json")) else N_STORYLINES
+    if n_tracks or n_concepts or n_storylines:
+        start = time.perf_counter()
+        write_synthetic_dataset(directory, n_tracks=n_tracks, n_concepts=n_concepts, n_storylines=n_storylines)
+        print(f"# wrote the {size} dataset to {directory} in {time.perf_counter() - start:.0f}s", flush=True)
+
+
+def catalog_vectors(size):
+    """
+    Artist names and vectors of the synthetic catalog, straight from the generator, so the components
+    that only need vectors do not depend on a catalog loader.
+    """
+    from synthetic_data import iter_catalog_chunks
+
+    artist_names, vectors = [], []
+    for chunk in iter_catalog_chunks(size):
+        artist_names.extend(chunk["artist"])
+        vectors.append(np.stack(chunk["esa_vector"].to_numpy()))
+    return artist_names, np.concatenate(vectors)
+
+
+def run_single(component, size, data_dir):
+    """
+    Set up one component on the dataset of one size, time its operation and print the result as JSON.
+    Setup (loading the inputs) is not timed; the memory figure is the peak RSS growth over the timed step.
+    """
+    directory = dataset_dir(data_dir, size)
+    catalog_parquet = os.path.join(directory, "catalog.parquet")
+    rng = np.random.default_rng(5402)
+
+    if component == "recommender_load_csv":
+        from model import ArtistRecommender
+        operation, items = lambda: ArtistRecommender(os.path.join(directory, "catalog.csv")), size
+    elif component == "recommender_load_parquet":
+        from model import ArtistRecommender
+        operation, items = lambda: ArtistRecommender(catalog_parquet), size
+    elif component == "recommender_predict":
+        from model import ArtistRecommender
+        artist_names, vectors = catalog_vectors(size)
+        recommender = ArtistRecommender.from_vectors(artist_names, vectors)
+        queries = rng.random((N_QUERIES, vectors.shape[1])) ** 4
+        del vectors
+        operation, items = lambda: [recommender.predict(query) for query in queries], N_QUERIES
+    elif component in ("assign_dense", "assign_sparse"):
+        from generate_soundtrack import assign_songs_to_scenes
+        _, tracks = catalog_vectors(size)
+        scenes = rng.random((N_SCENES, tracks.shape[1])) ** 4
+        mode = component.split("_")[1]
+        operation, items = lambda: assign_songs_to_scenes(scenes, tracks, mode=mode), 1
+    elif component == "esa_compile":
+        from esa_model import compile_esa_model
+        model_dir = os.path.join(directory, "esa_model")     # reused by esa_vectorize
+        operation, items = lambda: compile_esa_model(os.path.join(directory, "corpus.json"), model_dir), size
+    elif component == "esa_vectorize":
+        from esa import generate_esa_vectors_batch
+        from esa_model import compile_esa_model, load_esa_model
+        model_dir = os.path.join(directory, "esa_model")
+        if not os.path.exists(model_dir):
+            compile_esa_model(os.path.join(directory, "corpus.json"), model_dir)
+        model = load_esa_model(model_dir)
+        with open(os.path.join(directory, "storylines.json")) as f:
+            storylines = json.load(f)
+        # one storyline per call, as in the pipeline
+        operation, items = lambda: [generate_esa_vectors_batch([text], esa_model=model) for text in storylines], len(storylines)
+    elif component == "ingest":
+        from pyspark.sql import SparkSession
+        from recommender_corpus import write_catalog_partitions
+        spark = SparkSession.builder.appName("benchmark_scaling").config("spark.ui.enabled", "false").getOrCreate()
+        spark.sparkContext.setLogLevel("ERROR")
+        rows = spark.read.parquet(catalog_parquet).select("artist", "track", "lyrics").rdd.map(tuple)
+        output_dir = tempfile.mkdtemp()
+        write_catalog_partitions(spark, rows.sample(False, min(1.0, 200 / size), seed=1),
+                                 output_dir=os.path.join(output_dir, "warm_up"))
+        operation, items = lambda: write_catalog_partitions(spark, rows, output_dir=os.path.join(output_dir, "catalog")), size
+    else:
+        raise ValueError(f"Unknown component {component!r}")
+
+    reset_peak_rss()
+    rss_before = rss_mb("VmRSS")
+    start = time.perf_counter()
+    operation()
+    seconds = time.perf_counter() - start
+    peak = rss_mb("VmHWM")
+    if component == "ingest":
+        spark.stop()
+        shutil.rmtree(output_dir, ignore_errors=True)
+    print(json.dumps({"seconds": seconds, "us_per_item": 1e6 * seconds / items,
+                      "rss_growth_mb": max(0.0, peak - rss_before), "peak_rss_mb": peak}))
+
+
+def run_component(component, size, data_dir, timeout, memory_limit_mb):
+    """
+    Run one (component, size) in a subprocess; returns its result with a status of "ok", "timeout",
+    "memory" (killed when its RSS went over memory_limit_mb) or "error".
+    """
+    command = [sys.executable, __file__, "--single", component, "--sizes", str(size), "--data-dir", data_dir]
+    with tempfile.TemporaryFile("w+") as stdout, tempfile.TemporaryFile("w+") as stderr:
+        process = subprocess.Popen(command, stdout=stdout, stderr=stderr, text=True,
+                                   env=dict(os.environ, TRACE_EXPORTER="none"))
+        deadline = time.time() + timeout
+        status = None
+        while process.poll() is None:
+            # resident memory is the limit that matters; an address-space limit would also count the
+            # large virtual reservations of allocators like Arrow's
+            if child_rss_mb(process.pid) > memory_limit_mb:
+                status = "memory"
+            elif time.time() > deadline:
+                status = "timeout"
+            if status:
+                process.kill()
+                process.wait()
+                return {"status": status}
+            time.sleep(0.2)
+        stdout.seek(0)
+        stderr.seek(0)
+        if process.returncode != 0:
+            last_error = (stderr.read().strip().splitlines() or [f"exit code {process.returncode}"])[-1]
+            return {"status": "error", "error": last_error[:200]}
+        return {"status": "ok", **json.loads(stdout.read().strip().splitlines()[-1])}
+
+
+def child_rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except FileNotFoundError:
+        pass
+    return 0.0
+
+
+def growth_exponent(results, key):
+    """
+    Slope of log(key) over log(size) between the two largest completed sizes (1 = linear).
+    """
+    ok = [r for r in results if r["status"] == "ok" and r[key] > 0]
+    if len(ok) < 2:
+        return None
+    a, b = ok[-2], ok[-1]
+    return math.log(b[key] / a[key]) / math.log(b["size"] / a["size"])
+
+
+def main(sizes, components, data_dir, timeout, memory_limit_mb, output):
+    report = {"cpus": os.cpu_count(), "memory_limit_mb": memory_limit_mb, "timeout_s": timeout, "results": []}
+    print(f"{'component':>24} {'size':>8} {'status':>8} {'seconds':>9} {'us/item':>10} {'item':>9} "
+          f"{'rss_growth_MB':>13} {'peak_rss_MB':>11}", flush=True)
+    for component in components:
+        failed = None
+        for size in sizes:
+            if failed is None:
+                prepare_dataset(data_dir, size, [component])
+                result = run_component(component, size, data_dir, timeout, memory_limit_mb)
+                if result["status"] != "ok":
+                    failed = size
+            else:
+                result = {"status": "skipped"}
+            result = {"component": component, "size": size, **result}
+            report["results"].append(result)
+            if result["status"] == "ok":
+                print(f"{component:>24} {size:>8} {'ok':>8} {result['seconds']:>9.2f} {result['us_per_item']:>10.1f} "
+                      f"{COMPONENTS[component][1]:>9} {result['rss_growth_mb']:>13.0f} {result['peak_rss_mb']:>11.0f}",
+                      flush=True)
+            else:
+                print(f"{component:>24} {size:>8} {result['status']:>8}  {result.get('error', '')}", flush=True)
+
+    print("\nscaling (exponent of time and memory over size between the two largest completed sizes; 1 = linear)")
+    breaks = []
+    for component in components:
+        results = [r for r in report["results"] if r["component"] == component]
+        time_exp, memory_exp = growth_exponent(results, "seconds"), growth_exponent(results, "rss_growth_mb")
+        largest = max((r["size"] for r in results if r["status"] == "ok"), default=None)
+        failure = next((r for r in results if r["status"] not in ("ok", "skipped")), None)
+        if failure:
+            breaks.append((failure["size"], component))
+        print(f"{component:>24}  size = {COMPONENTS[component][0]:<17} largest ok = {str(largest):>8}  "
+              f"time ~ size^{'-' if time_exp is None else f'{time_exp:.2f}'}  "
+              f"memory ~ size^{'-' if memory_exp is None else f'{memory_exp:.2f}'}  "
+              f"{'breaks at ' + str(failure['size']) + ' (' + failure['status'] + ')' if failure else ''}")
+    if breaks:
+        first = min(size for size, _ in breaks)
+        print(f"\nbreaks first: {', '.join(c for size, c in breaks if size == first)} at {first}")
+    else:
+        print("\nno component broke within the limits")
+
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time and memory of the main components on synthetic data from 1k to 1M.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--components", nargs="+", choices=list(COMPONENTS), default=list(COMPONENTS))
+    parser.add_argument("--data-dir", default="synthetic_data")
+    parser.add_argument("--timeout", type=float, default=600, help="seconds per (component, size)")
+    parser.add_argument("--memory-limit-mb", type=int, default=4096, help="RSS above which a run is stopped")
+    parser.add_argument("--output", default="scaling_report.json")
+    parser.add_argument("--single", choices=list(COMPONENTS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.single:
+        run_single(args.single, args.sizes[0], args.data_dir)
+    else:
+        main(args.sizes, args.components, args.data_dir, args.timeout, args.memory_limit_mb, args.output)
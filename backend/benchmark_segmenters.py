@@ -0,0 +1,105 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import resource
+import subprocess
+
+# this script compares the scene segmentation backends (MiniLM vs ESA) on latency, memory and
+# the scene dissimilarity metric used by mlflow_process_storyline.py, optionally over a sweep of split thresholds
+# every backend (and threshold) runs in a fresh process so peak RSS and imported modules are not shared between runs
+
+
+def load_storylines(data_file, sample_size, seed=5402):
+    """
+    Sample plot synopses like mlflow_process_storyline.main, or synthetic stories if the data is missing.
+    """
+    if os.path.exists(data_file):
+        import pandas as pd
+        texts = pd.read_csv(data_file)["plot_synopsis"].dropna().tolist()
+        random.seed(seed)
+        return random.sample(texts, min(sample_size, len(texts)))
+    from benchmark_streaming_scenes import synthetic_story
+    return [synthetic_story(40, seed=seed + i) for i in range(sample_size)]
+
+
+def run_single(backend, data_file, sample_size, threshold=None, min_scene_length=2):
+    """
+    Segment the sampled storylines with one backend and print timings, memory and quality as JSON.
+    """
+    import numpy as np
+    from process_storyline import split_into_scenes, encode_sentences, resolve_segmenter, compute_average_dissimilarity
+    from esa import generate_esa_vectors
+
+    texts = load_storylines(data_file, sample_size)
+    backend, threshold = resolve_segmenter(backend, threshold)
+
+    # model load (and, for MiniLM, the torch import) happens on the first call
+    start = time.perf_counter()
+    encode_sentences(["warm up"], backend)
+    load_s = time.perf_counter() - start
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    latencies = []
+    scores = []
+    n_scenes = 0
+    for text in texts:
+        start = time.perf_counter()
+        scenes = split_into_scenes(text, threshold, min_scene_length, backend=backend)
+        latencies.append(time.perf_counter() - start)
+        n_scenes += len(scenes)
+        if len(scenes) > 1:
+            scores.append(compute_average_dissimilarity([np.array(generate_esa_vectors(scene)) for scene in scenes]))
+
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        "backend": backend,
+        "threshold": threshold,
+        "storylines": len(texts),
+        "scenes_per_storyline": n_scenes / len(texts),
+        "load_seconds": load_s,
+        "p50_ms": float(np.percentile(latencies, 50)) * 1000,
+        "p99_ms": float(np.percentile(latencies, 99)) * 1000,
+        "peak_rss_mb": peak_kb / 1024,
+        "rss_growth_mb": (peak_kb - baseline_kb) / 1024,
+        "torch_imported": "torch" in sys.modules,
+        "dissimilarity": float(np.mean(scores)) if scores else None,
+    }))
+
+
+def main(backends, data_file, sample_size, thresholds=None, min_scene_length=2):
+    print(f"{'backend':>8} {'thr':>5} {'scenes':>7} {'load_s':>7} {'p50_ms':>8} {'p99_ms':>8} {'rss_MB':>8} {'torch':>6} {'dissim':>7}")
+    for backend in backends:
+        for threshold in thresholds or [None]:
+            command = [sys.executable, __file__, "--single", backend, "--data", data_file,
+                       "--sample-size", str(sample_size), "--min-scene-length", str(min_scene_length)]
+            if threshold is not None:
+                command += ["--thresholds", str(threshold)]
+            output = subprocess.run(command, capture_output=True, text=True, check=True).stdout.strip().splitlines()[-1]
+            print_result(json.loads(output))
+
+
+def print_result(result):
+    dissimilarity = f"{result['dissimilarity']:.4f}" if result["dissimilarity"] is not None else "n/a"
+    print(f"{result['backend']:>8} {result['threshold']:>5.2f} {result['scenes_per_storyline']:>7.1f} {result['load_seconds']:>7.2f} "
+          f"{result['p50_ms']:>8.1f} {result['p99_ms']:>8.1f} {result['peak_rss_mb']:>8.0f} "
+          f"{str(result['torch_imported']):>6} {dissimilarity:>7}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency, memory and scene quality of the segmentation backends.")
+    parser.add_argument("--backends", nargs="+", default=["minilm", "esa"])
+    parser.add_argument("--data", default="mpst_full_data.csv")
+    parser.add_argument("--sample-size", type=int, default=100)
+    parser.add_argument("--thresholds", type=float, nargs="+",
+                        help="split thresholds to sweep for every backend (defaults to each backend's own)")
+    parser.add_argument("--min-scene-length", type=int, default=2)
+    parser.add_argument("--single", metavar="BACKEND", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.single:
+        run_single(args.single, args.data, args.sample_size, args.thresholds[0] if args.thresholds else None,
+                   args.min_scene_length)
+    else:
+        main(args.backends, args.data, args.sample_size, args.thresholds, args.min_scene_length)
@@ -0,0 +1,131 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import subprocess
+import numpy as np
+
+# this script measures the throughput of the Spark ESA ingestion job on a synthetic catalog for local[N]:
+# the previous job (one ESA transform per row, collect() to the driver, one CSV written with pandas) against
+# write_catalog_partitions (broadcast model, one transform per batch, Parquet written by the executors)
+# every setting runs in a fresh process because a SparkContext's master cannot be changed
+# the driver RSS is that of the Python driver, which holds the collected rows in the previous job
+
+FILLER = ["i", "you", "the", "my", "and", "we", "oh", "baby", "yeah", "love", "night", "heart", "tonight", "never"]
+
+
+def synthetic_rows(indices, vocabulary, lines=16, seed=5402):
+    """
+    Lyrics-like (artist, track, lyrics) rows: short lines mixing filler words with ESA vocabulary terms,
+    a sentence break every four lines. Each track is generated from its own seed, so the catalog is the
+    same for every setting and partitioning.
+    """
+    for i in indices:
+        rng = np.random.default_rng(seed + i)
+        words = np.where(rng.random(lines * 8) < 0.6,
+                         rng.choice(FILLER, lines * 8), rng.choice(vocabulary, lines * 8))
+        text = "\n".join(" ".join(words[n * 8:n * 8 + int(rng.integers(5, 9))]) + ("." if n % 4 == 3 else "")
+                         for n in range(lines))
+        yield (f"Artist {i % 5000}", f"Track {i}", text)
+
+
+def legacy_partition(partition):
+    """
+    The previous executor function: generate_esa_vectors per row, with the vector as a nested list.
+    """
+    from esa import generate_esa_vectors
+    from esa_model import get_esa_version
+
+    esa_version = get_esa_version()
+    for artist, track, lyrics in partition:
+        esa_vector = generate_esa_vectors(lyrics)
+        if esa_vector:
+            yield (artist, track, lyrics, np.array(esa_vector).reshape(1, -1).tolist(), esa_version)
+
+
+def directory_mb(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path) / 2 ** 20
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files) / 2 ** 20
+
+
+def run_single(implementation, tracks, cores, batch_size):
+    """
+    Ingest `tracks` synthetic tracks on local[cores] and print the time, output size and driver peak RSS as JSON.
+    """
+    import pandas as pd
+    from pyspark.sql import SparkSession
+    from esa_model import get_esa_model
+    from recommender_corpus import write_catalog_partitions
+
+    spark = (SparkSession.builder.master(f"local[{cores}]").appName("benchmark_spark_ingest")
+             .config("spark.ui.enabled", "false").getOrCreate())
+    spark.sparkContext.setLogLevel("ERROR")
+    sc = spark.sparkContext
+    vocabulary = sc.broadcast(get_esa_model().vocabulary)
+
+    def ingest(rows, output_dir):
+        if implementation == "legacy":
+            output = os.path.join(output_dir, "esa_vectors_all_lyrics.csv")
+            esa_vectors = rows.mapPartitions(legacy_partition).collect()
+            esa_df = pd.DataFrame(esa_vectors, columns=['artist', 'track', 'lyrics', 'esa_vector', 'esa_version'])
+            esa_df.to_csv(output, index=False, mode='w', header=True)
+            return output, len(esa_df)
+        output = os.path.join(output_dir, "esa_vectors_all_lyrics.parquet")
+        return output, write_catalog_partitions(spark, rows, output_dir=output, batch_size=batch_size)["vectorised"]
+
+    # the input is generated and cached up front, and a small warm-up run starts the Python workers
+    # and the JVM code paths, so only the ingestion itself is timed
+    rows = sc.range(0, tracks, numSlices=cores * 2).mapPartitions(lambda indices: synthetic_rows(indices, vocabulary.value))
+    rows = rows.cache()
+    rows.count()
+    warm_up_dir = tempfile.mkdtemp()
+    ingest(sc.parallelize(rows.take(max(cores * 2, 200)), numSlices=cores * 2), warm_up_dir)
+    shutil.rmtree(warm_up_dir, ignore_errors=True)
+
+    output_dir = tempfile.mkdtemp()
+    start = time.perf_counter()
+    output, vectorised = ingest(rows, output_dir)
+    seconds = time.perf_counter() - start
+    spark.stop()
+
+    result = {"seconds": seconds, "vectorised": vectorised, "output_mb": directory_mb(output),
+              "driver_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+    shutil.rmtree(output_dir, ignore_errors=True)
+    print(json.dumps(result))
+
+
+def main(tracks, legacy_tracks, cores, batch_size):
+    print(f"{'implementation':>14} {'cores':>5} {'tracks':>7} {'seconds':>8} {'tracks/s':>9} {'speedup':>7} "
+          f"{'output_MB':>9} {'driver_rss_MB':>13}")
+    for n_cores in cores:
+        legacy_rate = None
+        for implementation, n_tracks in [("legacy", legacy_tracks), ("partitions", tracks)]:
+            output = subprocess.run(
+                [sys.executable, __file__, "--single", implementation, "--tracks", str(n_tracks),
+                 "--cores", str(n_cores), "--batch-size", str(batch_size)],
+                capture_output=True, text=True, check=True, env=dict(os.environ, TRACE_EXPORTER="none")
+            ).stdout.strip().splitlines()[-1]
+            result = json.loads(output)
+            rate = result["vectorised"] / result["seconds"]
+            legacy_rate = legacy_rate or rate
+            print(f"{implementation:>14} {n_cores:>5} {n_tracks:>7} {result['seconds']:>8.1f} {rate:>9.0f} "
+                  f"{rate / legacy_rate:>6.1f}x {result['output_mb']:>9.1f} {result['driver_rss_mb']:>13.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput of the Spark ESA ingestion job on a synthetic catalog.")
+    parser.add_argument("--tracks", type=int, default=100_000)
+    parser.add_argument("--legacy-tracks", type=int, default=None, help="tracks for the previous job (default: --tracks)")
+    parser.add_argument("--cores", type=int, nargs="+", default=[1, 2, 4], help="N of local[N]")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--single", choices=["legacy", "partitions"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.single:
+        run_single(args.single, args.tracks, args.cores[0], args.batch_size)
+    else:
+        main(args.tracks, args.legacy_tracks or args.tracks, args.cores, args.batch_size)
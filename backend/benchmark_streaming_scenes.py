@@ -0,0 +1,85 @@
+import sys
+import json
+import time
+import random
+import argparse
+import resource
+import subprocess
+
+# this script benchmarks whole-text vs streaming scene segmentation on book-length input
+# every measurement runs in a fresh process so peak RSS is not shared between runs
+
+WORDS = ("the night city train river letter mother soldier storm house road song fire winter "
+         "money door secret friend war garden doctor child ship morning voice").split()
+
+
+def synthetic_story(n_sentences, seed=5402):
+    """
+    Deterministic story-like text with `n_sentences` sentences.
+    """
+    rng = random.Random(seed)
+    sentences = []
+    for _ in range(n_sentences):
+        words = rng.choices(WORDS, k=rng.randint(6, 18))
+        sentences.append(" ".join(words).capitalize() + ".")
+    return " ".join(sentences)
+
+
+def run_single(mode, n_sentences):
+    """
+    Segment one synthetic story and print time and peak RSS as JSON.
+    """
+    from process_storyline import split_into_scenes, iter_scenes, get_sentence_model
+
+    get_sentence_model().encode(["warm up"])
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    text = synthetic_story(n_sentences)
+
+    start = time.perf_counter()
+    first_scene_s = None
+    n_scenes = 0
+    if mode == "stream":
+        for _ in iter_scenes(text):
+            if first_scene_s is None:
+                first_scene_s = time.perf_counter() - start
+            n_scenes += 1
+    else:
+        n_scenes = len(split_into_scenes(text))
+        first_scene_s = time.perf_counter() - start
+    elapsed = time.perf_counter() - start
+
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        "mode": mode,
+        "sentences": n_sentences,
+        "scenes": n_scenes,
+        "seconds": elapsed,
+        "sentences_per_second": n_sentences / elapsed,
+        "first_scene_seconds": first_scene_s,
+        "peak_rss_growth_mb": (peak_kb - baseline_kb) / 1024,
+    }))
+
+
+def main(sizes, modes):
+    print(f"{'mode':>6} {'sentences':>9} {'sent/s':>8} {'first_s':>8} {'rss_MB':>8}")
+    for n_sentences in sizes:
+        for mode in modes:
+            output = subprocess.run(
+                [sys.executable, __file__, "--single", mode, str(n_sentences)],
+                capture_output=True, text=True, check=True
+            ).stdout.strip().splitlines()[-1]
+            result = json.loads(output)
+            print(f"{mode:>6} {n_sentences:>9} {result['sentences_per_second']:>8.0f} "
+                  f"{result['first_scene_seconds']:>8.2f} {result['peak_rss_growth_mb']:>8.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput and peak memory of scene segmentation.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--modes", nargs="+", default=["whole", "stream"])
+    parser.add_argument("--single", nargs=2, metavar=("MODE", "SENTENCES"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.single:
+        run_single(args.single[0], int(args.single[1]))
+    else:
+        main(args.sizes, args.modes)
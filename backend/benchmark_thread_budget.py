@@ -0,0 +1,114 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import concurrent.futures
+import numpy as np
+
+# this script measures requests per second and latency percentiles of the soundtrack pipeline under
+# concurrent load for different splits of one core budget: C pipelines admitted at once x T threads each
+# (torch intra-op, BLAS and OpenMP), against the unmanaged setup where every client's request runs at once
+# and the native pools keep their default of one thread per core
+# every split runs in a fresh process because the native thread pool sizes are process-wide
+# the client threads stand in for Starlette's request threadpool; Genius is replaced by the lyrics
+# in the local catalog, so only CPU work is timed
+
+
+def budget_splits(cores):
+    """
+    (pipelines, threads per pipeline) pairs using the whole budget: cores x 1, ..., 1 x cores.
+    """
+    threads = sorted({2 ** i for i in range(int(np.log2(cores)) + 1)} | {cores})
+    return [(cores // t, t) for t in threads]
+
+
+def run_single(setting, data_file, catalog_file, sample_size, clients, repeats, segmenter):
+    """
+    Run the sampled storylines `repeats` times from `clients` concurrent client threads and print
+    the throughput, latency percentiles and native thread pool sizes as JSON.
+    """
+    import pipeline
+    from admission import AdmissionController
+    from thread_budget import apply_thread_budget, PIPELINE_CONCURRENCY, PIPELINE_THREADS
+    from benchmark_segmenters import load_storylines
+    from benchmark_logging import catalog_top_tracks
+    from threadpoolctl import threadpool_info
+
+    pipeline.get_artist_top_tracks = catalog_top_tracks(catalog_file)
+    texts = load_storylines(data_file, sample_size)
+    pipeline.run_soundtrack_pipeline(texts[0], segmenter=segmenter)     # warm-up: load the models
+
+    if setting == "unmanaged":
+        controller = AdmissionController(max_concurrent=clients, max_queue=clients, queue_timeout=3600)
+    else:
+        apply_thread_budget()
+        controller = AdmissionController(max_concurrent=PIPELINE_CONCURRENCY, max_queue=clients, queue_timeout=3600)
+
+    def request(text):
+        start = time.perf_counter()
+        with controller.admit():
+            pipeline.run_soundtrack_pipeline(text, segmenter=segmenter)
+        return time.perf_counter() - start
+
+    work = texts * repeats
+    with concurrent.futures.ThreadPoolExecutor(max_workers=clients) as executor:
+        start = time.perf_counter()
+        latencies = list(executor.map(request, work))
+        seconds = time.perf_counter() - start
+
+    native_threads = {pool["internal_api"]: pool["num_threads"] for pool in threadpool_info()}
+    if "torch" in sys.modules:
+        import torch
+        native_threads["torch"] = torch.get_num_threads()
+    print(json.dumps({
+        "requests_per_second": len(work) / seconds,
+        "p50_ms": 1000 * float(np.percentile(latencies, 50)),
+        "p99_ms": 1000 * float(np.percentile(latencies, 99)),
+        "pipelines": controller.max_concurrent,
+        "threads": native_threads if setting == "unmanaged" else PIPELINE_THREADS,
+    }))
+
+
+def main(data_file, catalog_file, sample_size, clients, repeats, cores, segmenter):
+    print(f"{'setting':>10} {'pipelines':>9} {'threads':>7} {'req/s':>7} {'p50_ms':>8} {'p99_ms':>8}")
+    settings = [("unmanaged", None, None)] + [(f"{c}x{t}", c, t) for c, t in budget_splits(cores)]
+    for name, pipelines, threads in settings:
+        # unmanaged keeps the libraries' own default of one thread per core in every pool
+        pool_threads = str(cores if name == "unmanaged" else threads)
+        env = dict(os.environ, TRACE_EXPORTER="none", MINILM_THREADS=pool_threads)
+        env.update({variable: pool_threads for variable in
+                    ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "RAYON_NUM_THREADS")})
+        if name != "unmanaged":
+            env.update(THREAD_BUDGET_CORES=str(cores), PIPELINE_THREADS=pool_threads,
+                       ADMISSION_MAX_CONCURRENT=str(pipelines))
+        output = subprocess.run(
+            [sys.executable, __file__, "--single", "unmanaged" if name == "unmanaged" else "budget",
+             "--data", data_file, "--catalog", catalog_file, "--sample-size", str(sample_size),
+             "--clients", str(clients), "--repeats", str(repeats), "--segmenter", segmenter],
+            capture_output=True, text=True, check=True, env=env
+        ).stdout.strip().splitlines()[-1]
+        result = json.loads(output)
+        threads = result["threads"] if name != "unmanaged" else max(result["threads"].values(), default=1)
+        print(f"{name:>10} {result['pipelines']:>9} {threads:>7} {result['requests_per_second']:>7.2f} "
+              f"{result['p50_ms']:>8.0f} {result['p99_ms']:>8.0f}")
+
+
+if __name__ == "__main__":
+    from thread_budget import available_cores
+
+    parser = argparse.ArgumentParser(description="Pipeline throughput and latency for splits of one core budget.")
+    parser.add_argument("--data", default="mpst_full_data.csv")
+    parser.add_argument("--catalog", default="esa_vectors_all_lyrics.csv")
+    parser.add_argument("--sample-size", type=int, default=40)
+    parser.add_argument("--clients", type=int, default=8, help="concurrent requests")
+    parser.add_argument("--repeats", type=int, default=2)
+    parser.add_argument("--cores", type=int, default=available_cores(), help="core budget to split")
+    parser.add_argument("--segmenter", choices=["minilm", "esa"], default="minilm")
+    parser.add_argument("--single", choices=["unmanaged", "budget"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.single:
+        run_single(args.single, args.data, args.catalog, args.sample_size, args.clients, args.repeats, args.segmenter)
+    else:
+        main(args.data, args.catalog, args.sample_size, args.clients, args.repeats, args.cores, args.segmenter)
@@ -0,0 +1,58 @@
+import time
+import argparse
+import numpy as np
+from track_index import TrackIndex
+
+# this script measures recall@k against latency for the IVF track index vs exact search
+
+
+def clustered_vectors(rng, n, dim, n_topics=200):
+    """
+    Synthetic ESA-like vectors: non-negative mixtures around a set of topic centres.
+    """
+    centres = rng.random((n_topics, dim)) ** 4
+    labels = rng.integers(0, n_topics, size=n)
+    noise = rng.random((n, dim)).astype(np.float32) * 0.3
+    return (centres[labels] + noise).astype(np.float32)
+
+
+def recall_at_k(approx, exact):
+    """
+    Mean fraction of the exact top-k found by the approximate search.
+    """
+    k = exact.shape[1]
+    return float(np.mean([len(set(a) & set(e)) / k for a, e in zip(approx, exact)]))
+
+
+def main(sizes, nprobes, k=10, n_queries=200, dim=75, seed=5402):
+    rng = np.random.default_rng(seed)
+    print(f"{'n':>8} {'nprobe':>6} {'rerank':>6} {'recall@k':>8} {'ms/query':>9} {'exact_ms':>9}")
+
+    for n in sizes:
+        vectors = clustered_vectors(rng, n, dim)
+        queries = clustered_vectors(rng, n_queries, dim)
+
+        start = time.perf_counter()
+        index = TrackIndex.train(vectors)
+        index.add(vectors, [(str(i), "") for i in range(n)])
+        print(f"# n={n}: built {index.n_lists} lists in {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        exact, _ = index.exact_search(queries, k=k)
+        exact_ms = (time.perf_counter() - start) * 1000 / n_queries
+
+        for nprobe in nprobes:
+            for rerank in (False, True):
+                start = time.perf_counter()
+                approx, _ = index.search(queries, k=k, nprobe=nprobe, rerank=rerank)
+                ms = (time.perf_counter() - start) * 1000 / n_queries
+                print(f"{n:>8} {nprobe:>6} {str(rerank):>6} {recall_at_k(approx, exact):>8.3f} {ms:>9.3f} {exact_ms:>9.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall@k vs latency of the IVF track index.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+    main(args.sizes, args.nprobe, k=args.k)
@@ -0,0 +1,121 @@
+import os
+import sys
+import time
+import json
+import signal
+import argparse
+import subprocess
+import concurrent.futures
+import numpy as np
+import requests
+
+# this script measures requests per second and memory of the gunicorn multi-worker mode for 1..N workers
+# it starts `gunicorn -c gunicorn.conf.py routes:app` once per worker count on the same host
+
+STORYLINE = ("A young racer is stranded in a desert town after a crash on the highway. "
+             "He is forced to repair the road he destroyed and slowly befriends the locals. "
+             "An old judge turns out to be a legendary champion who lost everything in a crash. "
+             "At the final race the young racer gives up his victory to help a rival finish. "
+             "He returns to the small town and makes it his home.")
+
+
+def process_tree(pid):
+    """
+    The pid and all of its descendants (Linux /proc).
+    """
+    pids = [pid]
+    for task in os.listdir(f"/proc/{pid}/task"):
+        try:
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                for child in f.read().split():
+                    pids.extend(process_tree(int(child)))
+        except FileNotFoundError:
+            pass
+    return pids
+
+
+def memory_mb(pid):
+    """
+    Total RSS and PSS (proportional set size, shared pages split between sharers) of a process tree.
+    """
+    rss = pss = 0
+    for p in process_tree(pid):
+        try:
+            with open(f"/proc/{p}/smaps_rollup") as f:
+                for line in f:
+                    if line.startswith("Rss:"):
+                        rss += int(line.split()[1])
+                    elif line.startswith("Pss:"):
+                        pss += int(line.split()[1])
+        except FileNotFoundError:
+            pass
+    return rss / 1024, pss / 1024
+
+
+def wait_until_ready(url, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(url, timeout=2).ok:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(1)
+    raise TimeoutError(f"server at {url} did not become ready")
+
+
+def load_test(url, payload, concurrency, duration):
+    """
+    Closed-loop load: `concurrency` clients send requests back to back for `duration` seconds.
+    """
+    latencies, errors = [], 0
+    stop_at = time.time() + duration
+
+    def client():
+        nonlocal errors
+        session = requests.Session()
+        while time.time() < stop_at:
+            start = time.perf_counter()
+            response = session.post(url, json=payload, timeout=300)
+            if response.ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    start = time.time()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(lambda _: client(), range(concurrency)))
+    elapsed = time.time() - start
+    return len(latencies) / elapsed, latencies, errors
+
+
+def main(worker_counts, concurrency, duration, port, artist):
+    payload = {"storyline": STORYLINE, "artist": artist}
+    base = f"http://127.0.0.1:{port}"
+    print(f"{'workers':>7} {'rps':>7} {'p50_s':>7} {'p99_s':>7} {'errors':>6} {'rss_MB':>8} {'pss_MB':>8}")
+
+    for workers in worker_counts:
+        env = dict(os.environ, WEB_CONCURRENCY=str(workers), BIND=f"127.0.0.1:{port}")
+        server = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "routes:app"], env=env)
+        try:
+            wait_until_ready(base + "/", timeout=300)
+            load_test(base + "/generate_soundtrack", payload, workers, 5)   # warm every worker
+            rps, latencies, errors = load_test(base + "/generate_soundtrack", payload, concurrency or 2 * workers, duration)
+            rss, pss = memory_mb(server.pid)
+            p50, p99 = (np.percentile(latencies, [50, 99]) if latencies else (float("nan"), float("nan")))
+            print(f"{workers:>7} {rps:>7.2f} {p50:>7.2f} {p99:>7.2f} {errors:>6} {rss:>8.0f} {pss:>8.0f}")
+            print(json.dumps({"workers": workers, "rps": rps, "p50": p50, "p99": p99, "rss_mb": rss, "pss_mb": pss}), file=sys.stderr)
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=60)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Requests per second and memory for 1..N gunicorn workers.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--concurrency", type=int, default=None, help="clients (defaults to 2 per worker)")
+    parser.add_argument("--duration", type=int, default=60)
+    parser.add_argument("--port", type=int, default=12100)
+    parser.add_argument("--artist", default="Dua Lipa")
+    args = parser.parse_args()
+    main(args.workers, args.concurrency, args.duration, args.port, args.artist)
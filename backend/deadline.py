@@ -0,0 +1,77 @@
+import os
+import math
+import time
+import logging
+from prometheus_client import Counter
+from opentelemetry import trace
+
+logger = logging.getLogger(__name__)
+
+# Budget a live Genius fetch needs; with less left, cached or catalog track vectors are used instead
+DEADLINE_GENIUS_MIN_MS = float(os.getenv("DEADLINE_GENIUS_MIN_MS", "2000"))
+# Time kept back from the Genius fetch for track vectorisation and song assignment
+DEADLINE_RESERVE_MS = float(os.getenv("DEADLINE_RESERVE_MS", "250"))
+# Estimated cost of one scene (its Genius fetch and ESA work), used to cap the number of scenes
+DEADLINE_MS_PER_SCENE = float(os.getenv("DEADLINE_MS_PER_SCENE", "250"))
+
+pipeline_degradations = Counter('pipeline_degradations', 'Degradations applied to meet request deadlines', ['degradation'])
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised when a request ran out of budget before it had anything to degrade to.
+    """
+
+
+class Deadline:
+    """
+    Latency budget of one pipeline run, and the degradations applied to stay within it.
+
+    Without a budget (`deadline_ms` None) the remaining time is infinite and nothing is degraded.
+    """
+
+    def __init__(self, deadline_ms=None, started_at=None):
+        """
+        Parameters:
+        -----------
+        deadline_ms : float, optional
+            Budget in milliseconds.
+        started_at : float, optional
+            time.monotonic() at which the budget started (defaults to now).
+        """
+        self.deadline_ms = deadline_ms
+        self.started_at = time.monotonic() if started_at is None else started_at
+        self.expires_at = math.inf if deadline_ms is None else self.started_at + deadline_ms / 1000
+        self.degradations = []
+
+    @property
+    def bounded(self):
+        return self.deadline_ms is not None
+
+    def remaining_ms(self):
+        return (self.expires_at - time.monotonic()) * 1000
+
+    def timeout(self, reserve_ms=0):
+        """
+        Seconds a blocking call may take while leaving `reserve_ms` for later stages (None without a budget).
+        """
+        if not self.bounded:
+            return None
+        return max(0.0, (self.remaining_ms() - reserve_ms) / 1000)
+
+    def scene_cap(self):
+        """
+        Most scenes the remaining budget can soundtrack (None without a budget).
+        """
+        if not self.bounded:
+            return None
+        return max(1, int(self.remaining_ms() // DEADLINE_MS_PER_SCENE))
+
+    def degrade(self, name, detail):
+        """
+        Record a degradation: in the response, as a metric and as an event on the current span.
+        """
+        self.degradations.append({"degradation": name, "detail": detail})
+        pipeline_degradations.labels(degradation=name).inc()
+        trace.get_current_span().add_event("degradation", {"degradation": name, "detail": detail})
+        logger.info(f"Degraded ({name}) with {self.remaining_ms():.0f} ms left: {detail}")
@@ -0,0 +1,13 @@
+# compile_esa_model.py
+
+import logging
+from esa_model import compile_esa_model
+
+# Configure logging to display timestamps and log levels
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+if __name__ == "__main__":
+    # Compile the lemmatised corpus into the versioned, memory-mappable ESA model artifact
+    version = compile_esa_model('corpus/lemmatized_corpus.json', 'esa_model')
+    logging.info(f"ESA model version: {version}")
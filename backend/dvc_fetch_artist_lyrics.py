@@ -1,50 +1,122 @@
 # fetch_artist_lyrics.py
+# Incremental: every artist's tracks and lyrics are kept in a shard under artist_shards/lyrics, and only
+# artists new to scraped_artists.txt are fetched from Genius; artists that left the list are dropped.
 
+import os
+import time
+import argparse
 import pandas as pd
 import logging
 from genius_handler import get_artist_top_tracks
+from artist_shards import LYRICS_SHARD_DIR, LYRICS_COLUMNS, read_manifest, write_manifest, write_shard
 
+# Tracks fetched per artist; changing it re-fetches every artist
+FETCH_TOP_N = int(os.getenv("FETCH_TOP_N", "10"))
 
-def generate_artists_corpus(artists_file):
+
+def read_artists(artists_file):
+    """
+    Artist names from a text file, one per line, without blanks or duplicates, in file order.
     """
-    Generates a DataFrame containing the top tracks and lyrics for a list of artists.
+    with open(artists_file, 'r') as f:
+        return list(dict.fromkeys(line.strip() for line in f.read().splitlines() if line.strip()))
+
+
+def seed_lyrics_shards(combined_file, artists, shard_dir=LYRICS_SHARD_DIR, top_n=FETCH_TOP_N):
+    """
+    Split the combined CSV written by the previous, non-incremental stage into shards, so switching
+    to shards does not re-fetch the whole catalog.
+
+    Parameters:
+    -----------
+    combined_file : str
+        CSV with 'artist', 'track' and 'lyrics' columns.
+    artists : list of str
+        Artists to keep.
+    shard_dir : str
+        Directory for the lyrics shards.
+    top_n : int
+        Tracks per artist the CSV was fetched with.
+
+    Returns:
+    --------
+    dict
+        Manifest entries of the seeded artists.
+    """
+    df = pd.read_csv(combined_file)
+    wanted = set(artists)
+    manifest = {}
+    for artist, rows in df.groupby('artist', sort=False):
+        if artist in wanted:
+            manifest[artist] = {"shard": write_shard(shard_dir, artist, rows[LYRICS_COLUMNS]),
+                                "tracks": len(rows), "top_n": top_n, "fetched_at": os.path.getmtime(combined_file)}
+    logging.info(f"Seeded {len(manifest)} lyrics shard(s) from {combined_file}.")
+    return manifest
+
+
+def update_lyrics_shards(artists_file, shard_dir=LYRICS_SHARD_DIR, top_n=FETCH_TOP_N, retry_empty=False,
+                         seed_file='scraped_artist_data.csv'):
+    """
+    Bring the lyrics shards in line with the artist list: fetch the top tracks and lyrics of artists
+    without a shard (or fetched with another top_n) and drop artists no longer listed.
 
     Parameters:
     -----------
     artists_file : str
         Path to a text file containing artist names, one per line.
+    shard_dir : str
+        Directory of the lyrics shards and their manifest.
+    top_n : int
+        Number of top tracks to fetch per artist.
+    retry_empty : bool
+        Fetch artists again for whom Genius returned no tracks last time.
+    seed_file : str
+        Combined CSV to seed the shards from when there is no manifest yet.
 
     Returns:
     --------
-    pd.DataFrame
-        A DataFrame with columns: 'artist', 'track', and 'lyrics' for the top tracks of each artist.
+    dict
+        Counts of listed, fetched, reused and removed artists.
     """
-    collected_df = pd.DataFrame(columns=['artist', 'track', 'lyrics'])
+    artists = read_artists(artists_file)
+    manifest = read_manifest(shard_dir)
+    if not manifest and seed_file and os.path.exists(seed_file):
+        manifest = seed_lyrics_shards(seed_file, artists, shard_dir, top_n)
 
-    # Read artist names from the file
-    with open(artists_file, 'r') as f:
-        artists = f.read().splitlines()
+    entries = {
+        artist: manifest[artist] for artist in artists
+        if artist in manifest and manifest[artist]["top_n"] == top_n and (manifest[artist]["tracks"] or not retry_empty)
+    }
+    pending = [artist for artist in artists if artist not in entries]
+    report = {"artists": len(artists), "fetched": 0, "reused": len(entries),
+              "removed": len(set(manifest) - set(artists))}
+    logging.info(f"{len(pending)} of {len(artists)} artist(s) to fetch.")
 
-    # For each artist, fetch their top tracks and lyrics
-    for artist in artists:
+    for artist in pending:
         try:
-            top_tracks = get_artist_top_tracks(artist_name=artist, top_n=10)
+            top_tracks = get_artist_top_tracks(artist_name=artist, top_n=top_n)
+            entry = {"tracks": len(top_tracks), "top_n": top_n, "fetched_at": time.time()}
             if top_tracks:
-                for track in top_tracks:
-                    # Append each track's details to the main DataFrame
-                    collected_df = pd.concat(
-                        [collected_df, pd.DataFrame([track], columns=['artist', 'track', 'lyrics'])],
-                        ignore_index=True
-                    )
+                entry["shard"] = write_shard(shard_dir, artist, pd.DataFrame(top_tracks, columns=LYRICS_COLUMNS))
             else:
                 logging.warning(f"No top tracks found for {artist}")
+            entries[artist] = entry
+            report["fetched"] += 1
+            # recorded after every artist, so an interrupted run resumes with the next one
+            write_manifest(shard_dir, entries)
         except Exception as e:
+            # not recorded: the artist is fetched again on the next run
             logging.error(f"Error occurred while processing artist '{artist}': {e}", exc_info=True)
 
-    return collected_df
+    write_manifest(shard_dir, entries)
+    logging.info(f"Lyrics shards: {report}")
+    return report
 
 
 if __name__ == "__main__":
-    # Run the corpus generation and save the results to a CSV
-    df = generate_artists_corpus('scraped_artists.txt')
-    df.to_csv('scraped_artist_data.csv', index=False)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Fetch the lyrics of new artists into per-artist shards.")
+    parser.add_argument("--artists", default="scraped_artists.txt")
+    parser.add_argument("--retry-empty", action="store_true", help="re-fetch artists that had no tracks")
+    args = parser.parse_args()
+    update_lyrics_shards(args.artists, retry_empty=args.retry_empty)
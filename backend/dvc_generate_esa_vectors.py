@@ -1,14 +1,17 @@
 # generate_esa_vectors.py
+# Incremental: vectors are kept per artist under artist_shards/vectors; only artists whose lyrics shard or
+# the ESA model version changed are revisited, and within them only tracks with new lyrics are vectorized.
 
+import os
 import pandas as pd
 import numpy as np
 import multiprocessing
 import logging
 from esa import generate_esa_vectors
+from esa_model import get_esa_model, get_esa_version
 import json
-
-# Set up logging configuration to capture timestamps, log level, and messages
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+import argparse
+from artist_shards import LYRICS_SHARD_DIR, VECTOR_SHARD_DIR, VECTOR_COLUMNS, read_manifest, write_manifest, write_shard, read_shard, file_hash
 
 
 def process_row(row):
@@ -22,45 +25,149 @@ def process_row(row):
 
     Returns:
     --------
-    tuple or None
-        A tuple of (artist, track, lyrics, esa_vector) if successful, else None.
+    tuple, None or False
+        A tuple of (artist, track, lyrics, esa_vector, esa_version) if successful, None if the lyrics
+        yield no ESA vector, False if the ESA transform failed.
     """
     artist, track, lyrics = row
     try:
         esa_vector = generate_esa_vectors(lyrics)
         if esa_vector:
             # Convert the ESA vector to a 2D list format for saving
-            return artist, track, lyrics, np.array(esa_vector).reshape(1, -1).tolist()
+            return artist, track, lyrics, np.array(esa_vector).reshape(1, -1).tolist(), get_esa_version()
     except Exception as e:
         logging.error(f"ESA error for {artist} - {track}: {e}", exc_info=True)
+        return False
     return None
 
 
-if __name__ == "__main__":
-    # Load the scraped artist track and lyrics data
-    df = pd.read_csv('scraped_artist_data.csv')
+def init_worker():
+    """
+    Pool initialiser: map the compiled ESA model once per worker process.
+    """
+    get_esa_model()
+
+
+def reusable_vectors(vector_dir, entry, esa_version):
+    """
+    Vectors of an artist's previous shard that are still valid, keyed by (track, lyrics).
+
+    Parameters:
+    -----------
+    vector_dir : str
+        Directory of the vector shards.
+    entry : dict or None
+        The artist's previous manifest entry.
+    esa_version : str
+        The current ESA model version; vectors from other versions are not reused.
+
+    Returns:
+    --------
+    dict
+        (track, lyrics) -> row tuple as returned by process_row.
+    """
+    if not entry or entry.get("esa_version") != esa_version:
+        return {}
+    old = read_shard(vector_dir, entry)
+    return {(str(row.track), str(row.lyrics)): (row.artist, row.track, row.lyrics, row.esa_vector, esa_version)
+            for row in old.itertuples(index=False)}
 
-    # Prepare a list of (artist, track, lyrics) tuples
-    rows = list(zip(df['artist'], df['track'], df['lyrics'].astype(str)))
 
-    # Use multiprocessing to speed up ESA vector generation
-    with multiprocessing.Pool(processes=multiprocessing.cpu_count()) as pool:
-        esa_vectors = pool.map(process_row, rows)
+def update_vector_shards(lyrics_dir=LYRICS_SHARD_DIR, vector_dir=VECTOR_SHARD_DIR, metrics_file='metrics.json'):
+    """
+    Bring the vector shards in line with the lyrics shards and the ESA model version.
 
-    # Filter out rows that failed to generate ESA vectors
-    esa_vectors = [vec for vec in esa_vectors if vec is not None]
+    Parameters:
+    -----------
+    lyrics_dir : str
+        Directory of the lyrics shards written by the fetch stage.
+    vector_dir : str
+        Directory of the vector shards and their manifest.
+    metrics_file : str
+        JSON file the stage metrics are written to.
 
-    if esa_vectors:
-        # Save ESA vectors to a CSV
-        esa_df = pd.DataFrame(esa_vectors, columns=['artist', 'track', 'lyrics', 'esa_vector'])
-        esa_df.to_csv('scraped_esa_vectors_all_lyrics.csv', index=False, mode='w', header=True)
+    Returns:
+    --------
+    dict
+        The metrics written to `metrics_file`.
+    """
+    esa_version = get_esa_version()
+    lyrics_manifest = read_manifest(lyrics_dir)
+    previous = read_manifest(vector_dir)
 
-        # Write basic metrics to a JSON file for monitoring
-        metrics = {
-            "artists_processed": len(esa_df['artist'].unique()),
-            "tracks_processed": len(esa_df),
-            "esa_vectors_generated": len(esa_vectors)
-        }
+    entries, changed = {}, []
+    for artist, lyrics_entry in lyrics_manifest.items():
+        if not lyrics_entry.get("shard"):
+            continue
+        lyrics_hash = file_hash(os.path.join(lyrics_dir, lyrics_entry["shard"]))
+        entry = previous.get(artist)
+        # artists with failed tracks are revisited, so only those tracks are vectorized again
+        if (entry and entry["lyrics_hash"] == lyrics_hash and entry["esa_version"] == esa_version
+                and not entry.get("failed")):
+            entries[artist] = entry
+        else:
+            changed.append((artist, lyrics_entry, lyrics_hash))
 
-        with open('metrics.json', 'w') as f:
-            json.dump(metrics, f)
+    # Collect the tracks of the changed artists that have no valid vector yet
+    results, pending, reused = {}, [], 0
+    for artist, lyrics_entry, _ in changed:
+        lyrics = read_shard(lyrics_dir, lyrics_entry)
+        known = reusable_vectors(vector_dir, previous.get(artist), esa_version)
+        rows = results[artist] = []
+        for row in zip(lyrics['artist'], lyrics['track'], lyrics['lyrics'].astype(str)):
+            key = (str(row[1]), row[2])
+            if key in known:
+                rows.append(known[key])
+                reused += 1
+            else:
+                rows.append(None)
+                pending.append((artist, len(rows) - 1, row))
+    logging.info(f"{len(changed)} of {len(lyrics_manifest)} artist(s) changed, {len(pending)} track(s) to vectorize.")
+
+    generated = []
+    if pending:
+        # Map the model before forking so the workers share its pages
+        get_esa_model()
+        # Use multiprocessing to speed up ESA vector generation
+        with multiprocessing.Pool(processes=min(multiprocessing.cpu_count(), len(pending)), initializer=init_worker) as pool:
+            generated = pool.map(process_row, [row for _, _, row in pending])
+        for (artist, position, _), vector in zip(pending, generated):
+            results[artist][position] = vector
+
+    for artist, _, lyrics_hash in changed:
+        # Filter out rows without an ESA vector; failed ones are counted so the next run retries them
+        rows = [row for row in results[artist] if row]
+        entry = {"lyrics_hash": lyrics_hash, "esa_version": esa_version, "tracks": len(rows)}
+        failed = sum(1 for row in results[artist] if row is False)
+        if failed:
+            entry["failed"] = failed
+            logging.warning(f"{failed} track(s) of {artist} failed; they are retried on the next run.")
+        if rows:
+            entry["shard"] = write_shard(vector_dir, artist, pd.DataFrame(rows, columns=VECTOR_COLUMNS))
+        entries[artist] = entry
+    write_manifest(vector_dir, entries)
+
+    # Write basic metrics to a JSON file for monitoring
+    metrics = {
+        "artists_processed": sum(1 for entry in entries.values() if entry["tracks"]),
+        "tracks_processed": sum(entry["tracks"] for entry in entries.values()),
+        "esa_vectors_generated": sum(1 for vector in generated if vector),
+        "tracks_failed": sum(1 for vector in generated if vector is False),
+        "tracks_reused": reused,
+        "artists_updated": len(changed),
+        "esa_version": esa_version
+    }
+    with open(metrics_file, 'w') as f:
+        json.dump(metrics, f)
+    logging.info(f"Vector shards: {metrics}")
+    return metrics
+
+
+if __name__ == "__main__":
+    # Set up logging configuration to capture timestamps, log level, and messages
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Generate ESA vectors for new or changed artist lyrics shards.")
+    parser.add_argument("--lyrics-dir", default=LYRICS_SHARD_DIR)
+    parser.add_argument("--vector-dir", default=VECTOR_SHARD_DIR)
+    args = parser.parse_args()
+    update_vector_shards(args.lyrics_dir, args.vector_dir)
@@ -0,0 +1,16 @@
+# merge_artist_shards.py
+# Writes the combined CSVs the rest of the repo reads (scraped_artist_data.csv and
+# scraped_esa_vectors_all_lyrics.csv) from the per-artist shards, in the order of scraped_artists.txt.
+
+import logging
+from artist_shards import LYRICS_SHARD_DIR, VECTOR_SHARD_DIR, LYRICS_COLUMNS, VECTOR_COLUMNS, merge_shards
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    with open('scraped_artists.txt', 'r') as f:
+        artists = list(dict.fromkeys(line.strip() for line in f.read().splitlines() if line.strip()))
+    merged = merge_shards(LYRICS_SHARD_DIR, artists, 'scraped_artist_data.csv', LYRICS_COLUMNS)
+    logging.info(f"Merged {merged} lyrics shard(s) into scraped_artist_data.csv.")
+    merged = merge_shards(VECTOR_SHARD_DIR, artists, 'scraped_esa_vectors_all_lyrics.csv', VECTOR_COLUMNS)
+    logging.info(f"Merged {merged} vector shard(s) into scraped_esa_vectors_all_lyrics.csv.")
@@ -10,10 +10,13 @@ from nltk.tokenize import sent_tokenize, word_tokenize
 from sklearn.metrics.pairwise import cosine_similarity
 # from genius_handler import get_lyrics
 import wikipediaapi
+from esa_model import get_esa_model
+from tracing import tracer
+from log_setup import get_rate_limited_logger
 from nltk.corpus import stopwords
 
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s", filename="debug.log")
 logger = logging.getLogger(__name__)
+per_item_logger = get_rate_limited_logger(__name__)     # messages logged once per scene or track
 
 
 def preprocess_text(text):
@@ -127,7 +130,7 @@ def load_corpus(corpus_file="corpus/corpus.json"):
     try:
         with open(corpus_file, "r") as file:
             corpus_dict = json.load(file)
-        logger.info(f"Corpus successfully loaded from {corpus_file}.")
+        per_item_logger.info(f"Corpus successfully loaded from {corpus_file}.")
         return corpus_dict
     except Exception as e:
         logger.error(f"Failed to load corpus from {corpus_file}: {e}")
@@ -171,28 +174,48 @@ def generate_esa_vectors(text):
         list: The ESA vectors for the input text.
     '''
     
-    logger.info("Generating ESA vectors for artist.")
-    
-    corpus = load_corpus('./corpus/lemmatized_corpus.json')
+    per_item_logger.info("Generating ESA vectors.")
+
+    # Prefer the compiled, memory-mapped model; fall back to refitting on the raw corpus
+    with tracer.start_as_current_span("esa.load"):
+        esa_model = get_esa_model()
+    if esa_model is not None:
+        with tracer.start_as_current_span("esa.preprocess") as span:
+            processed_sentences = [preprocess_text(s) for s in sent_tokenize(text)]
+            span.set_attribute("esa.sentences", len(processed_sentences))
+        if not processed_sentences:
+            logger.error("No ESA vectors generated.")
+            return []
+        return esa_model.transform(processed_sentences).mean(axis=0).tolist()
+
+    # the refit gives vectors that do not match the compiled model's (see esa_model.compile_esa_model)
+    per_item_logger.warning("No compiled ESA model; refitting TF-IDF on the raw corpus. "
+                            "These vectors differ from the compiled model's; run dvc_compile_esa_model.py.")
+    with tracer.start_as_current_span("esa.load"):
+        corpus = load_corpus('./corpus/lemmatized_corpus.json')
     if not corpus:
         logger.error("Corpus is empty or could not be loaded.")
         return [], []
 
     # preprocessing 
-    sentences = sent_tokenize(text)
-    processed_sentences = [preprocess_text(s) for s in sentences]
+    with tracer.start_as_current_span("esa.preprocess") as span:
+        sentences = sent_tokenize(text)
+        processed_sentences = [preprocess_text(s) for s in sentences]
+        span.set_attribute("esa.sentences", len(processed_sentences))
     processed_corpus = list(corpus.values())
     all_documents = processed_sentences + processed_corpus
 
-    vectorizer = TfidfVectorizer(stop_words="english")          # Create a TF-IDF vectorizer
-    tfidf_matrix = vectorizer.fit_transform(all_documents)      # Fit and transform the documents
+    with tracer.start_as_current_span("esa.vectorize"):
+        vectorizer = TfidfVectorizer(stop_words="english")          # Create a TF-IDF vectorizer
+        tfidf_matrix = vectorizer.fit_transform(all_documents)      # Fit and transform the documents
 
     esa_vectors = []
     # Generate ESA vectors for each processed sentence
-    for i in range(len(processed_sentences)):
-        similarities = cosine_similarity(tfidf_matrix[i:i+1], tfidf_matrix[len(processed_sentences):])
-        esa_vector = similarities.flatten()
-        esa_vectors.append(esa_vector)
+    with tracer.start_as_current_span("esa.similarity"):
+        for i in range(len(processed_sentences)):
+            similarities = cosine_similarity(tfidf_matrix[i:i+1], tfidf_matrix[len(processed_sentences):])
+            esa_vector = similarities.flatten()
+            esa_vectors.append(esa_vector)
     
     if esa_vectors:         # ESA vectors are generated
         esa_vectors = np.mean(esa_vectors, axis=0)
@@ -201,6 +224,65 @@ def generate_esa_vectors(text):
         logger.error("No ESA vectors generated.")
     return []
 
+def sentence_esa_vectors(sentences):
+    '''
+    ESA vector of every sentence, preprocessing each sentence once and transforming all of them together.
+    Args:
+        sentences (list): Sentences, already split (e.g. by segment_sentences).
+    Returns:
+        np.ndarray: One ESA vector per sentence, or None if the compiled model is missing.
+    '''
+    with tracer.start_as_current_span("esa.load"):
+        esa_model = get_esa_model()
+    if esa_model is None:
+        return None
+    with tracer.start_as_current_span("esa.preprocess", attributes={"esa.sentences": len(sentences)}):
+        processed_sentences = [preprocess_text(s) for s in sentences]
+    return esa_model.transform(processed_sentences)
+
+def segment_mean_vectors(sentence_vectors, segment_starts):
+    '''
+    Mean sentence vector of each segment (e.g. scene), from prefix sums over the sentence vectors.
+    Args:
+        sentence_vectors (np.ndarray): One vector per sentence, in order.
+        segment_starts (list): Index of the first sentence of every segment.
+    Returns:
+        np.ndarray: One mean vector per segment.
+    '''
+    prefix = np.zeros((len(sentence_vectors) + 1, sentence_vectors.shape[1]))
+    np.cumsum(sentence_vectors, axis=0, out=prefix[1:])
+    starts = np.asarray(segment_starts)
+    ends = np.append(starts[1:], len(sentence_vectors))
+    return (prefix[ends] - prefix[starts]) / (ends - starts)[:, None]
+
+def generate_esa_vectors_batch(texts, esa_model=None):
+    '''
+    Generate ESA vectors for many texts with a single transform over all of their sentences.
+    Falls back to one generate_esa_vectors call per text if the compiled model is missing.
+    Args:
+        texts (list): The input texts to generate ESA vectors for.
+        esa_model (ESAModel): Model to use, e.g. a Spark broadcast value; defaults to the process's compiled model.
+    Returns:
+        list: One ESA vector (list) per input text, empty for texts without sentences.
+    '''
+    if esa_model is None:
+        with tracer.start_as_current_span("esa.load"):
+            esa_model = get_esa_model()
+    if esa_model is None:
+        return [generate_esa_vectors(text) for text in texts]
+
+    with tracer.start_as_current_span("esa.preprocess", attributes={"esa.texts": len(texts)}):
+        processed_per_text = [[preprocess_text(s) for s in sent_tokenize(text)] for text in texts]
+    sentence_vectors = esa_model.transform([s for processed in processed_per_text for s in processed])
+
+    esa_vectors = []
+    start = 0
+    for processed in processed_per_text:
+        end = start + len(processed)
+        esa_vectors.append(sentence_vectors[start:end].mean(axis=0).tolist() if end > start else [])
+        start = end
+    return esa_vectors
+
 # if __name__ == "__main__":
 #     create_and_save_corpus()
 
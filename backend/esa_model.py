@@ -0,0 +1,265 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+from sklearn.preprocessing import normalize
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+ESA_MODEL_DIR = os.getenv("ESA_MODEL_DIR", "esa_model")
+MANIFEST_FILE = "manifest.json"
+
+# Raw arrays making up the compiled model, stored one .npy file each so they can be memory-mapped
+ARRAY_DTYPES = {
+    "idf": np.float64,
+    "concept_data": np.float64,
+    "concept_indices": np.int32,
+    "concept_indptr": np.int32,
+}
+
+_loaded_models = {}
+
+
+def content_hash(topics, vocabulary, arrays):
+    """
+    Compute the version hash of a compiled ESA model.
+
+    Parameters:
+    -----------
+    topics : list of str
+        Concept (topic) names in row order.
+    vocabulary : list of str
+        Terms in column order.
+    arrays : dict of str -> np.ndarray
+        The raw model arrays.
+
+    Returns:
+    --------
+    str
+        A short hex digest identifying the model contents.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps(topics).encode("utf-8"))
+    digest.update(json.dumps(vocabulary).encode("utf-8"))
+    for name in ARRAY_DTYPES:
+        digest.update(name.encode("utf-8"))
+        digest.update(np.ascontiguousarray(arrays[name]).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def compile_esa_model(corpus_file="corpus/lemmatized_corpus.json", output_dir=ESA_MODEL_DIR):
+    """
+    Compile the lemmatised concept corpus into a versioned ESA model artifact.
+
+    The artifact is a directory holding a manifest (version, topics, vocabulary, shapes)
+    and the IDF weights and CSR concept matrix as raw .npy arrays.
+
+    IDF is fitted on the concepts alone, and sentence terms outside their vocabulary are ignored.
+    The uncompiled path in `esa.generate_esa_vectors` refits TF-IDF on the sentences plus the
+    corpus, so its vectors differ slightly (cosine about 0.99, about half the norm); catalog vectors
+    built that way carry no `esa_version` and are recomputed by revectorize_catalog.py.
+
+    Parameters:
+    -----------
+    corpus_file : str
+        Path to the lemmatised corpus JSON (topic -> text).
+    output_dir : str
+        Directory to write the artifact to. It is replaced as a whole.
+
+    Returns:
+    --------
+    str
+        The version hash of the compiled model.
+    """
+    with open(corpus_file, "r") as file:
+        corpus = json.load(file)
+
+    topics = list(corpus.keys())
+    vectorizer = TfidfVectorizer(stop_words="english")
+    concept_matrix = csr_matrix(vectorizer.fit_transform(list(corpus.values())))
+    concept_matrix.sort_indices()
+    vocabulary = vectorizer.get_feature_names_out().tolist()
+
+    arrays = {
+        "idf": vectorizer.idf_,
+        "concept_data": concept_matrix.data,
+        "concept_indices": concept_matrix.indices,
+        "concept_indptr": concept_matrix.indptr,
+    }
+    arrays = {name: np.ascontiguousarray(arrays[name], dtype=dtype) for name, dtype in ARRAY_DTYPES.items()}
+    version = content_hash(topics, vocabulary, arrays)
+
+    manifest = {
+        "version": version,
+        "corpus_file": corpus_file,
+        "topics": topics,
+        "vocabulary": vocabulary,
+        "shape": list(concept_matrix.shape),
+        "arrays": {name: {"file": f"{name}.npy", "dtype": np.dtype(dtype).name} for name, dtype in ARRAY_DTYPES.items()},
+    }
+
+    # Write into a scratch directory first so readers never see a half-written artifact
+    tmp_dir = output_dir.rstrip("/") + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_dir, f"{name}.npy"), array)
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), "w") as file:
+        json.dump(manifest, file)
+
+    old_dir = output_dir.rstrip("/") + ".old"
+    if os.path.exists(output_dir):
+        shutil.rmtree(old_dir, ignore_errors=True)
+        os.replace(output_dir, old_dir)
+    os.replace(tmp_dir, output_dir)
+    # Processes that already mapped the old arrays keep their pages after the unlink
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+    logger.info(f"Compiled ESA model {version} ({len(topics)} topics, {len(vocabulary)} terms) to {output_dir}.")
+    return version
+
+
+class ESAModel:
+    """
+    A compiled, read-only ESA model backed by (optionally memory-mapped) raw arrays.
+    """
+
+    def __init__(self, version, topics, vocabulary, idf, concept_matrix):
+        """
+        Parameters:
+        -----------
+        version : str
+            Content hash of the model.
+        topics : list of str
+            Concept names, one per ESA dimension.
+        vocabulary : list of str
+            Terms in column order of the concept matrix.
+        idf : np.ndarray
+            IDF weight per term.
+        concept_matrix : scipy.sparse.csr_matrix
+            L2-normalised TF-IDF matrix of the concepts (topics x terms).
+        """
+        self.version = version
+        self.topics = topics
+        self.vocabulary = vocabulary
+        self.idf = idf
+        self.concept_matrix = concept_matrix
+        self._count_vectorizer = CountVectorizer(
+            stop_words="english",
+            vocabulary={term: i for i, term in enumerate(vocabulary)}
+        )
+
+    @property
+    def n_topics(self):
+        return len(self.topics)
+
+    def tfidf(self, processed_sentences):
+        """
+        TF-IDF vectors of preprocessed sentences in the model's vocabulary (terms outside it are dropped).
+
+        Parameters:
+        -----------
+        processed_sentences : list of str
+            Sentences already run through `esa.preprocess_text`.
+
+        Returns:
+        --------
+        scipy.sparse.csr_matrix
+            L2-normalised TF-IDF rows, one per sentence.
+        """
+        counts = self._count_vectorizer.transform(processed_sentences)
+        return normalize(counts.multiply(self.idf).tocsr())
+
+    def transform(self, processed_sentences):
+        """
+        ESA vectors (cosine similarity to every concept) of preprocessed sentences.
+
+        Parameters:
+        -----------
+        processed_sentences : list of str
+            Sentences already run through `esa.preprocess_text`.
+
+        Returns:
+        --------
+        np.ndarray
+            Array of shape (len(processed_sentences), n_topics).
+        """
+        if len(processed_sentences) == 0:
+            return np.zeros((0, self.n_topics))
+        with tracer.start_as_current_span("esa.vectorize", attributes={"esa.sentences": len(processed_sentences)}):
+            tfidf = self.tfidf(processed_sentences)
+        # Both sides are L2-normalised, so the dot product is the cosine similarity
+        with tracer.start_as_current_span("esa.similarity"):
+            return (tfidf @ self.concept_matrix.T).toarray()
+
+
+def load_esa_model(model_dir=ESA_MODEL_DIR, mmap=True):
+    """
+    Load a compiled ESA model from disk.
+
+    Parameters:
+    -----------
+    model_dir : str
+        Directory written by `compile_esa_model`.
+    mmap : bool
+        Memory-map the arrays read-only so processes on a host share the same pages.
+
+    Returns:
+    --------
+    ESAModel
+        The loaded model.
+    """
+    with open(os.path.join(model_dir, MANIFEST_FILE), "r") as file:
+        manifest = json.load(file)
+
+    mmap_mode = "r" if mmap else None
+    arrays = {
+        name: np.load(os.path.join(model_dir, spec["file"]), mmap_mode=mmap_mode)
+        for name, spec in manifest["arrays"].items()
+    }
+    concept_matrix = csr_matrix(
+        (arrays["concept_data"], arrays["concept_indices"], arrays["concept_indptr"]),
+        shape=tuple(manifest["shape"]),
+        copy=False
+    )
+    logger.info(f"Loaded ESA model {manifest['version']} from {model_dir} (mmap={mmap}).")
+    return ESAModel(
+        version=manifest["version"],
+        topics=manifest["topics"],
+        vocabulary=manifest["vocabulary"],
+        idf=arrays["idf"],
+        concept_matrix=concept_matrix
+    )
+
+
+def get_esa_model(model_dir=ESA_MODEL_DIR):
+    """
+    Per-process cached, memory-mapped ESA model.
+
+    Load it before forking workers to share the mapping; otherwise every process maps the
+    same files and still shares the page cache.
+
+    Returns:
+    --------
+    ESAModel or None
+        The model, or None if no compiled artifact exists in `model_dir`.
+    """
+    key = os.path.abspath(model_dir)
+    if key not in _loaded_models:
+        if not os.path.exists(os.path.join(model_dir, MANIFEST_FILE)):
+            return None
+        _loaded_models[key] = load_esa_model(model_dir)
+    return _loaded_models[key]
+
+
+def get_esa_version(model_dir=ESA_MODEL_DIR):
+    """
+    Version hash of the compiled ESA model, or None if it has not been compiled.
+    """
+    model = get_esa_model(model_dir)
+    return model.version if model is not None else None
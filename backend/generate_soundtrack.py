@@ -1,9 +1,154 @@
 import numpy as np
 from sklearn.metrics.pairwise import cosine_similarity
 from scipy.optimize import linear_sum_assignment
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import min_weight_full_bipartite_matching
+from quantization import normalise_rows
 
 
-def assign_songs_to_scenes(scene_vectors, song_vectors):
+def top_k_candidates(scene_vectors, song_vectors, top_k, chunk_size=8192):
+    """
+    Find the top-k most similar songs for every scene without materialising the full similarity matrix.
+
+    Parameters:
+    -----------
+    scene_vectors : list of np.ndarray
+        Semantic vectors representing each scene.
+    song_vectors : list of np.ndarray or np.ndarray
+        Semantic vectors representing each candidate song.
+    top_k : int
+        Number of candidates to keep per scene.
+    chunk_size : int
+        Number of songs scored per matrix product.
+
+    Returns:
+    --------
+    candidate_indices : np.ndarray
+        Array of shape (n_scenes, k) with song indices.
+    candidate_sims : np.ndarray
+        Array of shape (n_scenes, k) with the matching cosine similarities.
+    """
+    scenes = normalise_rows(scene_vectors)
+    song_vectors = np.asarray(song_vectors, dtype=np.float64)
+    n_songs = song_vectors.shape[0]
+    k = min(top_k, n_songs)
+
+    candidate_sims = np.full((scenes.shape[0], 0), -np.inf)
+    candidate_indices = np.zeros((scenes.shape[0], 0), dtype=np.int64)
+
+    for start in range(0, n_songs, chunk_size):
+        chunk = normalise_rows(song_vectors[start:start + chunk_size])
+        chunk_sims = scenes @ chunk.T
+        chunk_indices = np.broadcast_to(np.arange(start, start + chunk.shape[0]), chunk_sims.shape)
+
+        # Merge the running top-k with this chunk and keep the best k again
+        merged_sims = np.hstack([candidate_sims, chunk_sims])
+        merged_indices = np.hstack([candidate_indices, chunk_indices])
+        if merged_sims.shape[1] > k:
+            keep = np.argpartition(-merged_sims, k - 1, axis=1)[:, :k]
+            merged_sims = np.take_along_axis(merged_sims, keep, axis=1)
+            merged_indices = np.take_along_axis(merged_indices, keep, axis=1)
+        candidate_sims, candidate_indices = merged_sims, merged_indices
+
+    return candidate_indices, candidate_sims
+
+
+def assign_songs_sparse(scene_vectors, song_vectors, top_k=None, reuse_penalty=None):
+    """
+    Assigns songs to scenes over large candidate pools by pruning to the top-k songs per scene
+    and solving a sparse bipartite matching.
+
+    With the default `top_k` (the number of scenes) the result is the same optimum as the dense
+    Hungarian solution: an optimal assignment never gives a scene a song ranked below the number
+    of scenes, because one of its better-ranked songs would be free.
+
+    Parameters:
+    -----------
+    scene_vectors : list of np.ndarray
+        List of semantic vectors representing each scene.
+    song_vectors : list of np.ndarray or np.ndarray
+        List of semantic vectors representing each song.
+    top_k : int, optional
+        Candidates kept per scene (defaults to the number of scenes).
+    reuse_penalty : float, optional
+        If given, a song may be assigned to several scenes; its r-th extra use costs
+        r * reuse_penalty similarity. If None, every scene gets a distinct song.
+
+    Returns:
+    --------
+    assignments : list of tuples
+        List of (scene_index, song_index) assignments, ordered by scene.
+    total_similarity : float
+        Sum of similarities for the chosen assignment (without penalties).
+    sim_matrix : scipy.sparse.csr_matrix
+        Scenes x songs matrix holding the similarities of the pruned candidates.
+    """
+    n_scenes = len(scene_vectors)
+    n_songs = len(song_vectors)
+    if top_k is None:
+        top_k = n_scenes
+    candidate_indices, candidate_sims = top_k_candidates(scene_vectors, song_vectors, top_k)
+
+    rows = np.repeat(np.arange(n_scenes), candidate_indices.shape[1])
+    sim_matrix = csr_matrix(
+        (candidate_sims.ravel(), (rows, candidate_indices.ravel())),
+        shape=(n_scenes, n_songs)
+    )
+
+    if reuse_penalty is None:
+        # Costs must be strictly positive: explicit zeros count as missing edges
+        cost_matrix = csr_matrix(
+            (2.0 - candidate_sims.ravel(), (rows, candidate_indices.ravel())),
+            shape=(n_scenes, n_songs)
+        )
+        try:
+            row_ind, col_ind = min_weight_full_bipartite_matching(cost_matrix)
+        except ValueError:
+            # Pruned graph has no full matching: solve exactly on the union of candidates instead
+            columns = np.unique(candidate_indices)
+            union_sims = normalise_rows(scene_vectors) @ normalise_rows(np.asarray(song_vectors)[columns]).T
+            row_ind, union_col_ind = linear_sum_assignment(1 - union_sims)
+            col_ind = columns[union_col_ind]
+            sim_matrix = sim_matrix.tolil()
+            sim_matrix[row_ind, col_ind] = union_sims[row_ind, union_col_ind]
+            sim_matrix = sim_matrix.tocsr()
+    else:
+        row_ind, col_ind = _assign_with_reuse(candidate_indices, candidate_sims, reuse_penalty)
+
+    assignments = sorted((int(i), int(j)) for i, j in zip(row_ind, col_ind))
+    total_similarity = float(sum(sim_matrix[i, j] for i, j in assignments))
+    return assignments, total_similarity, sim_matrix
+
+
+def _assign_with_reuse(candidate_indices, candidate_sims, reuse_penalty):
+    """
+    Matching where a song may serve several scenes: each candidate song gets one copy per scene
+    that lists it, and copy r costs an extra r * reuse_penalty. Copies are filled in order since
+    their costs increase, so the optimum of this matching is the optimum under the penalty.
+    """
+    n_scenes = candidate_indices.shape[0]
+    songs, inverse = np.unique(candidate_indices, return_inverse=True)
+    inverse = inverse.ravel()
+    uses = np.bincount(inverse, minlength=len(songs))
+    copy_offsets = np.concatenate([[0], np.cumsum(uses)])
+
+    # Expand every (scene, song) candidate edge into one edge per copy of the song
+    scene_of_edge = np.repeat(np.arange(n_scenes), candidate_indices.shape[1])
+    copies_per_edge = uses[inverse]
+    edge_starts = np.cumsum(copies_per_edge) - copies_per_edge
+    copy = np.arange(copies_per_edge.sum()) - np.repeat(edge_starts, copies_per_edge)
+
+    rows = np.repeat(scene_of_edge, copies_per_edge)
+    cols = np.repeat(copy_offsets[inverse], copies_per_edge) + copy
+    costs = 2.0 - np.repeat(candidate_sims.ravel(), copies_per_edge) + copy * reuse_penalty
+
+    cost_matrix = csr_matrix((costs, (rows, cols)), shape=(n_scenes, copy_offsets[-1]))
+    row_ind, copy_ind = min_weight_full_bipartite_matching(cost_matrix)
+    song_of_copy = np.repeat(songs, uses)
+    return row_ind, song_of_copy[copy_ind]
+
+
+def assign_songs_to_scenes(scene_vectors, song_vectors, mode="dense", top_k=None, reuse_penalty=None):
     """
     Assigns songs to scenes by maximising the overall cosine similarity using the Hungarian algorithm.
 
@@ -13,6 +158,13 @@ def assign_songs_to_scenes(scene_vectors, song_vectors):
         List of semantic vectors representing each scene.
     song_vectors : list of np.ndarray
         List of semantic vectors representing each song.
+    mode : str
+        "dense" solves the full scenes x songs matrix; "sparse" prunes to the top-k songs per scene
+        first and scales to candidate pools of thousands of tracks (see `assign_songs_sparse`).
+    top_k : int, optional
+        Candidates kept per scene in sparse mode.
+    reuse_penalty : float, optional
+        Allow song reuse under this penalty (sparse mode only).
 
     Returns:
     --------
@@ -20,9 +172,14 @@ def assign_songs_to_scenes(scene_vectors, song_vectors):
         List of (scene_index, song_index) assignments.
     total_similarity : float
         Sum of similarities for the optimal assignment.
-    sim_matrix : np.ndarray
-        The cosine similarity matrix between scenes and songs.
+    sim_matrix : np.ndarray or scipy.sparse.csr_matrix
+        The cosine similarity matrix between scenes and songs (sparse in sparse mode).
     """
+    if mode == "sparse" or reuse_penalty is not None:
+        return assign_songs_sparse(scene_vectors, song_vectors, top_k=top_k, reuse_penalty=reuse_penalty)
+    if mode != "dense":
+        raise ValueError(f"Unknown assignment mode: {mode}")
+
     # Compute cosine similarity between each scene and song
     sim_matrix = cosine_similarity(scene_vectors, song_vectors)
 
@@ -4,13 +4,29 @@ from dotenv import load_dotenv
 import lyricsgenius
 import re
 import concurrent.futures
-# Set up logging
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s", filename='debug.log', filemode="w")
+from tracing import tracer, trace_session, in_current_context
+from log_setup import configure_logging, get_rate_limited_logger
 logger = logging.getLogger(__name__)
+per_item_logger = get_rate_limited_logger(__name__)     # messages logged once per song
 import time
 
 load_dotenv()
 access_token = os.getenv("GENIUS_ACCESS_TOKEN")
+GENIUS_API_URL = os.getenv("GENIUS_API_URL", "https://api.genius.com/")
+GENIUS_PUBLIC_API_URL = os.getenv("GENIUS_PUBLIC_API_URL", "https://genius.com/api/")
+GENIUS_WEB_URL = os.getenv("GENIUS_WEB_URL", "https://genius.com/")
+GENIUS_WORKERS = int(os.getenv("GENIUS_WORKERS", "5"))      # concurrent page / lyrics requests per artist
+GENIUS_PER_PAGE = 50                                         # largest page the artist songs endpoint serves
+
+class GeniusTimeout(Exception):
+    '''
+    Raised when a top-tracks fetch runs out of time; carries the tracks whose lyrics arrived in time
+    and the number of lyrics requests that were cancelled.
+    '''
+    def __init__(self, artist_name, tracks, cancelled):
+        super().__init__(f"Genius fetch for {artist_name} timed out with {cancelled} request(s) outstanding")
+        self.tracks = tracks
+        self.cancelled = cancelled
 
 def clean_title(title):
     # remove all words in parentheses/brackets
@@ -33,70 +49,194 @@ def clean_lyrics(lyrics):
     lyrics = lyrics.strip()
     return lyrics
 
-def get_artist_top_tracks(artist_name, top_n=10):
+def is_lyrics_song(song, excluded_terms):
     '''
-    Fetch the top tracks of an artist from Genius and return their lyrics.
+    Check whether an artist-songs entry is a song with lyrics (not a tracklist, skit, instrumental, remix...).
     Args:
-        artist_name (str): The name of the artist.
-        top_n (int): The number of top tracks to fetch.
+        song (dict): Song entry from the Genius artist songs endpoint.
+        excluded_terms (list): Title terms that disqualify a song.
     Returns:
-        list: A list of tuples containing artist name, track name, and lyrics.
+        bool: True if the song's lyrics should be fetched.
     '''
+    if song.get("lyrics_state") != "complete" or song.get("instrumental"):
+        return False
+    title = song.get("title", "").lower()
+    return not any(term.lower() in title for term in excluded_terms)
 
+def get_genius_client():
+    '''
+    Create a Genius API client; GENIUS_API_URL, GENIUS_PUBLIC_API_URL and GENIUS_WEB_URL
+    point it at another host (e.g. genius_stub.py).
+    Returns:
+        lyricsgenius.Genius: The configured client.
+    '''
     genius = lyricsgenius.Genius(
         access_token=access_token,
         excluded_terms=["(Remix)", "(Live)"],
         remove_section_headers=True,
-        verbose=False, 
         retries=3,
-        sleep_time=0.2, 
+        sleep_time=0.2,
         timeout=5
     )                                               # Genius API client
+    genius.API_ROOT = GENIUS_API_URL
+    genius.PUBLIC_API_ROOT = GENIUS_PUBLIC_API_URL
+    genius.WEB_ROOT = GENIUS_WEB_URL
+    trace_session(genius._session, "genius")        # one span per HTTP call
+    return genius
+
+def find_artist_id(genius, artist_name):
+    '''
+    Resolve an artist name to a Genius artist ID with a single search request.
+    Args:
+        genius (lyricsgenius.Genius): The Genius API client.
+        artist_name (str): The name of the artist.
+    Returns:
+        int: The artist ID (exact name match preferred, else the top artist hit), or None.
+    '''
+    response = genius.search_all(artist_name)
+    hits = [
+        hit["result"]
+        for section in response.get("sections", []) if section.get("type") == "artist"
+        for hit in section.get("hits", [])
+    ]
+    if not hits:
+        return None
+    wanted = artist_name.strip().lower()
+    exact = next((hit for hit in hits if hit.get("name", "").strip().lower() == wanted), None)
+    return (exact or hits[0])["id"]
+
+def get_artist_songs(genius, artist_id, top_n, executor):
+    '''
+    Fetch the artist's most popular songs that have lyrics, requesting the pages concurrently.
+    Args:
+        genius (lyricsgenius.Genius): The Genius API client.
+        artist_id (int): The Genius artist ID.
+        top_n (int): The number of songs wanted.
+        executor (concurrent.futures.Executor): Pool for the page requests.
+    Returns:
+        list: Up to top_n song entries, most popular first.
+    '''
+    def get_page(page):
+        return genius.artist_songs(artist_id, per_page=GENIUS_PER_PAGE, sort="popularity", page=page)
 
-    def get_lyrics(track_name, retries = 3):
+    songs, seen = [], set()
+    def add_songs(response):
+        for song in response.get("songs", []):
+            # songs the artist only features on are not theirs (as with search_artist's default)
+            if song.get("primary_artist", {}).get("id") != artist_id or not is_lyrics_song(song, genius.excluded_terms):
+                continue
+            title = clean_title(song["title"]).lower()
+            if title not in seen:
+                seen.add(title)
+                songs.append(song)
+
+    # request the pages that top_n songs span at once; continue page by page only if filtering left too few
+    n_pages = -(-top_n // GENIUS_PER_PAGE)
+    next_page = None
+    for response in executor.map(in_current_context(get_page), range(1, n_pages + 1)):
+        add_songs(response)
+        next_page = response.get("next_page")
+    while len(songs) < top_n and next_page:
+        response = get_page(next_page)
+        add_songs(response)
+        next_page = response.get("next_page")
+    return songs[:top_n]
+
+def get_artist_top_tracks(artist_name, top_n=10, timeout=None):
+    '''
+    Fetch the top tracks of an artist from Genius and return their lyrics.
+
+    The artist is resolved once and the lyrics are scraped straight from the song URLs of the
+    artist's song list; a title search (by this artist) is only made for songs whose page yields no lyrics.
+    With a timeout, every request is bounded by the time left (without retries) and lyrics requests
+    still queued when it runs out are cancelled.
+    Args:
+        artist_name (str): The name of the artist.
+        top_n (int): The number of top tracks to fetch.
+        timeout (float): Optional time limit in seconds for the whole fetch.
+    Returns:
+        list: A list of lists containing artist name, track name, and lyrics, most popular first.
+    Raises:
+        GeniusTimeout: If the timeout ran out, with the tracks fetched so far.
+    '''
+
+    genius = get_genius_client()
+    expires_at = None
+    if timeout is not None:
+        expires_at = time.monotonic() + timeout
+        genius.retries = 0
+        genius.sleep_time = 0
+
+    def time_left():
+        '''
+        Seconds left before the timeout (None without one); also bounds the client's next requests.
         '''
-        Helper function to fetch lyrics for a given track name.
+        if expires_at is None:
+            return None
+        remaining = expires_at - time.monotonic()
+        if remaining <= 0:
+            raise GeniusTimeout(artist_name, [], top_n)
+        genius.timeout = min(genius.timeout, remaining)
+        return remaining
+
+    def get_lyrics(song):
+        '''
+        Helper function to fetch lyrics for a song from the artist's song list.
         Args:
-            track_name (str): The name of the track.
-            retries (int): Number of retry attempts.
+            song (dict): Song entry with title and url.
         Returns:
             list: A list containing artist name, track name, and lyrics.
         '''
-        track_name = clean_title(track_name)    # remove unwanted characters
-        for attempt in range(retries):  
-            track = genius.search_song(title=track_name)    # search for the song
-            if track and track.lyrics:
-                lyrics = clean_lyrics(track.lyrics)         # clean the lyrics
-                return [artist_name, track_name, lyrics]
-            else:
-                logger.info(f"lyrics not found for track {track_name}: Attempt {attempt}")
-        if not track:
-            logger.error(f"track '{track_name}' not found.")
+        track_name = clean_title(song["title"])    # remove unwanted characters
+        with tracer.start_as_current_span("genius.song_lyrics", attributes={"genius.song": track_name}) as span:
+            lyrics = genius.lyrics(song_url=song["url"])
+            if not lyrics:
+                per_item_logger.info(f"lyrics not found at {song['url']}; searching for '{track_name}' by {artist_name}")
+                span.set_attribute("genius.title_search", True)
+                track = genius.search_song(title=track_name, artist=artist_name, get_full_info=False)
+                lyrics = track.lyrics if track else None
+        if not lyrics:
+            logger.error(f"lyrics for track '{track_name}' not found.")
             return None
-        
+        return [artist_name, track_name, clean_lyrics(lyrics)]
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=GENIUS_WORKERS)
     try:
-        artist = genius.search_artist(
-            artist_name=artist_name,
-            max_songs=top_n,
-            sort="popularity",
-            get_full_info=False,
-            per_page=top_n
-            )   # search for the artist
-        
-        top_tracks_lyrics = []
-        max_workers = min(5, len(artist.songs)) 
-        # limit the number of threads to the number of songs
-        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = [executor.submit(get_lyrics, song.title) for song in artist.songs]
-            for future in concurrent.futures.as_completed(futures):
-                result = future.result()
-                if result:
-                    top_tracks_lyrics.append(result)
+        time_left()
+        with tracer.start_as_current_span("genius.find_artist"):
+            artist_id = find_artist_id(genius, artist_name)
+        if artist_id is None:
+            logger.error(f"artist '{artist_name}' not found.")
+            return []
 
+        time_left()
+        with tracer.start_as_current_span("genius.artist_songs"):
+            songs = get_artist_songs(genius, artist_id, top_n, executor)
+        remaining = time_left()
+        futures = [executor.submit(in_current_context(get_lyrics), song) for song in songs]
+        _, not_done = concurrent.futures.wait(futures, timeout=remaining)
+        if not_done:
+            # queued lyrics requests are dropped; those in flight end at the client timeout and are ignored
+            for future in not_done:
+                future.cancel()
+            arrived = [future.result() for future in futures if future not in not_done and future.exception() is None]
+            raise GeniusTimeout(artist_name, [track for track in arrived if track], len(not_done))
+        top_tracks_lyrics = [future.result() for future in futures if future.result()]
+
+    except GeniusTimeout as e:
+        logger.warning(f"{e}; keeping {len(e.tracks)} track(s).")
+        raise
     except Exception as e:
+        if expires_at is not None and time.monotonic() >= expires_at:
+            # a request cut short by the timeout
+            logger.warning(f"Genius fetch for {artist_name} timed out: {e}")
+            raise GeniusTimeout(artist_name, [], top_n) from e
         logger.error(f"Error retrieving top tracks for {artist_name}: {e}")
         return []
-    
+    finally:
+        # without a timeout this waits for every request, as the executor's with-block did
+        executor.shutdown(wait=expires_at is None, cancel_futures=True)
+
     return top_tracks_lyrics
 
 def main():
@@ -107,4 +247,5 @@ def main():
     print("process time:", t2-t1)
 
 if __name__ == "__main__":
+    configure_logging()
     main()
\ No newline at end of file
@@ -0,0 +1,163 @@
+from fastapi import FastAPI
+from fastapi.responses import HTMLResponse, JSONResponse
+import argparse
+import asyncio
+import uvicorn
+
+# Local stand-in for the parts of the Genius API and web site that genius_handler.py calls,
+# replaying the response shapes of the real endpoints with a fixed per-request latency.
+# Run it and point the handler at it:
+#   python genius_stub.py --port 8091 --latency 0.1
+#   GENIUS_API_URL=http://localhost:8091/v1/ GENIUS_PUBLIC_API_URL=http://localhost:8091/api/ \
+#   GENIUS_WEB_URL=http://localhost:8091/web/ GENIUS_ACCESS_TOKEN=stub python genius_handler.py
+# GET /stats reports how many calls each endpoint received; POST /reset clears the counters.
+
+ARTISTS = ["Dua Lipa", "Adele", "Lionel Richie", "Taylor Swift", "Ed Sheeran"]
+SONGS_PER_ARTIST = 60
+
+# a few entries per artist that are not songs with lyrics, like the real song lists
+NON_SONGS = {7: "Tracklist + Album Art", 13: "Interlude (Instrumental)", 21: "Track {i} (Remix)"}
+
+
+def build_catalog():
+    '''
+    Songs of every artist, most popular first; "Hello" is shared by Adele and Lionel Richie on purpose.
+    '''
+    artists, songs = {}, {}
+    for a, name in enumerate(ARTISTS):
+        artist_id = 1000 + a
+        slug = name.replace(" ", "-")
+        artists[artist_id] = {
+            "id": artist_id, "name": name, "url": f"https://genius.com/artists/{slug}",
+            "api_path": f"/artists/{artist_id}", "header_image_url": "", "image_url": "",
+            "is_meme_verified": False, "is_verified": True,
+        }
+        for i in range(SONGS_PER_ARTIST):
+            song_id = artist_id * 1000 + i
+            title = "Hello" if i == 0 and name in ("Adele", "Lionel Richie") else f"{name} Track {i}"
+            title = NON_SONGS.get(i, title).format(i=i)
+            songs[song_id] = {
+                "id": song_id,
+                "title": title,
+                "url": f"https://genius.com/{slug}-{song_id}-lyrics",
+                "api_path": f"/songs/{song_id}",
+                "lyrics_state": "unreleased" if i == 7 else "complete",
+                "instrumental": i == 13,
+                "primary_artist": artists[artist_id],
+                "pyongs_count": SONGS_PER_ARTIST - i,
+            }
+    return artists, songs
+
+
+ARTIST_DATA, SONG_DATA = build_catalog()
+SONG_PATHS = {song["url"].replace("https://genius.com/", ""): song for song in SONG_DATA.values()}
+
+calls = {"search_multi": 0, "search": 0, "artist": 0, "artist_songs": 0, "song": 0, "lyrics_page": 0}
+latency = 0.0
+
+app = FastAPI()
+
+
+def response(body):
+    return {"meta": {"status": 200}, "response": body}
+
+
+def search_hits(q):
+    '''
+    Artist and song hits for a query, matched on the words of names and titles.
+    '''
+    words = set(q.lower().split())
+    artist_hits = [{"index": "artist", "type": "artist", "result": artist}
+                   for artist in ARTIST_DATA.values() if set(artist["name"].lower().split()) <= words]
+    song_hits = [{"index": "song", "type": "song", "result": song}
+                 for song in SONG_DATA.values() if set(song["title"].lower().split()) <= words]
+    # with only a title, the most popular artist's song comes first (which may be the wrong artist)
+    song_hits.sort(key=lambda hit: (-len(set(hit["result"]["primary_artist"]["name"].lower().split()) & words),
+                                    hit["result"]["primary_artist"]["id"]))
+    return artist_hits, song_hits
+
+
+@app.get("/api/search/multi")
+async def search_multi(q: str, per_page: int = 5, page: int = 1):
+    calls["search_multi"] += 1
+    await asyncio.sleep(latency)
+    artist_hits, song_hits = search_hits(q)
+    start = (page - 1) * per_page
+    artist_hits, song_hits = artist_hits[start:start + per_page], song_hits[start:start + per_page]
+    top_hit = (artist_hits or song_hits)[:1]
+    return response({"sections": [
+        {"type": "top_hit", "hits": top_hit},
+        {"type": "song", "hits": song_hits},
+        {"type": "artist", "hits": artist_hits},
+    ]})
+
+
+@app.get("/api/search")
+async def search(q: str, per_page: int = 10, page: int = 1):
+    calls["search"] += 1
+    await asyncio.sleep(latency)
+    _, song_hits = search_hits(q)
+    return response({"hits": song_hits[(page - 1) * per_page:page * per_page]})
+
+
+@app.get("/v1/artists/{artist_id}")
+async def artist(artist_id: int):
+    calls["artist"] += 1
+    await asyncio.sleep(latency)
+    if artist_id not in ARTIST_DATA:
+        return JSONResponse(content={"meta": {"status": 404}}, status_code=404)
+    return response({"artist": ARTIST_DATA[artist_id]})
+
+
+@app.get("/v1/artists/{artist_id}/songs")
+async def artist_songs(artist_id: int, per_page: int = 20, page: int = 1, sort: str = "title"):
+    calls["artist_songs"] += 1
+    await asyncio.sleep(latency)
+    songs = [song for song in SONG_DATA.values() if song["primary_artist"]["id"] == artist_id]
+    if sort == "title":
+        songs.sort(key=lambda song: song["title"])
+    per_page = min(per_page, 50)
+    start = (page - 1) * per_page
+    next_page = page + 1 if start + per_page < len(songs) else None
+    return response({"songs": songs[start:start + per_page], "next_page": next_page})
+
+
+@app.get("/v1/songs/{song_id}")
+async def song(song_id: int):
+    calls["song"] += 1
+    await asyncio.sleep(latency)
+    if song_id not in SONG_DATA:
+        return JSONResponse(content={"meta": {"status": 404}}, status_code=404)
+    return response({"song": SONG_DATA[song_id]})
+
+
+@app.get("/web/{path:path}", response_class=HTMLResponse)
+async def lyrics_page(path: str):
+    calls["lyrics_page"] += 1
+    await asyncio.sleep(latency)
+    song = SONG_PATHS.get(path)
+    if song is None:
+        return HTMLResponse("<html><body>Not found</body></html>", status_code=404)
+    verses = "<br/>".join(f"{song['title']} line {n}, sung by {song['primary_artist']['name']}" for n in range(8))
+    return f'<html><body><div data-lyrics-container="true">[Verse 1]<br/>{verses}</div></body></html>'
+
+
+@app.get("/stats")
+def stats():
+    return calls
+
+
+@app.post("/reset")
+def reset():
+    for key in calls:
+        calls[key] = 0
+    return calls
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Genius API stub.")
+    parser.add_argument("--port", type=int, default=8091)
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds added to every response")
+    args = parser.parse_args()
+    latency = args.latency
+    uvicorn.run(app=app, host="127.0.0.1", port=args.port, log_level="warning")
@@ -0,0 +1,56 @@
+# gunicorn.conf.py
+# Multi-worker serving: gunicorn -c gunicorn.conf.py routes:app
+# Set WEB_CONCURRENCY to the number of worker processes (defaults to 1).
+
+import gc
+import os
+import shutil
+
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = os.getenv("BIND", "0.0.0.0:12000")
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+
+# Size the native thread pools from each worker's core budget before the app imports numpy and torch
+import thread_budget
+
+# Import the app (and load the MiniLM model, ESA model and artist vectors) once in the master,
+# then fork: the workers share those read-only pages copy-on-write instead of loading N copies.
+preload_app = True
+
+# Every worker writes its Prometheus samples into this directory and /metrics aggregates them.
+# It must be set before prometheus_client is imported, i.e. before the app is preloaded.
+prometheus_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/artistify_prometheus")
+
+# One job worker pool for the whole server, run by the master rather than one per web worker
+os.environ["JOB_WORKERS_IN_APP"] = "0"
+job_pool = None
+
+
+def on_starting(server):
+    # Stale sample files from a previous run would be aggregated too
+    shutil.rmtree(prometheus_dir, ignore_errors=True)
+    os.makedirs(prometheus_dir, exist_ok=True)
+
+
+def pre_fork(server, worker):
+    # Move the preloaded objects out of the GC's reach so collections in the workers
+    # do not touch (and thereby copy) the shared pages
+    gc.freeze()
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def when_ready(server):
+    global job_pool
+    from job_queue import JobWorkerPool
+    job_pool = JobWorkerPool()
+    job_pool.start()
+
+
+def on_exit(server):
+    if job_pool is not None:
+        job_pool.stop()
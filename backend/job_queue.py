@@ -0,0 +1,248 @@
+import os
+import json
+import time
+import uuid
+import signal
+import sqlite3
+import logging
+import multiprocessing
+from tracing import configure_tracing, request_span
+from log_setup import configure_logging
+from thread_budget import apply_thread_budget
+
+logger = logging.getLogger(__name__)
+
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    request TEXT NOT NULL,
+    stages TEXT NOT NULL DEFAULT '{}',
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    worker_pid INTEGER
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+"""
+
+
+def connect(db_path=JOB_DB_PATH):
+    """
+    Open the job database in autocommit mode with WAL journaling, so the API workers
+    and the job workers can read and write it concurrently.
+    """
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def submit_job(request, db_path=JOB_DB_PATH):
+    """
+    Queue a soundtrack job.
+
+    Parameters:
+    -----------
+    request : dict
+        Arguments for `pipeline.run_soundtrack_pipeline` (storyline, artist, ...).
+    db_path : str
+        Path to the SQLite job database.
+
+    Returns:
+    --------
+    str
+        The job ID.
+    """
+    job_id = uuid.uuid4().hex
+    conn = connect(db_path)
+    try:
+        conn.execute(
+            "INSERT INTO jobs (id, status, request, created_at) VALUES (?, 'queued', ?, ?)",
+            (job_id, json.dumps(request), time.time())
+        )
+    finally:
+        conn.close()
+    logger.info(f"Queued job {job_id}.")
+    return job_id
+
+
+def get_job(job_id, db_path=JOB_DB_PATH):
+    """
+    Status, partial stage results, final output and timings of a job.
+
+    Returns:
+    --------
+    dict or None
+        The job, or None if the ID is unknown.
+    """
+    conn = connect(db_path)
+    try:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        position = None
+        if row is not None and row["status"] == "queued":
+            position = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created_at < ?", (row["created_at"],)
+            ).fetchone()[0]
+    finally:
+        conn.close()
+    if row is None:
+        return None
+
+    now = time.time()
+    started_at, finished_at = row["started_at"], row["finished_at"]
+    return {
+        "job_id": row["id"],
+        "status": row["status"],
+        "queue_position": position,
+        "stages": json.loads(row["stages"]),
+        "result": json.loads(row["result"]) if row["result"] else None,
+        "error": row["error"],
+        "timings": {
+            "created_at": row["created_at"],
+            "started_at": started_at,
+            "finished_at": finished_at,
+            "queue_wait": (started_at or now) - row["created_at"],
+            "run_time": (finished_at or now) - started_at if started_at else None,
+        },
+    }
+
+
+def claim_next_job(conn):
+    """
+    Atomically move the oldest queued job to 'running' and return (job_id, request), or None.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "SELECT id, request FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+        ).fetchone()
+        if row is not None:
+            conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, worker_pid = ? WHERE id = ?",
+                (time.time(), os.getpid(), row["id"])
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return (row["id"], json.loads(row["request"])) if row is not None else None
+
+
+def requeue_interrupted_jobs(db_path=JOB_DB_PATH):
+    """
+    Put jobs that were running when the service stopped back in the queue.
+    Only call this while no job workers are alive.
+    """
+    conn = connect(db_path)
+    try:
+        count = conn.execute(
+            "UPDATE jobs SET status = 'queued', started_at = NULL, worker_pid = NULL, stages = '{}' "
+            "WHERE status = 'running'"
+        ).rowcount
+    finally:
+        conn.close()
+    if count:
+        logger.info(f"Re-queued {count} interrupted job(s).")
+    return count
+
+
+def run_job(conn, job_id, request):
+    """
+    Run one job through the pipeline, recording each stage's time and partial results as it finishes.
+    """
+    from pipeline import run_soundtrack_pipeline
+
+    stages = {}
+
+    def on_stage(name, elapsed, partial):
+        stages[name] = {"time": elapsed, **partial}
+        conn.execute("UPDATE jobs SET stages = ? WHERE id = ?", (json.dumps(stages), job_id))
+
+    try:
+        # the job ID is the request ID of the job's spans
+        with request_span("soundtrack_job", job_id):
+            output_dict, _ = run_soundtrack_pipeline(on_stage=on_stage, **request)
+        conn.execute(
+            "UPDATE jobs SET status = 'done', result = ?, finished_at = ? WHERE id = ?",
+            (json.dumps(output_dict), time.time(), job_id)
+        )
+        logger.info(f"Job {job_id} done.")
+    except Exception as e:
+        logger.error(f"Job {job_id} failed: {e}", exc_info=True)
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+            (str(e), time.time(), job_id)
+        )
+
+
+def worker_loop(stop_event, db_path=JOB_DB_PATH, poll_interval=JOB_POLL_INTERVAL):
+    """
+    Job worker process: claim and run queued jobs until `stop_event` is set.
+    """
+    # The parent handles shutdown; finish the current job instead of dying mid-write
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    configure_logging(filemode="a")     # the web process already started the log file
+    configure_tracing()
+    apply_thread_budget()
+    conn = connect(db_path)
+    logger.info(f"Job worker {os.getpid()} started.")
+    while not stop_event.is_set():
+        job = claim_next_job(conn)
+        if job is None:
+            stop_event.wait(poll_interval)
+            continue
+        run_job(conn, *job)
+    conn.close()
+
+
+class JobWorkerPool:
+    """
+    A fixed pool of local worker processes draining the SQLite job queue.
+    The pool size caps how many jobs run at once, independently of the interactive endpoints.
+    """
+
+    def __init__(self, n_workers=JOB_WORKERS, db_path=JOB_DB_PATH):
+        self.n_workers = n_workers
+        self.db_path = db_path
+        # spawn, not fork: the API process already runs threads (and torch), which fork does not copy safely
+        self._context = multiprocessing.get_context("spawn")
+        self._stop_event = self._context.Event()
+        self._processes = []
+
+    def start(self):
+        requeue_interrupted_jobs(self.db_path)
+        for _ in range(self.n_workers):
+            process = self._context.Process(
+                target=worker_loop, args=(self._stop_event, self.db_path), daemon=True
+            )
+            process.start()
+            self._processes.append(process)
+        logger.info(f"Started {self.n_workers} job worker(s).")
+
+    def stop(self, timeout=30):
+        self._stop_event.set()
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self._processes = []
+
+
+if __name__ == "__main__":
+    # Run the job workers on their own, e.g. next to a multi-worker API deployment
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    pool = JobWorkerPool()
+    pool.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pool.stop()
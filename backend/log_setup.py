@@ -0,0 +1,173 @@
+import os
+import json
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from opentelemetry import trace
+from tracing import current_request_id
+
+# One logging setup per process, installed by the entry point (routes.py, job workers, scripts).
+# Request threads only put records on a queue; a listener thread formats and writes them.
+LOG_FILE = os.getenv("LOG_FILE", "debug.log")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FILEMODE = os.getenv("LOG_FILEMODE", "w")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")                              # "text" or "json"
+LOG_RATE_LIMIT_INTERVAL = float(os.getenv("LOG_RATE_LIMIT_INTERVAL", "10"))  # seconds; 0 logs every per-item message
+
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - [%(request_id)s] %(message)s"
+
+_listener = None
+_queue_handler = None
+
+
+class RequestContextFilter(logging.Filter):
+    '''
+    Adds the request ID and trace ID of the logging thread to every record. Runs on the
+    thread that logs, before the record is queued, so the IDs are those of the right request.
+    '''
+
+    def filter(self, record):
+        record.request_id = current_request_id() or "-"
+        span_context = trace.get_current_span().get_span_context()
+        record.trace_id = trace.format_trace_id(span_context.trace_id) if span_context.is_valid else None
+        return True
+
+
+class RequestQueueHandler(QueueHandler):
+    '''
+    QueueHandler that hands the record itself to the queue, with its message merged and any
+    traceback rendered, instead of copying and pre-formatting it on the request thread.
+    '''
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    '''
+    One JSON object per line with the time, level, logger, message, request ID and trace ID.
+    '''
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+            "trace_id": getattr(record, "trace_id", None),
+            "thread": record.threadName,
+        }
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry)
+
+
+class RateLimitFilter(logging.Filter):
+    '''
+    Passes at most one record per call site per `interval` seconds; the next record that passes
+    says how many were dropped in between.
+    '''
+
+    def __init__(self, interval=LOG_RATE_LIMIT_INTERVAL):
+        super().__init__()
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._sites = {}    # (pathname, lineno) -> [time of last passed record, records dropped since]
+
+    def filter(self, record):
+        if self.interval <= 0:
+            return True
+        site = (record.pathname, record.lineno)
+        with self._lock:
+            last = self._sites.get(site)
+            if last is not None and record.created - last[0] < self.interval:
+                last[1] += 1
+                return False
+            dropped = last[1] if last is not None else 0
+            self._sites[site] = [record.created, 0]
+        if dropped:
+            record.msg = f"{record.msg} ({dropped} similar messages suppressed)"
+        return True
+
+
+def get_rate_limited_logger(name, interval=LOG_RATE_LIMIT_INTERVAL):
+    '''
+    Logger for per-item messages on hot paths (one per scene, track or HTTP call).
+    Args:
+        name (str): Module name; the logger is its `per_item` child, so level settings still apply.
+        interval (float): Seconds between two records from the same call site.
+    Returns:
+        logging.Logger: The rate-limited logger.
+    '''
+    logger = logging.getLogger(f"{name}.per_item")
+    if not any(isinstance(f, RateLimitFilter) for f in logger.filters):
+        logger.addFilter(RateLimitFilter(interval))
+    return logger
+
+
+def configure_logging(filename=LOG_FILE, level=LOG_LEVEL, filemode=LOG_FILEMODE, log_format=LOG_FORMAT):
+    '''
+    Route all logging through a queue to a background writer thread (once per process).
+    Args:
+        filename (str): Log file.
+        level (str): Root logger level.
+        filemode (str): "w" to start a fresh file, "a" to append (e.g. in worker processes).
+        log_format (str): "text" or "json".
+    Returns:
+        logging.handlers.QueueListener: The listener writing the records.
+    '''
+    global _listener, _queue_handler
+    if _listener is not None:
+        return _listener
+
+    file_handler = logging.FileHandler(filename, mode=filemode)
+    file_handler.setFormatter(JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    _queue_handler = RequestQueueHandler(log_queue)
+    _queue_handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):     # e.g. a basicConfig from an imported script
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    '''
+    Write out the queued records and stop the listener thread.
+    '''
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _restart_listener_after_fork():
+    # The listener thread does not survive fork (gunicorn preloads the app in the master):
+    # give the child a fresh queue and its own listener writing to the same file
+    global _listener
+    if _listener is None:
+        return
+    log_queue = queue.SimpleQueue()
+    _queue_handler.queue = log_queue
+    _listener = QueueListener(log_queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_listener_after_fork)
@@ -1,29 +1,114 @@
+import os
 import csv
 import ast
 import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
 from sklearn.neighbors import NearestNeighbors
+from quantization import QuantizedVectors, normalise_rows
+
+# Storage precision of the artist vectors held by ArtistRecommender
+ARTIST_VECTOR_DTYPE = os.getenv("ARTIST_VECTOR_DTYPE", "float64")
+
+
+# Parquet catalog written by the Spark ingestion job (recommender_corpus.py); once it exists it is the catalog of record
+CATALOG_PARQUET_DIR = os.getenv("CATALOG_PARQUET_DIR", "esa_vectors_all_lyrics.parquet")
+# The CSV catalog written before the Parquet one; its rows seed the Parquet catalog on the first run
+CATALOG_CSV_FILE = os.getenv("CATALOG_CSV_FILE", "esa_vectors_all_lyrics.csv")
+
+# Partition columns of the Parquet catalog written by the Spark ingestion job (recommender_corpus.py).
+# Declared as strings so version hashes that look like numbers are not parsed as such.
+CATALOG_PARTITIONING = ds.partitioning(pa.schema([("esa_version", pa.string()), ("ingest_run", pa.string())]),
+                                       flavor="hive")
+
+
+def serving_catalog():
+    """
+    The catalog of record: the Parquet catalog once the Spark job has created it, else the CSV catalog.
+    """
+    return CATALOG_PARQUET_DIR if os.path.exists(CATALOG_PARQUET_DIR) else CATALOG_CSV_FILE
+
+
+def is_parquet_catalog(file_path):
+    """
+    Whether a catalog path names a Parquet dataset (a directory or a .parquet file) rather than a CSV.
+    """
+    return os.path.isdir(file_path) or file_path.endswith('.parquet')
+
+
+def read_parquet_catalog(path, columns, ingest_run=None, row_filter=None):
+    """
+    Read columns of the partitioned Parquet catalog, without touching the others (e.g. the lyrics).
+
+    Parameters:
+    -----------
+    path : str
+        Root directory of the dataset.
+    columns : list of str
+        Columns to read; the partition columns esa_version and ingest_run can be included.
+    ingest_run : str
+        Only read the rows written by this ingestion run.
+    row_filter : pyarrow.dataset.Expression
+        Only read the rows matching this expression (e.g. on esa_version).
+
+    Returns:
+    --------
+    pyarrow.Table
+        The requested columns.
+    """
+    dataset = ds.dataset(path, format="parquet", partitioning=CATALOG_PARTITIONING)
+    if ingest_run is not None:
+        run_filter = ds.field("ingest_run") == ingest_run
+        row_filter = run_filter if row_filter is None else row_filter & run_filter
+    return dataset.to_table(columns=columns, filter=row_filter)
+
+
+def load_parquet_esa_vectors(path):
+    """
+    Load ESA vectors for each track from the Parquet catalog.
+
+    The vector column is read as one flat float64 buffer, so each entry's vector is a view into it.
+
+    Returns:
+    --------
+    list of dict
+        Each dict contains 'artist', 'track' and their 'esa_vector' as a 1-D array.
+    """
+    table = read_parquet_catalog(path, ['artist', 'track', 'esa_vector'])
+    esa_vector = table.column('esa_vector').combine_chunks()
+    values = esa_vector.flatten().to_numpy(zero_copy_only=False).astype(np.float64, copy=False)
+    offsets = esa_vector.offsets.to_numpy() - esa_vector.offset
+    vectors = np.split(values, offsets[1:-1])
+    return [
+        {'artist': artist, 'track': track, 'esa_vector': vector}
+        for artist, track, vector in zip(table.column('artist').to_pylist(), table.column('track').to_pylist(), vectors)
+    ]
 
 
 def load_artist_esa_vectors(file_path='esa_vectors_all_lyrics.csv'):
     """
-    Load ESA vectors for each artist from a CSV file.
+    Load ESA vectors for each artist from a CSV file or the Parquet catalog.
 
     Parameters:
     -----------
     file_path : str
-        Path to the CSV file containing artist ESA vectors.
+        Path to the CSV file containing artist ESA vectors, or to the Parquet catalog directory.
 
     Returns:
     --------
     list of dict
-        Each dict contains 'artist' and their associated 'esa_vector' as a list.
+        Each dict contains 'artist', 'track' and their associated 'esa_vector' as a list.
     """
+    if is_parquet_catalog(file_path):
+        return load_parquet_esa_vectors(file_path)
+
     artist_esa_vectors = []
     try:
         with open(file_path, mode='r', encoding='utf-8') as f:
             reader = csv.DictReader(f)
             for row in reader:
                 artist = row.get('artist', '')
+                track = row.get('track', '')
                 esa_vector_str = row.get('esa_vector', '[]')
 
                 try:
@@ -34,6 +119,7 @@ def load_artist_esa_vectors(file_path='esa_vectors_all_lyrics.csv'):
 
                 artist_esa_vectors.append({
                     'artist': artist,
+                    'track': track,
                     'esa_vector': esa_vector
                 })
         return artist_esa_vectors
@@ -85,28 +171,89 @@ def find_nearest_neighbors(text_vector, artist_vectors, n_neighbors=5):
     return indices
 
 
+_recommenders = {}
+
+
+def get_artist_recommender(artist_esa_vectors_file='esa_vectors_all_lyrics.csv'):
+    """
+    Per-process cached ArtistRecommender, so the catalog is parsed once rather than per request.
+    """
+    if artist_esa_vectors_file not in _recommenders:
+        _recommenders[artist_esa_vectors_file] = ArtistRecommender(artist_esa_vectors_file)
+    return _recommenders[artist_esa_vectors_file]
+
+
 class ArtistRecommender:
     """
     Recommender class to predict similar artists based on ESA vector similarity.
     """
 
-    def __init__(self, artist_esa_vectors_file='esa_vectors_all_lyrics.csv', n_neighbors=5):
+    def __init__(self, artist_esa_vectors_file='esa_vectors_all_lyrics.csv', n_neighbors=5,
+                 vector_dtype=ARTIST_VECTOR_DTYPE, rerank=False):
         """
         Initialise the recommender by loading artist ESA vectors.
 
         Parameters:
         -----------
         artist_esa_vectors_file : str
-            Path to the CSV file containing artist ESA vectors.
+            Path to the CSV file containing artist ESA vectors, or to the Parquet catalog.
         n_neighbors : int
             Number of unique artist recommendations to return.
+        vector_dtype : str
+            Storage of the pre-normalised vectors: "float64", "float32", "float16" or "int8".
+        rerank : bool
+            Keep the float64 unit vectors to re-rank the best quantised candidates exactly.
+        """
+        entries = [entry for entry in load_artist_esa_vectors(artist_esa_vectors_file) if len(entry['esa_vector']) > 0]
+
+        # Parse once into a matrix; keep only the (quantised) unit vectors and the names
+        vectors = np.array([np.asarray(entry['esa_vector'], dtype=np.float64).reshape(-1) for entry in entries])
+        self._set_vectors([entry['artist'] for entry in entries], vectors, n_neighbors, vector_dtype, rerank)
+
+    @classmethod
+    def from_vectors(cls, artist_names, vectors, n_neighbors=5, vector_dtype=ARTIST_VECTOR_DTYPE, rerank=False):
         """
+        Build a recommender from an already parsed vector matrix (e.g. a recommender snapshot).
+
+        Parameters:
+        -----------
+        artist_names : list of str
+            Artist name per vector row.
+        vectors : np.ndarray
+            One ESA vector per row.
+        n_neighbors, vector_dtype, rerank
+            As for the constructor.
+
+        Returns:
+        --------
+        ArtistRecommender
+            The recommender.
+        """
+        recommender = cls.__new__(cls)
+        recommender._set_vectors(list(artist_names), np.asarray(vectors, dtype=np.float64), n_neighbors,
+                                 vector_dtype, rerank)
+        return recommender
+
+    def _set_vectors(self, artist_names, vectors, n_neighbors, vector_dtype, rerank):
         self.n_neighbors = n_neighbors
-        self.artist_esa_entries = load_artist_esa_vectors(artist_esa_vectors_file)
+        self.artist_names = artist_names
+        self.artist_vectors = QuantizedVectors(vectors, dtype=vector_dtype)
+        self.exact_vectors = normalise_rows(vectors) if rerank and vector_dtype != "float64" else None
 
-        # Separate vectors and names for use in predictions
-        self.artist_vectors = [entry['esa_vector'] for entry in self.artist_esa_entries]
-        self.artist_names = [entry['artist'] for entry in self.artist_esa_entries]
+    def _unique_artists(self, indices, n_neighbors):
+        """
+        Keep only unique artist names, in ranking order.
+        """
+        seen = set()
+        unique_artists = []
+        for i in indices:
+            artist = self.artist_names[i]
+            if artist not in seen:
+                seen.add(artist)
+                unique_artists.append(artist)
+            if len(unique_artists) >= n_neighbors:
+                break
+        return unique_artists
 
     def predict(self, text_vector, n_neighbors=None):
         """
@@ -124,22 +271,29 @@ class ArtistRecommender:
         list of str
             Names of the most semantically similar artists.
         """
-        if n_neighbors is None:
-            n_neighbors = self.n_neighbors
+        return self.predict_batch([text_vector], n_neighbors)[0]
 
-        # Retrieve more neighbours than needed to filter out duplicates
-        indices = find_nearest_neighbors(text_vector, self.artist_vectors, n_neighbors * 3)
+    def predict_batch(self, text_vectors, n_neighbors=None):
+        """
+        Recommend artists for many ESA vectors, scoring all of them in one matrix product.
 
-        seen = set()
-        unique_artists = []
+        Parameters:
+        -----------
+        text_vectors : list of np.ndarray
+            ESA vectors of the input texts.
+        n_neighbors : int, optional
+            Number of unique artist recommendations per input (defaults to class setting).
 
-        # Keep only unique artist names
-        for i in indices[0]:
-            artist = self.artist_names[i]
-            if artist not in seen:
-                seen.add(artist)
-                unique_artists.append(artist)
-            if len(unique_artists) >= self.n_neighbors:
-                break
+        Returns:
+        --------
+        list of list of str
+            The most similar artists for each input vector, in input order.
+        """
+        if n_neighbors is None:
+            n_neighbors = self.n_neighbors
 
-        return unique_artists
+        text_vectors = np.array([np.asarray(vector, dtype=np.float64).reshape(-1) for vector in text_vectors])
+
+        # Retrieve more neighbours than needed to filter out duplicates
+        indices, _ = self.artist_vectors.top_k(text_vectors, k=n_neighbors * 3, exact_vectors=self.exact_vectors)
+        return [self._unique_artists(row, n_neighbors) for row in indices]
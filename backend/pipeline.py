@@ -0,0 +1,388 @@
+import os
+import time
+import logging
+import threading
+import numpy as np
+from collections import OrderedDict
+from contextlib import contextmanager
+from genius_handler import get_artist_top_tracks, GeniusTimeout
+from process_storyline import (segment_many_sentences, join_scenes, iter_scenes, stream_budgeted_scenes,
+                               resolve_segmenter, MAX_SCENES)
+from esa import generate_esa_vectors, generate_esa_vectors_batch, sentence_esa_vectors, segment_mean_vectors
+from recommender_snapshots import get_artist_recommender
+from generate_soundtrack import assign_songs_to_scenes
+from track_index import get_track_index
+from deadline import Deadline, DeadlineExceeded, DEADLINE_GENIUS_MIN_MS, DEADLINE_RESERVE_MS
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# Storylines longer than this are segmented with the bounded-memory streaming segmenter
+STREAMING_MIN_CHARS = int(os.getenv("STREAMING_MIN_CHARS", "20000"))
+# Artists whose live-fetched track vectors are kept for requests that cannot wait for Genius
+RECENT_ARTISTS = int(os.getenv("RECENT_ARTISTS", "256"))
+
+_recent_artist_tracks = OrderedDict()
+_recent_artist_tracks_lock = threading.Lock()
+
+
+def strip_lyrics_header(lyrics):
+    '''
+    Drop the Genius page header (contributors, title) that precedes the word "Lyrics".
+    '''
+    lyrics_start_index = lyrics.lower().find("lyrics")
+    if lyrics_start_index != -1:
+        lyrics = lyrics[lyrics_start_index + len("lyrics"):].strip()
+    return lyrics
+
+
+def assign_tracks(scenes, scene_esa_vectors, best_artist, top_track_names, tracks_esa_vectors, reuse_penalty=None):
+    '''
+    Assign tracks to scenes and build the per-scene response dictionary.
+    Args:
+        scenes (list): Scene texts.
+        scene_esa_vectors (list): ESA vector per scene.
+        best_artist (str): The chosen artist.
+        top_track_names (list): Candidate track names.
+        tracks_esa_vectors (list): ESA vector per candidate track.
+        reuse_penalty (float): Allow song reuse at this penalty (None for one song per scene).
+    Returns:
+        dict: The chosen artist and, per scene, its text, assigned song and similarity.
+    '''
+    # the sparse matcher pays off once there are more candidate tracks than scenes
+    mode = "sparse" if len(tracks_esa_vectors) > len(scenes) else "dense"
+    assignments, total_similarity, sim_matrix = assign_songs_to_scenes(
+        scene_esa_vectors, tracks_esa_vectors, mode=mode, reuse_penalty=reuse_penalty
+    )
+
+    output_dict = {"Chosen Artist": best_artist}
+    for scene_index, track_index in assignments:
+        # Fill in the output dictionary for each scene
+        output_dict[f"Scene {scene_index+1}"] = {
+            "scene_text": scenes[scene_index],
+            "assigned_song": top_track_names[track_index],
+            "similarity_to_song": float(sim_matrix[scene_index, track_index])
+        }
+    return output_dict
+
+
+def remember_artist_tracks(artist, track_names, tracks_esa_vectors):
+    '''
+    Keep the track names and ESA vectors of a complete live fetch (least recently used artists are dropped).
+    '''
+    with _recent_artist_tracks_lock:
+        _recent_artist_tracks[artist.strip().lower()] = (track_names, tracks_esa_vectors)
+        _recent_artist_tracks.move_to_end(artist.strip().lower())
+        while len(_recent_artist_tracks) > RECENT_ARTISTS:
+            _recent_artist_tracks.popitem(last=False)
+
+
+def fallback_tracks(artist, top_n):
+    '''
+    Candidate tracks of an artist without calling Genius: the tracks last fetched live for
+    the artist, else the artist's tracks in the catalog's track index.
+    Args:
+        artist (str): The artist.
+        top_n (int): The number of tracks wanted.
+    Returns:
+        tuple: Track names, their ESA vectors and the source ("cached_tracks" or "catalog_tracks"), or None.
+    '''
+    with _recent_artist_tracks_lock:
+        recent = _recent_artist_tracks.get(artist.strip().lower())
+    if recent is not None:
+        track_names, tracks_esa_vectors = recent
+        return track_names[:top_n], tracks_esa_vectors[:top_n], "cached_tracks"
+    index = get_track_index()
+    if index is not None:
+        track_names, vectors = index.artist_tracks(artist)
+        if track_names:
+            return track_names[:top_n], list(vectors[:top_n]), "catalog_tracks"
+    return None
+
+
+def fused_scene_vectors(story_segments, segmenters):
+    '''
+    Scene ESA vectors for segmented stories from a single ESA pass over their sentences:
+    every sentence is preprocessed and vectorised once, and each scene vector is the mean of
+    its sentence vectors (via prefix sums). Stories segmented with the "esa" backend reuse
+    the sentence vectors computed for segmentation.
+    Args:
+        story_segments (list): (sentences, scene_starts, embeddings) per story, from segment_many_sentences.
+        segmenters (list): Segmentation backend used for each story.
+    Returns:
+        list: Scene ESA vectors per story, or None if the compiled ESA model is missing.
+    '''
+    backends = [resolve_segmenter(segmenter)[0] for segmenter in segmenters]
+    pending = [i for i, backend in enumerate(backends) if backend != "esa" and story_segments[i][0]]
+    vectors = sentence_esa_vectors([sentence for i in pending for sentence in story_segments[i][0]])
+    if vectors is None:
+        return None
+
+    sentence_vectors = {}
+    start = 0
+    for i in pending:
+        end = start + len(story_segments[i][0])
+        sentence_vectors[i] = vectors[start:end]
+        start = end
+
+    scene_vectors = []
+    for i, (sentences, scene_starts, embeddings) in enumerate(story_segments):
+        if not sentences:
+            scene_vectors.append([])
+            continue
+        story_vectors = embeddings if backends[i] == "esa" else sentence_vectors[i]
+        scene_vectors.append(list(segment_mean_vectors(story_vectors, scene_starts)))
+    return scene_vectors
+
+
+class PipelineRun:
+    '''
+    Book-keeping for one pipeline run: times each stage (and records it as a trace span)
+    and reports its partial results.
+    '''
+
+    def __init__(self, on_stage=None, profiler=None):
+        '''
+        Args:
+            on_stage (callable): Optional callback on_stage(stage_name, elapsed_seconds, partial_results).
+            profiler (profiling.RequestProfiler): Optional profiler to run each stage under.
+        '''
+        self.on_stage = on_stage
+        self.profiler = profiler
+        self.times = {}
+
+    @contextmanager
+    def stage(self, name):
+        '''
+        Time the enclosed block as stage `name`. Yields a dict the stage can fill with partial results.
+        '''
+        partial = {}
+        start = time.time()
+        with tracer.start_as_current_span(name):
+            if self.profiler is None:
+                yield partial
+            else:
+                with self.profiler.stage(name):
+                    yield partial
+        self.times[name] = time.time() - start
+        if self.on_stage is not None:
+            self.on_stage(name, self.times[name], partial)
+
+
+def run_soundtrack_pipeline(storyline, artist=None, candidate_pool=None, reuse_penalty=None, segmenter=None,
+                            max_scenes=None, target_scenes=None, deadline_ms=None, deadline_start=None, on_stage=None,
+                            profiler=None):
+    '''
+    Run the soundtrack pipeline for one storyline.
+    Performs the following steps:
+    1. Splits the storyline into scenes.
+    2. Generates ESA vectors for each scene.
+    3. Generates ESA vector for the entire story.
+    4. Recommends an artist based on the story ESA vector.
+    5. Retrieves the top tracks of the recommended artist.
+    6. Extracts the lyrics of the top tracks.
+    7. Generates ESA vectors for the top tracks.
+    8. Assigns the top tracks to the scenes based on similarity.
+
+    With a deadline, the run degrades instead of running past it: the scene count is capped to
+    what the budget can soundtrack, the Genius fetch is cut off (cancelling its outstanding requests)
+    before the budget runs out, and with too little budget left for Genius the artist's cached or
+    catalog track vectors are used instead. The response then lists the degradations and stage times.
+    Args:
+        storyline (str): The storyline to soundtrack.
+        artist (str): Optional artist to take the songs from.
+        candidate_pool (int): Number of artist tracks to choose from (defaults to one per scene).
+        reuse_penalty (float): Allow song reuse at this penalty.
+        segmenter (str): Scene segmentation backend, "minilm" or "esa" (defaults to SEGMENTER_BACKEND).
+        max_scenes (int): Scene budget (defaults to MAX_SCENES).
+        target_scenes (int): Split into exactly this many scenes.
+        deadline_ms (float): Optional latency budget in milliseconds.
+        deadline_start (float): time.monotonic() at which the budget started, e.g. on request arrival (defaults to now).
+        on_stage (callable): Optional callback receiving each stage's name, time and partial results.
+        profiler (profiling.RequestProfiler): Optional per-stage profiler for this run.
+    Returns:
+        tuple: The response dictionary and the time taken by each step.
+    Raises:
+        DeadlineExceeded: If the budget ran out before any candidate track was found.
+    '''
+    run = PipelineRun(on_stage, profiler)
+    deadline = Deadline(deadline_ms, deadline_start)
+
+    with run.stage("scene_split_time") as partial:
+        scene_cap = deadline.scene_cap()
+        capped = scene_cap is not None and scene_cap < (max_scenes or MAX_SCENES or float("inf"))
+        if capped:
+            max_scenes = scene_cap
+            target_scenes = min(target_scenes, scene_cap) if target_scenes else None
+        if len(storyline) > STREAMING_MIN_CHARS:
+            segments = None
+            if max_scenes or target_scenes or MAX_SCENES:
+                # the budget's dynamic program only needs the adjacent similarities, computed batch by batch
+                scenes = stream_budgeted_scenes(storyline, backend=segmenter, max_scenes=max_scenes,
+                                                target_scenes=target_scenes)
+            else:
+                scenes = list(iter_scenes(storyline, backend=segmenter))
+        else:
+            segments = segment_many_sentences([storyline], backend=segmenter, max_scenes=max_scenes,
+                                              target_scenes=target_scenes)
+            scenes = join_scenes(*segments[0][:2])
+        if capped and len(scenes) >= scene_cap:
+            deadline.degrade("scene_cap", f"at most {scene_cap} scenes")
+        partial["scenes"] = scenes
+
+    with run.stage("esa_vector_generation_time"):
+        scene_esa_vectors = fused_scene_vectors(segments, [segmenter]) if segments else None
+        if scene_esa_vectors is not None:
+            scene_esa_vectors = scene_esa_vectors[0]
+        else:
+            scene_esa_vectors = [np.array(generate_esa_vectors(scene)) for scene in scenes]
+
+    with run.stage("story_esa_vector_time"):
+        # the story vector only feeds the recommender, which does not run when an artist is given
+        story_esa_vector = np.mean(scene_esa_vectors, axis=0) if not artist else None
+
+    with run.stage("artist_recommendation_time") as partial:
+        if not artist:
+            best_artists = get_artist_recommender().predict(story_esa_vector)
+            best_artist = best_artists[0]
+        else:
+            best_artist = artist
+        partial["artist"] = best_artist
+
+    with run.stage("top_tracks_retrieval_time") as partial:
+        top_n = max(len(scenes), candidate_pool or 0)
+        top_tracks, fallback, complete = [], None, False
+        if deadline.remaining_ms() < DEADLINE_GENIUS_MIN_MS:
+            fallback = fallback_tracks(best_artist, top_n)
+        if fallback is None:
+            try:
+                top_tracks = get_artist_top_tracks(best_artist, top_n=top_n,
+                                                   timeout=deadline.timeout(DEADLINE_RESERVE_MS))
+                complete = True
+            except GeniusTimeout as e:
+                deadline.degrade("genius_cancelled", f"{e.cancelled} outstanding Genius request(s) cancelled")
+                top_tracks = e.tracks
+                fallback = fallback_tracks(best_artist, top_n)
+                if fallback is not None and len(fallback[0]) <= len(top_tracks):
+                    fallback = None
+                if fallback is None:
+                    if not top_tracks:
+                        raise DeadlineExceeded(f"No tracks of {best_artist} could be fetched within {deadline_ms:.0f} ms.")
+                    deadline.degrade("partial_tracks", f"{len(top_tracks)} of {top_n} tracks fetched in time")
+        if fallback is not None:
+            top_track_names, tracks_esa_vectors, source = fallback
+            deadline.degrade(source, f"{len(top_track_names)} track(s) of {best_artist} used instead of live Genius")
+        partial["tracks"] = top_track_names if fallback is not None else [track[1] for track in top_tracks]
+
+    with run.stage("top_track_lyrics_extraction_time"):
+        if fallback is None:
+            top_track_names = [track[1] for track in top_tracks]
+            top_track_lyrics = [strip_lyrics_header(track[2]) for track in top_tracks]
+
+    with run.stage("tracks_esa_vector_generation_time"):
+        if fallback is None:
+            tracks_esa_vectors = [np.array(generate_esa_vectors(lyrics)) for lyrics in top_track_lyrics]
+            if complete and top_track_names:
+                remember_artist_tracks(best_artist, top_track_names, tracks_esa_vectors)
+
+    with run.stage("song_assignment_time"):
+        output_dict = assign_tracks(scenes, scene_esa_vectors, best_artist, top_track_names, tracks_esa_vectors, reuse_penalty)
+
+    if deadline.bounded:
+        output_dict["Degradations"] = deadline.degradations
+        output_dict["Stage Times"] = run.times
+    return output_dict, run.times
+
+
+def run_soundtrack_batch(requests):
+    '''
+    Run the soundtrack pipeline for many storylines, sharing work between them:
+    one sentence-encoder call for all storylines, one ESA transform for all sentences,
+    one recommender matrix product for all story vectors, and one Genius fetch and
+    ESA pass per distinct artist.
+    Args:
+        requests (list): Objects with storyline, artist, candidate_pool, reuse_penalty, segmenter,
+            max_scenes and target_scenes attributes.
+    Returns:
+        tuple: The per-storyline results in request order, and a batch throughput report.
+    '''
+    run = PipelineRun()
+    t_start = time.time()
+
+    # One encoder call per segmentation setting used in the batch
+    with run.stage("scene_split_time"):
+        story_segments = [None] * len(requests)
+        setting_groups = {}
+        for i, request in enumerate(requests):
+            setting_groups.setdefault((request.segmenter, request.max_scenes, request.target_scenes), []).append(i)
+        for (backend, max_scenes, target_scenes), indices in setting_groups.items():
+            group_segments = segment_many_sentences([requests[i].storyline for i in indices], backend=backend,
+                                                    max_scenes=max_scenes, target_scenes=target_scenes)
+            for i, segments in zip(indices, group_segments):
+                story_segments[i] = segments
+        story_scenes = [join_scenes(sentences, scene_starts) for sentences, scene_starts, _ in story_segments]
+
+    with run.stage("esa_vector_generation_time"):
+        all_scenes = [scene for scenes in story_scenes for scene in scenes]
+        story_scene_vectors = fused_scene_vectors(story_segments, [request.segmenter for request in requests])
+        if story_scene_vectors is None:
+            all_scene_vectors = [np.array(vector) for vector in generate_esa_vectors_batch(all_scenes)]
+            story_scene_vectors = []
+            start = 0
+            for scenes in story_scenes:
+                story_scene_vectors.append(all_scene_vectors[start:start + len(scenes)])
+                start += len(scenes)
+
+    with run.stage("artist_recommendation_time"):
+        artists = [request.artist for request in requests]
+        needs_recommendation = [i for i, request in enumerate(requests) if not request.artist and story_scenes[i]]
+        if needs_recommendation:
+            story_vectors = [np.mean(story_scene_vectors[i], axis=0) for i in needs_recommendation]
+            recommendations = get_artist_recommender().predict_batch(story_vectors)
+            for i, best_artists in zip(needs_recommendation, recommendations):
+                artists[i] = best_artists[0]
+
+    # Fetch each distinct artist once, with enough tracks for its largest storyline
+    with run.stage("top_tracks_retrieval_time"):
+        tracks_needed = {}
+        for i, request in enumerate(requests):
+            if artists[i]:
+                needed = max(len(story_scenes[i]), request.candidate_pool or 0)
+                tracks_needed[artists[i]] = max(tracks_needed.get(artists[i], 0), needed)
+        artist_tracks = {artist: get_artist_top_tracks(artist, top_n=top_n) for artist, top_n in tracks_needed.items()}
+
+    with run.stage("tracks_esa_vector_generation_time"):
+        track_artists = [artist for artist, tracks in artist_tracks.items() for _ in tracks]
+        track_lyrics = [strip_lyrics_header(track[2]) for tracks in artist_tracks.values() for track in tracks]
+        track_vectors = [np.array(vector) for vector in generate_esa_vectors_batch(track_lyrics)]
+        artist_track_vectors = {artist: [] for artist in artist_tracks}
+        for artist, vector in zip(track_artists, track_vectors):
+            artist_track_vectors[artist].append(vector)
+
+    with run.stage("song_assignment_time"):
+        results = []
+        for i, request in enumerate(requests):
+            try:
+                if not story_scenes[i]:
+                    raise ValueError("Storyline contains no sentences.")
+                tracks = artist_tracks.get(artists[i], [])
+                if not tracks:
+                    raise ValueError(f"No tracks found for artist {artists[i]}.")
+                results.append(assign_tracks(
+                    story_scenes[i], story_scene_vectors[i], artists[i],
+                    [track[1] for track in tracks], artist_track_vectors[artists[i]], request.reuse_penalty
+                ))
+            except Exception as e:
+                logger.error(f"Error generating soundtrack for storyline {i} of the batch: {e}")
+                results.append({"error": str(e)})
+
+    total_time = time.time() - t_start
+    report = {
+        "storylines": len(requests),
+        "scenes": len(all_scenes),
+        "distinct_artists": len(artist_tracks),
+        "total_time": total_time,
+        "storylines_per_second": len(requests) / total_time if total_time > 0 else None,
+        "stage_times": run.times,
+    }
+    return results, report
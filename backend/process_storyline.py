@@ -4,6 +4,7 @@ nltk.download("punkt")
 nltk.download("wordnet")
 nltk.download("stopwords")
 
+import os
 import json
 import logging
 import numpy as np
@@ -12,17 +13,162 @@ from nltk.tokenize import sent_tokenize, word_tokenize
 from nltk.corpus import stopwords
 from nltk.stem import WordNetLemmatizer
 from sklearn.metrics.pairwise import cosine_similarity
-from sentence_transformers import SentenceTransformer
+from quantization import normalise_rows
+from thread_budget import PIPELINE_THREADS, limit_torch_threads
 
-# Load the Sentence-BERT model for semantic similarity
-model = SentenceTransformer('all-MiniLM-L6-v2')
+# Sentence embeddings used to find scene boundaries:
+# - "minilm": the all-MiniLM-L6-v2 Sentence-BERT model (default, best boundaries)
+# - "esa": ESA concept vectors from the compiled ESA model; no torch, much cheaper per sentence
+SEGMENTER_BACKENDS = ("minilm", "esa")
+SEGMENTER_BACKEND = os.getenv("SEGMENTER_BACKEND", "minilm")
 
-# Logging setup
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    filename='debug.log'
-)
+# Default split threshold per backend; ESA similarities between adjacent sentences run much lower
+SEGMENTER_THRESHOLDS = {
+    "minilm": 0.7,
+    "esa": float(os.getenv("ESA_SEGMENTER_THRESHOLD", "0.2")),
+}
+
+# Deployment-wide cap on scenes per storyline (0 = no cap); bounds the Genius and ESA fan-out per request
+MAX_SCENES = int(os.getenv("MAX_SCENES", "0"))
+
+# CPU inference settings for the MiniLM backend
+MINILM_QUANTIZE = os.getenv("MINILM_QUANTIZE", "0") == "1"            # int8 dynamic quantisation of the linear layers
+MINILM_THREADS = int(os.getenv("MINILM_THREADS", "0"))                 # torch intra-op threads (0 = PIPELINE_THREADS)
+MINILM_TOKEN_BUDGET = int(os.getenv("MINILM_TOKEN_BUDGET", "4096"))    # padded tokens per batch (0 = fixed-size batches)
+
+_sentence_model = None
+
+
+def load_sentence_model(quantize=MINILM_QUANTIZE, threads=MINILM_THREADS):
+    """
+    Load the Sentence-BERT model for CPU inference and run one warm-up encode.
+
+    Parameters:
+    -----------
+    quantize : bool
+        Apply int8 dynamic quantisation to the linear layers.
+    threads : int
+        Torch intra-op threads; 0 uses each pipeline's share of the core budget (thread_budget.py).
+
+    Returns:
+    --------
+    SentenceTransformer
+        The loaded model.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    threads = threads or PIPELINE_THREADS
+    limit_torch_threads(threads)
+
+    model = SentenceTransformer('all-MiniLM-L6-v2', device="cpu")
+    if quantize:
+        import torch
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    # The first forward pass allocates buffers and picks kernels; keep that out of the first request
+    model.encode(["warm up"])
+    logging.info(f"Loaded MiniLM (quantize={quantize}, threads={threads}).")
+    return model
+
+
+def get_sentence_model():
+    """
+    The Sentence-BERT model, loaded on first use so the ESA backend never imports torch.
+    """
+    global _sentence_model
+    if _sentence_model is None:
+        _sentence_model = load_sentence_model()
+    return _sentence_model
+
+
+def encode_length_bucketed(model, sentences, token_budget=MINILM_TOKEN_BUDGET):
+    """
+    Encode sentences in batches of similar token length, capped at `token_budget` padded tokens.
+
+    Sorting by length keeps padding (wasted compute) low, and the token budget lets batches of
+    short sentences grow large while batches of long sentences stay small.
+
+    Parameters:
+    -----------
+    model : SentenceTransformer
+        The sentence encoder.
+    sentences : list of str
+        Sentences to encode.
+    token_budget : int
+        Maximum batch size times longest sentence length, in tokens.
+
+    Returns:
+    --------
+    np.ndarray
+        One embedding per sentence, in input order.
+    """
+    token_ids = model.tokenizer(sentences, add_special_tokens=True, truncation=True,
+                                max_length=model.max_seq_length)["input_ids"]
+    lengths = np.array([len(ids) for ids in token_ids])
+    order = np.argsort(lengths, kind="stable")
+    embeddings = np.empty((len(sentences), model.get_sentence_embedding_dimension()), dtype=np.float32)
+
+    def encode(batch):
+        embeddings[batch] = model.encode([sentences[i] for i in batch], batch_size=len(batch))
+
+    batch = []
+    for index in order:
+        # Ascending order: the sentence being added is the longest in the batch
+        if batch and (len(batch) + 1) * lengths[index] > token_budget:
+            encode(batch)
+            batch = []
+        batch.append(index)
+    if batch:
+        encode(batch)
+    return embeddings
+
+
+def resolve_segmenter(backend=None, similarity_threshold=None):
+    """
+    Fill in the deployment default backend and that backend's default threshold.
+
+    Returns:
+    --------
+    tuple
+        (backend, similarity_threshold)
+    """
+    backend = backend or SEGMENTER_BACKEND
+    if backend not in SEGMENTER_BACKENDS:
+        raise ValueError(f"Unknown segmenter backend: {backend}")
+    if similarity_threshold is None:
+        similarity_threshold = SEGMENTER_THRESHOLDS[backend]
+    return backend, similarity_threshold
+
+
+def encode_sentences(sentences, backend="minilm", batch_size=32):
+    """
+    Embed sentences with the chosen segmentation backend.
+
+    Parameters:
+    -----------
+    sentences : list of str
+        Sentences to embed.
+    backend : str
+        One of SEGMENTER_BACKENDS.
+    batch_size : int
+        Sentences per Sentence-BERT forward pass (when MINILM_TOKEN_BUDGET is 0).
+
+    Returns:
+    --------
+    np.ndarray
+        One embedding per sentence.
+    """
+    if backend == "esa":
+        from esa import preprocess_text
+        from esa_model import get_esa_model
+
+        esa_model = get_esa_model()
+        if esa_model is None:
+            raise RuntimeError("The esa segmenter needs the compiled ESA model (run dvc_compile_esa_model.py).")
+        return esa_model.transform([preprocess_text(sentence) for sentence in sentences])
+    if MINILM_TOKEN_BUDGET > 0:
+        return encode_length_bucketed(get_sentence_model(), sentences)
+    return get_sentence_model().encode(sentences, batch_size=batch_size)
 
 
 def clean_text(text):
@@ -100,7 +246,8 @@ def lemmatize_corpus(output_file="./corpus/lemmatized_corpus.json"):
         logging.error(f"Failed to save lemmatized corpus: {e}")
 
 
-def split_into_scenes(text, similarity_threshold=0.7, min_scene_length=2):
+def split_into_scenes(text, similarity_threshold=None, min_scene_length=2, backend=None, max_scenes=None,
+                      target_scenes=None):
     """
     Segment a story into scenes based on semantic similarity between adjacent sentences.
 
@@ -109,35 +256,442 @@ def split_into_scenes(text, similarity_threshold=0.7, min_scene_length=2):
     text : str
         The full story or synopsis to segment.
     similarity_threshold : float
-        Similarity value below which a scene is split.
+        Similarity value below which a scene is split (defaults to the backend's threshold).
     min_scene_length : int
         Minimum number of sentences in a scene before allowing a split.
+    backend : str
+        Sentence embedding backend, one of SEGMENTER_BACKENDS (defaults to SEGMENTER_BACKEND).
+    max_scenes : int
+        Scene budget: if the threshold rule gives more scenes, the best boundaries under the
+        budget are chosen instead (defaults to MAX_SCENES; 0 or None for no budget).
+    target_scenes : int
+        Split into exactly this many scenes (fewer if the story is too short); overrides max_scenes.
 
     Returns:
     --------
     list of str
         List of segmented scenes (as text blocks).
     """
-    sentences = sent_tokenize(clean_text(text))
-    embeddings = model.encode(sentences)
+    sentences, scene_starts, _ = segment_sentences(text, similarity_threshold, min_scene_length, backend,
+                                                   max_scenes, target_scenes)
+    return join_scenes(sentences, scene_starts)
 
-    scenes = []
-    current_scene = [sentences[0]]
 
-    for i in range(1, len(sentences)):
-        sim = cosine_similarity([embeddings[i]], [embeddings[i - 1]])[0][0]
+def segment_sentences(text, similarity_threshold=None, min_scene_length=2, backend=None, max_scenes=None,
+                      target_scenes=None):
+    """
+    Split a story into sentences and find its scenes, without re-joining them into text.
 
-        # Start a new scene if similarity drops and scene length is enough
-        if sim < similarity_threshold and len(current_scene) >= min_scene_length:
-            scenes.append(' '.join(current_scene))
-            current_scene = [sentences[i]]
-        else:
-            current_scene.append(sentences[i])
+    Parameters:
+    -----------
+    text : str
+        The full story or synopsis to segment.
+    similarity_threshold, min_scene_length, backend, max_scenes, target_scenes
+        As for `split_into_scenes`.
+
+    Returns:
+    --------
+    sentences : list of str
+        The story's sentences.
+    scene_starts : list of int
+        Index of the first sentence of every scene (empty if there are no sentences).
+    embeddings : np.ndarray
+        The backend's sentence embeddings (ESA sentence vectors for the "esa" backend).
+    """
+    return segment_many_sentences([text], similarity_threshold, min_scene_length, backend, max_scenes,
+                                  target_scenes)[0]
+
+
+def segment_many_sentences(texts, similarity_threshold=None, min_scene_length=2, backend=None, max_scenes=None,
+                           target_scenes=None):
+    """
+    `segment_sentences` for several stories, encoding the sentences of all of them in one model call.
+
+    Returns:
+    --------
+    list of tuple
+        (sentences, scene_starts, embeddings) per story, in input order.
+    """
+    backend, similarity_threshold = resolve_segmenter(backend, similarity_threshold)
+    story_sentences = [sent_tokenize(clean_text(text)) for text in texts]
+    all_sentences = [sentence for sentences in story_sentences for sentence in sentences]
+    embeddings = encode_sentences(all_sentences, backend) if all_sentences else np.zeros((0, 0))
+
+    segmented = []
+    start = 0
+    for sentences in story_sentences:
+        end = start + len(sentences)
+        story_embeddings = embeddings[start:end]
+        scene_starts = find_scene_starts(story_embeddings, similarity_threshold, min_scene_length, max_scenes,
+                                         target_scenes) if sentences else []
+        segmented.append((sentences, scene_starts, story_embeddings))
+        start = end
+    return segmented
+
+
+def find_scene_starts(embeddings, similarity_threshold, min_scene_length=2, max_scenes=None, target_scenes=None):
+    """
+    Index of the first sentence of every scene: the threshold rule, or the budgeted dynamic
+    program when a target is given or the threshold rule exceeds the scene budget.
+    """
+    return scene_starts(adjacent_similarities(embeddings), similarity_threshold, min_scene_length, max_scenes,
+                        target_scenes)
+
+
+def scene_starts(similarities, similarity_threshold, min_scene_length=2, max_scenes=None, target_scenes=None):
+    """
+    `find_scene_starts` from the adjacent sentence similarities alone (see `adjacent_similarities`).
+    """
+    if max_scenes is None:
+        max_scenes = MAX_SCENES
+    if target_scenes:
+        return [0] + budgeted_boundaries(similarities, target_scenes, similarity_threshold, min_scene_length,
+                                         exact=True)
+    boundaries = threshold_boundaries(similarities, similarity_threshold, min_scene_length)
+    if max_scenes and len(boundaries) + 1 > max_scenes:
+        boundaries = budgeted_boundaries(similarities, max_scenes, similarity_threshold, min_scene_length)
+    return [0] + boundaries
+
+
+def join_scenes(sentences, scene_starts):
+    """
+    Scene texts from sentences and the index of each scene's first sentence.
+    """
+    ends = scene_starts[1:] + [len(sentences)]
+    return [' '.join(sentences[start:end]) for start, end in zip(scene_starts, ends)]
+
+
+def compute_average_dissimilarity(scene_embeddings):
+    """
+    Computes the average dissimilarity between all pairs of scene embeddings.
+
+    Dissimilarity is defined as (1 - cosine similarity), and self-similarity is excluded.
+
+    Parameters:
+    -----------
+    scene_embeddings : list of np.ndarray
+        A list of ESA-based semantic vectors representing each scene.
+
+    Returns:
+    --------
+    float
+        The average pairwise dissimilarity score across all scenes.
+    """
+    # Compute pairwise cosine similarity matrix
+    similarity_matrix = cosine_similarity(scene_embeddings)
+
+    # Convert to dissimilarity matrix
+    dissimilarity_matrix = 1 - similarity_matrix
+
+    # Ignore self-comparisons (diagonal) for averaging
+    np.fill_diagonal(dissimilarity_matrix, 0)
+
+    return np.mean(dissimilarity_matrix)
+
+
+def iter_sentences(source, window_size=65536):
+    """
+    Yield the sentences of a text, reading it in fixed-size windows instead of tokenising it whole.
+
+    Parameters:
+    -----------
+    source : str or iterable of str
+        The text, or an iterable of text chunks (e.g. an open file).
+    window_size : int
+        Number of characters tokenised at a time when `source` is a string.
+
+    Yields:
+    -------
+    str
+        Cleaned sentences in order.
+    """
+    if isinstance(source, str):
+        text = source
+        source = (text[i:i + window_size] for i in range(0, len(text), window_size))
+
+    carry = ""
+    for chunk in source:
+        buffer = carry + chunk
+        sentences = sent_tokenize(clean_text(buffer))
+        if not sentences:
+            carry = buffer
+            continue
+        # The last sentence may continue in the next window, so hold it back
+        yield from sentences[:-1]
+        carry = sentences[-1] + (" " if buffer[-1:].isspace() else "")
+
+    yield from sent_tokenize(clean_text(carry))
+
+
+def iter_scenes(source, similarity_threshold=None, min_scene_length=2, batch_size=64, window_size=65536, backend=None):
+    """
+    Streaming version of `split_into_scenes` with memory bounded by the batch and scene sizes.
+
+    Sentences are read in windows and encoded in fixed-size batches; only the previous
+    sentence embedding and the current scene are kept, and each scene is yielded as soon
+    as its boundary is found.
+
+    Parameters:
+    -----------
+    source : str or iterable of str
+        The story, or an iterable of text chunks.
+    similarity_threshold : float
+        Similarity value below which a scene is split (defaults to the backend's threshold).
+    min_scene_length : int
+        Minimum number of sentences in a scene before allowing a split.
+    batch_size : int
+        Number of sentences encoded per model call.
+    window_size : int
+        Number of characters read at a time.
+    backend : str
+        Sentence embedding backend, one of SEGMENTER_BACKENDS (defaults to SEGMENTER_BACKEND).
+
+    Yields:
+    -------
+    str
+        Scenes (as text blocks) in order.
+    """
+    backend, similarity_threshold = resolve_segmenter(backend, similarity_threshold)
+    current_scene = []
+    previous_embedding = None
+
+    def flush(batch):
+        nonlocal current_scene, previous_embedding
+        embeddings = encode_sentences(batch, backend, batch_size)
+        for sentence, embedding in zip(batch, embeddings):
+            if previous_embedding is not None:
+                sim = cosine_similarity([embedding], [previous_embedding])[0][0]
+                # Start a new scene if similarity drops and scene length is enough
+                if sim < similarity_threshold and len(current_scene) >= min_scene_length:
+                    yield ' '.join(current_scene)
+                    current_scene = []
+            current_scene.append(sentence)
+            previous_embedding = embedding
+
+    batch = []
+    for sentence in iter_sentences(source, window_size):
+        batch.append(sentence)
+        if len(batch) == batch_size:
+            yield from flush(batch)
+            batch = []
+    if batch:
+        yield from flush(batch)
 
     if current_scene:
-        scenes.append(' '.join(current_scene))
+        yield ' '.join(current_scene)
+
+
+def stream_similarities(source, backend=None, batch_size=64, window_size=65536):
+    """
+    Sentences of a story and the similarity of each with the previous one, encoded batch by batch.
+
+    Only one batch of embeddings (and the last embedding before it) is held at a time, so the
+    memory beyond the sentences themselves is one float per sentence.
+
+    Parameters:
+    -----------
+    source : str or iterable of str
+        The story, or an iterable of text chunks.
+    backend : str
+        Sentence embedding backend, one of SEGMENTER_BACKENDS (defaults to SEGMENTER_BACKEND).
+    batch_size : int
+        Number of sentences encoded per model call.
+    window_size : int
+        Number of characters read at a time.
+
+    Returns:
+    --------
+    tuple
+        The sentences, and an np.ndarray of len(sentences) - 1 similarities as from `adjacent_similarities`.
+    """
+    backend, _ = resolve_segmenter(backend)
+    sentences, similarities = [], []
+    previous_embedding = None
+
+    def flush(batch):
+        nonlocal previous_embedding
+        embeddings = np.asarray(encode_sentences(batch, backend, batch_size))
+        if previous_embedding is not None:
+            embeddings = np.vstack([previous_embedding[None, :], embeddings])
+        similarities.append(adjacent_similarities(embeddings))
+        previous_embedding = embeddings[-1]
+
+    batch = []
+    for sentence in iter_sentences(source, window_size):
+        sentences.append(sentence)
+        batch.append(sentence)
+        if len(batch) == batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    return sentences, np.concatenate(similarities) if similarities else np.zeros(0)
+
+
+def stream_budgeted_scenes(source, similarity_threshold=None, min_scene_length=2, batch_size=64, window_size=65536,
+                           backend=None, max_scenes=None, target_scenes=None):
+    """
+    Scenes of a long story under a scene budget, without holding its sentence embeddings.
+
+    The budgeted dynamic program only needs the adjacent sentence similarities, which are
+    computed batch by batch (see `stream_similarities`); the scenes are the same as from
+    `split_into_scenes` with the same budget.
+
+    Parameters:
+    -----------
+    source : str or iterable of str
+        The story, or an iterable of text chunks.
+    similarity_threshold : float
+        Similarity value below which a scene is split (defaults to the backend's threshold).
+    min_scene_length : int
+        Minimum number of sentences in a scene before allowing a split.
+    batch_size : int
+        Number of sentences encoded per model call.
+    window_size : int
+        Number of characters read at a time.
+    backend : str
+        Sentence embedding backend, one of SEGMENTER_BACKENDS (defaults to SEGMENTER_BACKEND).
+    max_scenes : int
+        Scene budget (defaults to MAX_SCENES; 0 or None for no budget).
+    target_scenes : int
+        Split into exactly this many scenes, if the story is long enough.
+
+    Returns:
+    --------
+    list of str
+        Scenes (as text blocks) in order.
+    """
+    backend, similarity_threshold = resolve_segmenter(backend, similarity_threshold)
+    sentences, similarities = stream_similarities(source, backend, batch_size, window_size)
+    if not sentences:
+        return []
+    return join_scenes(sentences, scene_starts(similarities, similarity_threshold, min_scene_length, max_scenes,
+                                               target_scenes))
+
+
+def scene_boundaries(embeddings, similarity_threshold=0.7, min_scene_length=2):
+    """
+    Indices of the sentences that start a new scene (see `split_into_scenes`).
+
+    Parameters:
+    -----------
+    embeddings : np.ndarray
+        One embedding per sentence, in order.
+    similarity_threshold : float
+        Similarity value below which a scene is split.
+    min_scene_length : int
+        Minimum number of sentences in a scene before allowing a split.
+
+    Returns:
+    --------
+    list of int
+        Sentence indices where a new scene starts (the first scene's 0 is not included).
+    """
+    return threshold_boundaries(adjacent_similarities(embeddings), similarity_threshold, min_scene_length)
+
+
+def threshold_boundaries(similarities, similarity_threshold=0.7, min_scene_length=2):
+    """
+    `scene_boundaries` from the adjacent sentence similarities alone (see `adjacent_similarities`).
+    """
+    boundaries = []
+    scene_start = 0
+
+    for i in range(1, len(similarities) + 1):
+        # Start a new scene if similarity drops and scene length is enough
+        if similarities[i - 1] < similarity_threshold and i - scene_start >= min_scene_length:
+            boundaries.append(i)
+            scene_start = i
+
+    return boundaries
+
+
+def adjacent_similarities(embeddings):
+    """
+    Cosine similarity of every sentence embedding with the previous one (0 for zero vectors).
+
+    Returns:
+    --------
+    np.ndarray
+        Array of length len(embeddings) - 1; entry i - 1 compares sentences i - 1 and i.
+    """
+    if len(embeddings) < 2:
+        return np.zeros(0)
+    unit = normalise_rows(embeddings)
+    return np.einsum("ij,ij->i", unit[1:], unit[:-1])
+
+
+def budgeted_scene_boundaries(embeddings, n_scenes, similarity_threshold=0.7, min_scene_length=2, exact=False):
+    """
+    Best scene boundaries under a scene budget, by dynamic programming over adjacent similarities.
+
+    A boundary before sentence i scores `similarity_threshold - sim(i - 1, i)`, so cuts at the
+    biggest similarity drops score highest and cuts above the threshold score negative. The
+    program picks the highest-scoring set of boundaries with at most `n_scenes` scenes (exactly
+    `n_scenes` if `exact`) of at least `min_scene_length` sentences each, in O(n_scenes * n) time.
+
+    Parameters:
+    -----------
+    embeddings : np.ndarray
+        One embedding per sentence, in order.
+    n_scenes : int
+        Maximum (or, with `exact`, target) number of scenes.
+    similarity_threshold : float
+        Similarity below which a boundary is worth taking.
+    min_scene_length : int
+        Minimum number of sentences per scene.
+    exact : bool
+        Produce exactly `n_scenes` scenes, or as many as the story's length allows.
+
+    Returns:
+    --------
+    list of int
+        Sentence indices where a new scene starts (the first scene's 0 is not included).
+    """
+    return budgeted_boundaries(adjacent_similarities(embeddings), n_scenes, similarity_threshold, min_scene_length,
+                               exact)
+
+
+def budgeted_boundaries(similarities, n_scenes, similarity_threshold=0.7, min_scene_length=2, exact=False):
+    """
+    `budgeted_scene_boundaries` from the adjacent sentence similarities alone (see `adjacent_similarities`),
+    so the embeddings need not be held (see `stream_budgeted_scenes`).
+    """
+    n = len(similarities) + 1
+    min_len = max(1, min_scene_length)
+    max_segments = min(n_scenes, n // min_len)
+    if max_segments <= 1:
+        return []
+
+    # gain[p]: score of starting a scene at sentence p (only 1..n-1 are valid cut positions)
+    gain = np.full(n + 1, -np.inf)
+    gain[1:n] = similarity_threshold - similarities
+
+    # best[j, i]: best score splitting sentences [0, i) into j scenes; start[j, i]: start of the last one
+    best = np.full((max_segments + 1, n + 1), -np.inf)
+    start = np.zeros((max_segments + 1, n + 1), dtype=np.int64)
+    best[1, min_len:] = 0.0
+    positions = np.arange(n + 1)
+    for j in range(2, max_segments + 1):
+        candidate = best[j - 1] + gain
+        running_max = np.maximum.accumulate(candidate)
+        running_arg = np.maximum.accumulate(np.where(candidate == running_max, positions, 0))
+        ends = np.arange(j * min_len, n + 1)
+        best[j, ends] = running_max[ends - min_len]
+        start[j, ends] = running_arg[ends - min_len]
+
+    if exact:
+        n_segments = max_segments
+    else:
+        # ties go to fewer scenes
+        n_segments = int(np.argmax(best[1:, n])) + 1
 
-    return scenes
+    boundaries = []
+    end = n
+    for j in range(n_segments, 1, -1):
+        end = int(start[j, end])
+        boundaries.append(end)
+    return sorted(boundaries)
 
 
 # Optional testing block
@@ -181,6 +735,8 @@ if __name__ == "__main__":
     epilogue reveals that Gardner went on to form his own multimillion-dollar brokerage firm in 1987, and Gardner 
     sold a minority stake in his brokerage firm in a multi-million-dollar deal in 2006."""
 
+    from log_setup import configure_logging
+    configure_logging()
     scenes = split_into_scenes(story, similarity_threshold=0.15)
 
     for i, scene in enumerate(scenes):
@@ -0,0 +1,189 @@
+import os
+import sys
+import hmac
+import json
+import time
+import pstats
+import cProfile
+import logging
+import threading
+import tracemalloc
+import contextvars
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Profiling is off unless a token is configured and the request presents it
+PROFILE_TOKEN = os.getenv("ARTISTIFY_PROFILE_TOKEN")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_TOP_N = int(os.getenv("PROFILE_TOP_N", "20"))
+PROFILE_TRACEBACK_DEPTH = int(os.getenv("PROFILE_TRACEBACK_DEPTH", "10"))
+
+# cProfile and tracemalloc are process-wide, so only one request is profiled at a time
+_profile_lock = threading.Lock()
+# Before Python 3.12 cProfile only hooks the thread that enables it. From 3.12 it is built on
+# sys.monitoring, which covers every thread of the process, and a second profile cannot be enabled
+# while one is active.
+PROFILE_HOOKS_ALL_THREADS = sys.version_info >= (3, 12)
+# Profiles of the pool threads working for the stage being profiled (before 3.12 only); calls submitted
+# through tracing.in_current_context see this in their copied context.
+_stage_thread_profiles = contextvars.ContextVar("stage_thread_profiles", default=None)
+
+
+def profiled_call(function, *args, **kwargs):
+    '''
+    Call function, recording it in the profile of the stage being profiled in this context, if any.
+    Used for calls that run in pool threads (e.g. the Genius lyrics requests) on behalf of a stage.
+    Args:
+        function (callable): The function to call.
+    Returns:
+        The function's return value.
+    '''
+    thread_profiles = _stage_thread_profiles.get()
+    if thread_profiles is None:
+        return function(*args, **kwargs)
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        return function(*args, **kwargs)
+    finally:
+        profile.disable()
+        thread_profiles.append(profile)
+
+
+def top_functions(profile, top_n=PROFILE_TOP_N):
+    '''
+    The functions with the highest cumulative time in a cProfile profile.
+    Args:
+        profile (cProfile.Profile or pstats.Stats): A finished profile.
+        top_n (int): Number of functions to return.
+    Returns:
+        list: Dicts with function, calls, total_time and cumulative_time.
+    '''
+    stats = (profile if isinstance(profile, pstats.Stats) else pstats.Stats(profile)).stats
+    rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:top_n]
+    return [
+        {
+            "function": f"{filename}:{line}({name})",
+            "calls": calls,
+            "total_time": total_time,
+            "cumulative_time": cumulative_time,
+        }
+        for (filename, line, name), (_, calls, total_time, cumulative_time, _) in rows
+    ]
+
+
+def top_allocations(before, after, top_n=PROFILE_TOP_N):
+    '''
+    The source lines that allocated the most memory between two tracemalloc snapshots.
+    Args:
+        before (tracemalloc.Snapshot): Snapshot at the start of the stage.
+        after (tracemalloc.Snapshot): Snapshot at the end of the stage.
+        top_n (int): Number of sites to return.
+    Returns:
+        list: Dicts with site, size_diff_kb and count_diff.
+    '''
+    diffs = after.compare_to(before, "lineno")[:top_n]
+    return [
+        {
+            "site": f"{diff.traceback[0].filename}:{diff.traceback[0].lineno}",
+            "size_diff_kb": diff.size_diff / 1024,
+            "count_diff": diff.count_diff,
+        }
+        for diff in diffs
+    ]
+
+
+class RequestProfiler:
+    '''
+    cProfile and tracemalloc profile of a single pipeline run, broken down by stage.
+
+    Each stage gets its own `<stage>.prof` file (readable with pstats or snakeviz), and
+    `summary.json` lists the top functions and allocation sites of every stage. A stage's profile
+    includes the calls it ran in pool threads through tracing.in_current_context (the Genius requests).
+    '''
+
+    def __init__(self, request_id, output_dir=PROFILE_DIR):
+        '''
+        Args:
+            request_id (str): Identifies the request; the dump goes to output_dir/request_id.
+            output_dir (str): Root directory for profile dumps.
+        '''
+        self.request_id = request_id
+        self.path = os.path.join(output_dir, request_id)
+        self.stages = {}
+        self._started_tracemalloc = False
+
+    def __enter__(self):
+        try:
+            os.makedirs(self.path, exist_ok=True)
+        except OSError:
+            _profile_lock.release()
+            raise
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(PROFILE_TRACEBACK_DEPTH)
+            self._started_tracemalloc = True
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+        summary = {"request_id": self.request_id, "stages": self.stages}
+        if exc is not None:
+            summary["error"] = str(exc)
+        with open(os.path.join(self.path, "summary.json"), "w") as f:
+            json.dump(summary, f, indent=2)
+        logger.info(f"Wrote profile for request {self.request_id} to {self.path}")
+        _profile_lock.release()
+        return False
+
+    @contextmanager
+    def stage(self, name):
+        '''
+        Profile the enclosed block as stage `name`.
+        '''
+        profile = cProfile.Profile()
+        thread_profiles = []
+        token = _stage_thread_profiles.set(None if PROFILE_HOOKS_ALL_THREADS else thread_profiles)
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        start = time.time()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            _stage_thread_profiles.reset(token)
+            elapsed = time.time() - start
+            after = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            # calls still running in pool threads (e.g. cancelled at a deadline) are left out
+            stats = pstats.Stats(profile)
+            for thread_profile in list(thread_profiles):
+                stats.add(thread_profile)
+            stats.dump_stats(os.path.join(self.path, f"{name}.prof"))
+            self.stages[name] = {
+                "time": elapsed,
+                "peak_traced_memory_mb": peak / 1024 ** 2,
+                "top_functions": top_functions(stats),
+                "top_allocations": top_allocations(before, after),
+            }
+
+
+def get_request_profiler(token, request_id, output_dir=PROFILE_DIR):
+    '''
+    A profiler for this request if it presented the configured profile token, else None.
+    Requests that arrive while another request is being profiled are not profiled.
+    Args:
+        token (str): Token sent with the request (header or query parameter), or None.
+        request_id (str): Identifies the request in the dump directory.
+        output_dir (str): Root directory for profile dumps.
+    Returns:
+        RequestProfiler or None: Use as a context manager around the pipeline run.
+    '''
+    if not token or not PROFILE_TOKEN or not hmac.compare_digest(token, PROFILE_TOKEN):
+        return None
+    if not _profile_lock.acquire(blocking=False):
+        logger.warning(f"Profiling already in progress; request {request_id} is not profiled.")
+        return None
+    return RequestProfiler(request_id, output_dir)
@@ -0,0 +1,120 @@
+import numpy as np
+
+VECTOR_DTYPES = ("float64", "float32", "float16", "int8")
+
+
+def normalise_rows(vectors):
+    """
+    Stack vectors into a 2D float64 array with unit-length rows (zero rows are left as zeros).
+    """
+    matrix = np.atleast_2d(np.asarray(vectors, dtype=np.float64))
+    matrix = matrix.reshape(matrix.shape[0], -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class QuantizedVectors:
+    """
+    Pre-normalised vectors stored in a reduced-precision form for cosine scoring.
+
+    - "int8": each vector is scaled by its own max-abs value into [-127, 127], with a float32 scale per vector.
+    - "float16" / "float32" / "float64": the unit vectors cast to that dtype.
+    """
+
+    def __init__(self, vectors, dtype="int8", chunk_size=65536):
+        """
+        Parameters:
+        -----------
+        vectors : list of list or np.ndarray
+            Vectors to store, one per row.
+        dtype : str
+            One of VECTOR_DTYPES.
+        chunk_size : int
+            Rows de-quantised per matrix product when scoring, bounding temporary memory.
+        """
+        if dtype not in VECTOR_DTYPES:
+            raise ValueError(f"Unknown vector dtype: {dtype}")
+        self.dtype = dtype
+        self.chunk_size = chunk_size
+
+        unit = normalise_rows(vectors)
+        if dtype == "int8":
+            max_abs = np.abs(unit).max(axis=1)
+            max_abs[max_abs == 0] = 1.0
+            self.scales = (max_abs / 127.0).astype(np.float32)
+            self.codes = np.round(unit / self.scales[:, None]).astype(np.int8)
+        else:
+            self.scales = None
+            self.codes = unit.astype(dtype)
+
+    def __len__(self):
+        return self.codes.shape[0]
+
+    @property
+    def nbytes(self):
+        """
+        Memory held by the stored codes and scales.
+        """
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def scores(self, queries):
+        """
+        Approximate cosine similarity of every query against every stored vector.
+
+        Parameters:
+        -----------
+        queries : np.ndarray
+            One query vector or a 2D array of queries.
+
+        Returns:
+        --------
+        np.ndarray
+            Array of shape (n_queries, n_vectors).
+        """
+        compute_dtype = np.float64 if self.dtype == "float64" else np.float32
+        queries = normalise_rows(queries).astype(compute_dtype)
+        out = np.empty((queries.shape[0], len(self)), dtype=compute_dtype)
+        for start in range(0, len(self), self.chunk_size):
+            block = self.codes[start:start + self.chunk_size].astype(compute_dtype)
+            out[:, start:start + block.shape[0]] = queries @ block.T
+        if self.scales is not None:
+            out *= self.scales
+        return out
+
+    def top_k(self, queries, k=10, exact_vectors=None, rerank_factor=4):
+        """
+        Top-k most similar stored vectors per query, optionally re-ranked exactly.
+
+        Parameters:
+        -----------
+        queries : np.ndarray
+            One query vector or a 2D array of queries.
+        k : int
+            Number of results per query.
+        exact_vectors : np.ndarray, optional
+            Unit-length full-precision vectors; if given, the best `rerank_factor * k`
+            quantised candidates are re-scored against them.
+        rerank_factor : int
+            Candidate multiplier for re-ranking.
+
+        Returns:
+        --------
+        indices : np.ndarray
+            Array of shape (n_queries, k), best first.
+        scores : np.ndarray
+            Matching similarities.
+        """
+        scores = self.scores(queries)
+        k = min(k, scores.shape[1])
+        n_candidates = min(scores.shape[1], rerank_factor * k if exact_vectors is not None else k)
+        candidates = np.argpartition(-scores, n_candidates - 1, axis=1)[:, :n_candidates]
+
+        if exact_vectors is not None:
+            unit_queries = normalise_rows(queries)
+            candidate_scores = np.einsum("qd,qcd->qc", unit_queries, exact_vectors[candidates])
+        else:
+            candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+
+        order = np.argsort(-candidate_scores, axis=1)[:, :k]
+        return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidate_scores, order, axis=1)
@@ -1,23 +1,37 @@
 import os
+import time
 import logging
 import requests
-import numpy as np
 import pandas as pd
 from bs4 import BeautifulSoup
-from pyspark.sql import SparkSession
+from pyspark.sql import SparkSession, functions as F
+from pyspark.sql.types import StructType, StructField, StringType, ArrayType, DoubleType
 import multiprocessing
 from genius_handler import get_artist_top_tracks
-from esa import generate_esa_vectors
+from esa import generate_esa_vectors_batch
+from esa_model import get_esa_model
+from model import CATALOG_PARQUET_DIR, CATALOG_CSV_FILE, is_parquet_catalog, read_parquet_catalog
+from track_index import add_tracks_to_index
+from recommender_snapshots import publish_snapshot
+from log_setup import configure_logging, get_rate_limited_logger
 
-# Setup logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', filename='debug.log', filemode='w')
 logger = logging.getLogger(__name__)
+per_item_logger = get_rate_limited_logger(__name__)     # messages logged once per track
+
+# Tracks per ESA transform inside a Spark partition
+SPARK_BATCH_SIZE = int(os.getenv("SPARK_BATCH_SIZE", "256"))
+
+CATALOG_SCHEMA = StructType([
+    StructField("artist", StringType()),
+    StructField("track", StringType()),
+    StructField("lyrics", StringType()),
+    StructField("esa_vector", ArrayType(DoubleType())),
+    StructField("esa_version", StringType()),
+])
 
 # Determine optimal number of partitions
 num_cores = multiprocessing.cpu_count()
 num_partitions = num_cores * 2
-logger.info(f"Number of CPU cores: {num_cores}")
-logger.info(f"Number of partitions: {num_partitions}")
 
 def scrape_billboard_100_artists():
     '''
@@ -91,39 +105,132 @@ def generate_artists_corpus(artists):
             logger.error(f"Error processing artist {artist}: {e}", exc_info=True)
     return collected_df
 
-def get_lyrics_partition(partition):
+def vectorize_partition(partition, esa_model, batch_size=SPARK_BATCH_SIZE, counters=None):
     '''
-    Get lyrics for a partition of artists and tracks inside a Spark RDD.
-    This function is called in parallel for each partition of the RDD.
-    It generates ESA vectors for the lyrics of each track and yields the results.
+    Generate ESA vectors for one partition of (artist, track, lyrics) rows inside a Spark job.
+    Rows are vectorised batch_size at a time with one ESA transform per batch.
     Args:
         partition (iterable): An iterable of tuples containing artist name, track name, and lyrics.
+        esa_model (pyspark.Broadcast): The broadcast compiled ESA model.
+        batch_size (int): Tracks per ESA transform.
+        counters (dict): Spark accumulators "vectorised" and "failed", counted on the executors.
     Yields:
-        tuple: A tuple containing artist name, track name, lyrics, and ESA vector.
+        tuple: A tuple containing artist name, track name, lyrics, ESA vector and ESA model version.
     '''
-    for artist, track, lyrics in partition:
-        try:
-            esa_vector = generate_esa_vectors(lyrics)
-            if esa_vector:
-                yield (artist, track, lyrics, np.array(esa_vector).reshape(1, -1).tolist())
-            else:
-                logger.warning(f"Empty ESA vector for {artist} - {track}")
-        except Exception as e:
-            logger.error(f"ESA error for {artist} - {track}: {e}", exc_info=True)
+    model = esa_model.value     # deserialised once per executor process
+    batch = []
+    for row in partition:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield from vectorize_batch(batch, model, counters)
+            batch = []
+    if batch:
+        yield from vectorize_batch(batch, model, counters)
+
+def vectorize_batch(batch, model, counters=None):
+    '''
+    Generate ESA vectors for a batch of (artist, track, lyrics) rows with one ESA transform.
+    Args:
+        batch (list): Tuples containing artist name, track name, and lyrics.
+        model (ESAModel): The compiled ESA model.
+        counters (dict): Spark accumulators "vectorised" and "failed".
+    Returns:
+        list: Tuples containing artist name, track name, lyrics, ESA vector and ESA model version.
+    '''
+    try:
+        vectors = generate_esa_vectors_batch([lyrics for _, _, lyrics in batch], esa_model=model)
+    except Exception as e:
+        logger.error(f"ESA error for a batch of {len(batch)} tracks: {e}", exc_info=True)
+        vectors = [[] for _ in batch]
+    rows = []
+    for (artist, track, lyrics), vector in zip(batch, vectors):
+        if vector:
+            rows.append((artist, track, lyrics, [float(x) for x in vector], model.version))
+        else:
+            per_item_logger.warning(f"Empty ESA vector for {artist} - {track}")
+    if counters is not None:
+        counters["vectorised"].add(len(rows))
+        counters["failed"].add(len(batch) - len(rows))
+    return rows
+
+def write_catalog_partitions(spark, rows, output_dir=CATALOG_PARQUET_DIR, ingest_run=None,
+                             partitions=None, batch_size=SPARK_BATCH_SIZE):
+    '''
+    Vectorise (artist, track, lyrics) rows on the executors and append them to the Parquet catalog.
+    The compiled ESA model is broadcast once; executors write their partitions directly, so no
+    vectors or lyrics are collected on the driver.
+    Args:
+        spark (SparkSession): The Spark session.
+        rows (pyspark.RDD or list): (artist, track, lyrics) tuples.
+        output_dir (str): Root directory of the Parquet catalog.
+        ingest_run (str): Partition value identifying this run (defaults to a timestamp).
+        partitions (int): Number of partitions to spread a list of rows over.
+        batch_size (int): Tracks per ESA transform.
+    Returns:
+        dict: The ingest run, the number of vectorised and failed tracks and the ESA version.
+    '''
+    esa_model = get_esa_model()
+    if esa_model is None:
+        raise RuntimeError("No compiled ESA model; run dvc_compile_esa_model.py first.")
+    sc = spark.sparkContext
+    ingest_run = ingest_run or time.strftime('%Y%m%dT%H%M%S')
+    if not hasattr(rows, "mapPartitions"):
+        rows = sc.parallelize(rows, numSlices=partitions or num_partitions)
+
+    esa_model_broadcast = sc.broadcast(esa_model)
+    counters = {"vectorised": sc.accumulator(0), "failed": sc.accumulator(0)}
+    vectorised = rows.mapPartitions(lambda partition: vectorize_partition(partition, esa_model_broadcast, batch_size, counters))
+    (spark.createDataFrame(vectorised, CATALOG_SCHEMA)
+        .withColumn("ingest_run", F.lit(ingest_run))
+        .write.mode("append")
+        .partitionBy("esa_version", "ingest_run")
+        .parquet(output_dir))
+    esa_model_broadcast.unpersist()
+
+    report = {"ingest_run": ingest_run, "vectorised": counters["vectorised"].value,
+              "failed": counters["failed"].value, "esa_version": esa_model.version}
+    logger.info(f"Wrote ESA vectors to {output_dir}: {report}")
+    return report
+
+def seed_parquet_catalog(spark, csv_file=CATALOG_CSV_FILE, output_dir=CATALOG_PARQUET_DIR):
+    '''
+    Copy the CSV catalog into a new Parquet catalog (as ingest run "seed"), parsing the vectors on the executors.
+    Args:
+        spark (SparkSession): The Spark session.
+        csv_file (str): The CSV catalog.
+        output_dir (str): Root directory of the Parquet catalog.
+    Returns:
+        None
+    '''
+    catalog = spark.read.csv(csv_file, header=True, multiLine=True, escape='"')
+    if 'esa_version' not in catalog.columns:
+        catalog = catalog.withColumn("esa_version", F.lit(None).cast("string"))
+    (catalog
+        .withColumn("esa_vector", F.flatten(F.from_json("esa_vector", "array<array<double>>")))
+        .where(F.size("esa_vector") > 0)
+        .select(*[field.name for field in CATALOG_SCHEMA.fields])
+        .withColumn("ingest_run", F.lit("seed"))
+        .write.mode("append")
+        .partitionBy("esa_version", "ingest_run")
+        .parquet(output_dir))
+    logger.info(f"Seeded {output_dir} from {csv_file}.")
 
-def remove_existing_tracks(new_df, existing_file='esa_vectors_all_lyrics.csv'):
+def remove_existing_tracks(new_df, existing_file=CATALOG_PARQUET_DIR):
     '''
     Remove tracks that already exist in the ESA vector file.
     Args:
         new_df (DataFrame): DataFrame containing new artist data.
-        existing_file (str): Path to the existing ESA vector file.
+        existing_file (str): Path to the existing ESA vector file (CSV or Parquet catalog).
     Returns:
         DataFrame: A DataFrame containing only new tracks.
     '''
 
     if not os.path.exists(existing_file):
         return new_df
-    existing = pd.read_csv(existing_file, usecols=['artist', 'track'])
+    if is_parquet_catalog(existing_file):
+        existing = read_parquet_catalog(existing_file, ['artist', 'track']).to_pandas()
+    else:
+        existing = pd.read_csv(existing_file, usecols=['artist', 'track'])
     before = len(new_df)
     filtered_df = new_df.merge(existing, on=['artist', 'track'], how='left', indicator=True)
     new_only = filtered_df[filtered_df['_merge'] == 'left_only'].drop(columns=['_merge'])
@@ -147,32 +254,35 @@ def main():
         return
 
     # cleanup
-    new_artist_data = remove_existing_tracks(new_artist_data)
+    existing_catalog = CATALOG_PARQUET_DIR if os.path.exists(CATALOG_PARQUET_DIR) else CATALOG_CSV_FILE
+    new_artist_data = remove_existing_tracks(new_artist_data, existing_catalog)
 
     if new_artist_data.empty:
         logger.info("All fetched tracks already exist in ESA vector file.")
         return
     # setting up the spark session
     spark = SparkSession.builder.appName("ESA vector generation").getOrCreate()
-    sc = spark.sparkContext
+    logger.info(f"Number of CPU cores: {num_cores}")
+    logger.info(f"Number of partitions: {num_partitions}")
+    try:
+        if not os.path.exists(CATALOG_PARQUET_DIR) and os.path.exists(CATALOG_CSV_FILE):
+            seed_parquet_catalog(spark)
+        # generate the ESA vectors in parallel; the executors write them to the catalog
+        rows = list(zip(new_artist_data['artist'], new_artist_data['track'], new_artist_data['lyrics'].astype(str)))
+        report = write_catalog_partitions(spark, rows)
+    finally:
+        spark.stop()
 
-    # repartition the DataFrame to the number of partitions
-    rdd_input = sc.parallelize(
-        list(zip(new_artist_data['artist'], new_artist_data['track'], new_artist_data['lyrics'].astype(str))),
-        numSlices=num_partitions
-    )
-    # generate the ESA vectors in parallel
-    esa_vectors = rdd_input.mapPartitions(get_lyrics_partition).collect()
-    sc.stop()
-
-    if esa_vectors:
-        esa_df = pd.DataFrame(esa_vectors, columns=['artist', 'track', 'lyrics', 'esa_vector'])
-        mode = 'a' if os.path.exists('esa_vectors_all_lyrics.csv') else 'w'
-        header = not os.path.exists('esa_vectors_all_lyrics.csv')
-        esa_df.to_csv('esa_vectors_all_lyrics.csv', index=False, mode=mode, header=header)
-        logger.info("ESA vectors appended to esa_vectors_all_lyrics.csv.")
+    if report["vectorised"]:
+        # read back only this run's partition, without the lyrics
+        esa_df = read_parquet_catalog(CATALOG_PARQUET_DIR, ['artist', 'track', 'esa_vector'],
+                                      ingest_run=report["ingest_run"]).to_pandas()
+        add_tracks_to_index(esa_df)
+        # running services pick the new snapshot up in the background
+        publish_snapshot(CATALOG_PARQUET_DIR)
     else:
         logger.warning("No ESA vectors generated for new artists.")
 
 if __name__ == "__main__":
+    configure_logging()
     main()
@@ -0,0 +1,228 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+import numpy as np
+from model import (load_artist_esa_vectors, get_artist_recommender as get_catalog_recommender, ArtistRecommender,
+                   serving_catalog, is_parquet_catalog)
+
+logger = logging.getLogger(__name__)
+
+# Published snapshots live in <root>/<version>/; <root>/CURRENT names the one to serve
+RECOMMENDER_SNAPSHOT_DIR = os.getenv("RECOMMENDER_SNAPSHOT_DIR", "recommender_snapshots")
+RECOMMENDER_SNAPSHOT_KEEP = int(os.getenv("RECOMMENDER_SNAPSHOT_KEEP", "3"))
+RECOMMENDER_POLL_INTERVAL = float(os.getenv("RECOMMENDER_POLL_INTERVAL", "30"))
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+
+
+def snapshot_hash(artist_names, vectors):
+    """
+    Content hash of a snapshot, so republishing an unchanged catalog is a no-op.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps(artist_names).encode("utf-8"))
+    digest.update(np.ascontiguousarray(vectors).tobytes())
+    return digest.hexdigest()[:12]
+
+
+def current_snapshot_version(snapshot_root=RECOMMENDER_SNAPSHOT_DIR):
+    """
+    Version named by the CURRENT pointer, or None if nothing has been published.
+    """
+    try:
+        with open(os.path.join(snapshot_root, CURRENT_FILE), "r") as file:
+            return file.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def publish_snapshot(catalog_file='esa_vectors_all_lyrics.csv', snapshot_root=RECOMMENDER_SNAPSHOT_DIR):
+    """
+    Parse the catalog into a new versioned recommender snapshot and point CURRENT at it.
+
+    The snapshot directory is written completely before the pointer is replaced (atomically,
+    with os.replace), so watchers never load a partial snapshot.
+
+    Parameters:
+    -----------
+    catalog_file : str
+        Catalog CSV with artist and esa_vector columns.
+    snapshot_root : str
+        Directory holding the snapshots.
+
+    Returns:
+    --------
+    str
+        The published (or already current) snapshot version.
+    """
+    entries = [entry for entry in load_artist_esa_vectors(catalog_file) if len(entry['esa_vector']) > 0]
+    artist_names = [entry['artist'] for entry in entries]
+    vectors = np.array([np.asarray(entry['esa_vector'], dtype=np.float64).reshape(-1) for entry in entries])
+
+    content = snapshot_hash(artist_names, vectors)
+    current = current_snapshot_version(snapshot_root)
+    if current is not None and current.endswith(content):
+        logger.info(f"Recommender snapshot {current} is already current.")
+        return current
+
+    version = f"{time.strftime('%Y%m%dT%H%M%S')}-{content}"
+    snapshot_dir = os.path.join(snapshot_root, version)
+    tmp_dir = snapshot_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, "vectors.npy"), vectors)
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), "w") as file:
+        json.dump({"version": version, "catalog_file": catalog_file, "shape": list(vectors.shape),
+                   "artist_names": artist_names}, file)
+    os.replace(tmp_dir, snapshot_dir)
+
+    pointer_tmp = os.path.join(snapshot_root, CURRENT_FILE + ".tmp")
+    with open(pointer_tmp, "w") as file:
+        file.write(version)
+    os.replace(pointer_tmp, os.path.join(snapshot_root, CURRENT_FILE))
+    logger.info(f"Published recommender snapshot {version} ({len(artist_names)} vectors).")
+
+    prune_snapshots(snapshot_root)
+    return version
+
+
+def prune_snapshots(snapshot_root=RECOMMENDER_SNAPSHOT_DIR, keep=RECOMMENDER_SNAPSHOT_KEEP):
+    """
+    Delete all but the newest `keep` snapshots (versions sort by their timestamp prefix).
+    """
+    versions = sorted(
+        name for name in os.listdir(snapshot_root)
+        if os.path.exists(os.path.join(snapshot_root, name, MANIFEST_FILE))
+    )
+    for version in versions[:-keep]:
+        shutil.rmtree(os.path.join(snapshot_root, version), ignore_errors=True)
+
+
+def load_snapshot(version, snapshot_root=RECOMMENDER_SNAPSHOT_DIR):
+    """
+    Build an ArtistRecommender from a published snapshot.
+    """
+    snapshot_dir = os.path.join(snapshot_root, version)
+    with open(os.path.join(snapshot_dir, MANIFEST_FILE), "r") as file:
+        manifest = json.load(file)
+    vectors = np.load(os.path.join(snapshot_dir, "vectors.npy"))
+    return ArtistRecommender.from_vectors(manifest["artist_names"], vectors)
+
+
+class RecommenderHolder:
+    """
+    Holds the serving ArtistRecommender and swaps in new snapshots from a background thread.
+
+    Requests read `current` once and keep that object for the whole call, so in-flight
+    predictions finish on the old version while new calls get the new one. Building a new
+    recommender happens entirely on the watcher thread; the swap is a single reference assignment.
+    """
+
+    def __init__(self, snapshot_root=RECOMMENDER_SNAPSHOT_DIR, poll_interval=RECOMMENDER_POLL_INTERVAL):
+        self.snapshot_root = snapshot_root
+        self.poll_interval = poll_interval
+        self.current = None
+        self.version = None
+        self.previous_version = None
+        self.loaded_at = None
+        self.build_seconds = None
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """
+        Call callback(holder) after every swap, e.g. to update metrics.
+        """
+        self._listeners.append(callback)
+
+    def load(self, version):
+        """
+        Build the recommender for `version` and swap it in.
+        """
+        start = time.time()
+        recommender = load_snapshot(version, self.snapshot_root)
+        build_seconds = time.time() - start
+        self.current = recommender
+        self.previous_version = self.version
+        self.version, self.loaded_at, self.build_seconds = version, time.time(), build_seconds
+        logger.info(f"Serving recommender snapshot {version} (built in {build_seconds:.2f}s).")
+        for callback in self._listeners:
+            callback(self)
+
+    def load_initial(self):
+        """
+        Load the current snapshot, or fall back to parsing the catalog of record if none is published.
+        """
+        version = current_snapshot_version(self.snapshot_root)
+        if version is not None:
+            self.load(version)
+        else:
+            start = time.time()
+            catalog = serving_catalog()
+            self.current = get_catalog_recommender(catalog)
+            self.version = "parquet" if is_parquet_catalog(catalog) else "csv"
+            self.loaded_at, self.build_seconds = time.time(), time.time() - start
+        return self.current
+
+    def check(self):
+        """
+        Swap in the snapshot named by CURRENT if it differs from the one being served.
+        """
+        version = current_snapshot_version(self.snapshot_root)
+        if version is not None and version != self.version:
+            try:
+                self.load(version)
+            except Exception as e:
+                logger.error(f"Failed to load recommender snapshot {version}; keeping {self.version}: {e}")
+
+    def _watch(self):
+        while not self._stop_event.wait(self.poll_interval):
+            self.check()
+
+    def start_watching(self):
+        """
+        Start the watcher thread in this process (threads do not survive fork, so call it per worker).
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._watch, name="recommender-watcher", daemon=True)
+            self._thread.start()
+
+    def stop_watching(self):
+        self._stop_event.set()
+
+    def status(self):
+        return {
+            "version": self.version,
+            "loaded_at": self.loaded_at,
+            "build_seconds": self.build_seconds,
+            "vectors": len(self.current.artist_names) if self.current is not None else 0,
+        }
+
+
+recommender_holder = RecommenderHolder()
+
+
+def get_artist_recommender():
+    """
+    The ArtistRecommender currently being served (loaded on first use).
+    """
+    recommender = recommender_holder.current
+    if recommender is None:
+        recommender = recommender_holder.load_initial()
+    return recommender
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Publish a recommender snapshot from the catalog.")
+    parser.add_argument("--catalog", default=serving_catalog(), help="defaults to the Parquet catalog once it exists")
+    args = parser.parse_args()
+    print(publish_snapshot(args.catalog))
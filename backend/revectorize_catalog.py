@@ -0,0 +1,385 @@
+# revectorize_catalog.py
+# Recompute stale catalog ESA vectors after the concept corpus (topics.csv / lemmatized_corpus.json) changes.
+# Handles the Parquet catalog written by the Spark ingestion job as well as the CSV catalogs.
+#
+# Run dvc_compile_esa_model.py (or `dvc repro compile_esa_model`) first, then:
+#   python revectorize_catalog.py [catalog.csv | catalog.parquet ...]
+
+import os
+import json
+import time
+import shutil
+import logging
+import argparse
+import multiprocessing
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from esa import generate_esa_vectors_batch
+from esa_model import get_esa_model, get_esa_version
+from model import CATALOG_PARQUET_DIR, CATALOG_CSV_FILE, is_parquet_catalog, read_parquet_catalog, serving_catalog
+from track_index import build_track_index, TRACK_INDEX_DIR, MANIFEST_FILE
+from recommender_snapshots import publish_snapshot
+from dvc_generate_esa_vectors import init_worker
+
+CATALOG_FILES = [CATALOG_PARQUET_DIR, CATALOG_CSV_FILE, 'scraped_esa_vectors_all_lyrics.csv']
+CATALOG_COLUMNS = ['artist', 'track', 'lyrics', 'esa_vector', 'esa_version']
+# Columns stored in the Parquet catalog's files; esa_version and ingest_run are in the partition paths
+PARQUET_SCHEMA = pa.schema([("artist", pa.string()), ("track", pa.string()), ("lyrics", pa.string()),
+                            ("esa_vector", pa.list_(pa.float64()))])
+
+
+def stale_rows(catalog, esa_version):
+    """
+    Boolean mask of catalog rows whose vectors were built with another ESA model version
+    (or before versions were recorded).
+    """
+    if 'esa_version' not in catalog.columns:
+        return pd.Series(True, index=catalog.index)
+    return catalog['esa_version'].astype(str) != esa_version
+
+
+def revectorize_batch(batch):
+    """
+    Recompute ESA vectors for a batch of catalog rows from their stored lyrics.
+
+    Parameters:
+    -----------
+    batch : list of tuple
+        (artist, track, lyrics) tuples.
+
+    Returns:
+    --------
+    list of tuple or None
+        (artist, track, lyrics, esa_vector, esa_version) per row that produced a vector, or None if
+        the ESA transform failed.
+    """
+    esa_version = get_esa_version()
+    lyrics = [str(row[2]) for row in batch]
+    try:
+        vectors = generate_esa_vectors_batch(lyrics)
+    except Exception as e:
+        logging.error(f"ESA error for a batch of {len(batch)} tracks: {e}", exc_info=True)
+        return None
+    return [
+        (artist, track, text, np.array(vector).reshape(1, -1).tolist(), esa_version)
+        for (artist, track, _), text, vector in zip(batch, lyrics, vectors) if vector
+    ]
+
+
+def pending_csv_rows(catalog_file, generation_file, esa_version, attempted):
+    """
+    Stale rows of a CSV catalog that still need a vector of this ESA version.
+
+    Tracks already written to this generation's file and tracks attempted earlier in this run are skipped.
+
+    Returns:
+    --------
+    tuple
+        The number of catalog rows, the number of stale rows and a list of (artist, track, lyrics) tuples.
+    """
+    catalog = pd.read_csv(catalog_file)
+    stale = stale_rows(catalog, esa_version)
+    done = set(attempted)
+    if os.path.exists(generation_file):
+        previous = pd.read_csv(generation_file, usecols=['artist', 'track'])
+        done |= set(zip(previous['artist'], previous['track']))
+    todo = [
+        (artist, track, lyrics)
+        for artist, track, lyrics in catalog.loc[stale, ['artist', 'track', 'lyrics']].itertuples(index=False)
+        if (artist, track) not in done
+    ]
+    return len(catalog), int(stale.sum()), todo
+
+
+def revectorize_catalog(catalog_file, batch_size=256, processes=None):
+    """
+    Recompute the stale vectors of one catalog and switch the catalog over atomically.
+
+    The new vectors are appended batch by batch to a generation file next to the catalog
+    (`<catalog>.<esa_version>.partial`), so an interrupted run resumes where it stopped. Rows
+    appended to the catalog while the run was going are picked up by a further pass. Once every
+    stale row is done, the catalog is rewritten with the new vectors to `<catalog>.tmp` and moved
+    into place with os.replace; readers see either the old or the new catalog, never a mix. Tracks
+    whose lyrics yield no vector under the new model are dropped, as their old vectors may have
+    another dimension. If an ESA transform failed, the catalog is left as it was and the run can be
+    repeated to retry.
+
+    Parameters:
+    -----------
+    catalog_file : str
+        Catalog CSV with artist, track, lyrics and esa_vector columns.
+    batch_size : int
+        Tracks per ESA transform (and per progress update).
+    processes : int
+        Worker processes (defaults to the CPU count).
+
+    Returns:
+    --------
+    dict
+        Report with the ESA version, row counts, elapsed time and tracks per second.
+    """
+    esa_version = get_esa_version()
+    if esa_version is None:
+        raise RuntimeError("No compiled ESA model; run dvc_compile_esa_model.py first.")
+
+    generation_file = f"{catalog_file}.{esa_version}.partial"
+    rows, stale, todo = pending_csv_rows(catalog_file, generation_file, esa_version, set())
+    report = {"catalog": catalog_file, "esa_version": esa_version, "rows": rows, "stale": stale}
+    if not stale:
+        logging.info(f"{catalog_file}: all {rows} rows are at ESA version {esa_version}.")
+        return report
+    if os.path.exists(generation_file):
+        logging.info(f"Resuming {catalog_file}: {stale - len(todo)} tracks already recomputed.")
+
+    start = time.time()
+    processed = 0
+    failed_batches = 0
+    failed_rows = 0
+    attempted = set()
+    get_esa_model()     # map the model before forking so the workers share its pages
+    with multiprocessing.Pool(processes=processes or multiprocessing.cpu_count(), initializer=init_worker) as pool:
+        # later passes pick up rows appended to the catalog while the previous pass ran
+        while todo:
+            attempted.update((artist, track) for artist, track, _ in todo)
+            batches = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+            logging.info(f"{catalog_file}: recomputing {len(todo)} stale rows in {len(batches)} batches.")
+            for batch, rows in zip(batches, pool.imap(revectorize_batch, batches)):
+                if rows is None:
+                    failed_batches += 1
+                    failed_rows += len(batch)
+                elif rows:
+                    pd.DataFrame(rows, columns=CATALOG_COLUMNS).to_csv(
+                        generation_file, index=False, mode='a', header=not os.path.exists(generation_file)
+                    )
+                processed += len(batch)
+                elapsed = time.time() - start
+                rate = processed / elapsed if elapsed > 0 else 0.0
+                logging.info(f"{catalog_file}: {processed} tracks recomputed ({rate:.1f} tracks/s)")
+            todo = pending_csv_rows(catalog_file, generation_file, esa_version, attempted)[2]
+
+    elapsed = time.time() - start
+    report.update({"seconds": elapsed, "tracks_per_second": processed / elapsed if elapsed > 0 else None})
+    if failed_batches:
+        # keep the catalog and the generation file; the next run retries the failed batches only
+        logging.error(f"{catalog_file}: {failed_batches} batch(es) failed; not switching over.")
+        report.update({"recomputed": 0, "failed": failed_rows, "switched": False})
+        return report
+
+    # Switch over: re-read the catalog so rows appended while this ran are kept
+    new_vectors = {}
+    if os.path.exists(generation_file):
+        generation = pd.read_csv(generation_file).drop_duplicates(['artist', 'track'], keep='last')
+        new_vectors = {(row.artist, row.track): row.esa_vector for row in generation.itertuples(index=False)}
+    catalog = pd.read_csv(catalog_file)
+    if 'esa_version' not in catalog.columns:
+        catalog['esa_version'] = None
+    # an all-blank column is read as float64, which does not accept the version string
+    catalog['esa_version'] = catalog['esa_version'].astype(object)
+    stale = stale_rows(catalog, esa_version)
+    keys = list(zip(catalog['artist'], catalog['track']))
+    updated = pd.Series([key in new_vectors for key in keys], index=catalog.index) & stale
+    catalog.loc[updated, 'esa_vector'] = [new_vectors[key] for key, flag in zip(keys, updated) if flag]
+    catalog.loc[updated, 'esa_version'] = esa_version
+    # a stale row without a new vector would keep a vector of the old model, possibly of another length
+    dropped = stale & ~updated
+    catalog = catalog[~dropped]
+
+    tmp_file = catalog_file + ".tmp"
+    catalog.to_csv(tmp_file, index=False, mode='w', header=True)
+    os.replace(tmp_file, catalog_file)
+    if os.path.exists(generation_file):
+        os.remove(generation_file)
+
+    report.update({"recomputed": int(updated.sum()), "failed": int(dropped.sum()), "switched": True})
+    logging.info(f"Switched {catalog_file} to ESA version {esa_version}: {report}")
+    return report
+
+
+def stale_partitions_filter(esa_version):
+    """
+    Parquet row filter for catalog rows built with another ESA model version (or without a recorded one).
+    """
+    return (ds.field("esa_version") != esa_version) | ds.field("esa_version").is_null()
+
+
+def pending_parquet_rows(catalog_dir, generation_dir, esa_version, attempted):
+    """
+    Stale rows of the Parquet catalog that still need a vector of this ESA version.
+
+    Tracks that already have one (in the catalog or in this generation's files) and tracks attempted
+    earlier in this run are skipped; a track stored in several stale partitions is recomputed once.
+
+    Returns:
+    --------
+    list of tuple
+        (artist, track, lyrics) tuples.
+    """
+    stale = read_parquet_catalog(catalog_dir, ['artist', 'track', 'lyrics'],
+                                 row_filter=stale_partitions_filter(esa_version)).to_pandas()
+    current = read_parquet_catalog(catalog_dir, ['artist', 'track'],
+                                   row_filter=ds.field("esa_version") == esa_version).to_pandas()
+    done = set(zip(current['artist'], current['track'])) | attempted
+    if os.path.isdir(generation_dir):
+        generation = ds.dataset(generation_dir, format="parquet", schema=PARQUET_SCHEMA).to_table(columns=['artist', 'track']).to_pandas()
+        done |= set(zip(generation['artist'], generation['track']))
+    stale = stale.drop_duplicates(['artist', 'track'], keep='last')
+    return [(artist, track, lyrics) for artist, track, lyrics in stale.itertuples(index=False)
+            if (artist, track) not in done]
+
+
+def write_generation_part(generation_dir, part, rows):
+    """
+    Write one batch of recomputed rows as a Parquet file of the generation (atomically, so an
+    interrupted run never leaves a partial file; dot-prefixed files are ignored by dataset readers).
+    """
+    table = pa.table({
+        "artist": [row[0] for row in rows],
+        "track": [row[1] for row in rows],
+        "lyrics": [row[2] for row in rows],
+        "esa_vector": [[float(x) for x in row[3][0]] for row in rows],
+    }, schema=PARQUET_SCHEMA)
+    name = f"part-{part:05d}.parquet"
+    tmp_path = os.path.join(generation_dir, f".{name}.tmp")
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, os.path.join(generation_dir, name))
+
+
+def revectorize_parquet_catalog(catalog_dir, batch_size=256, processes=None):
+    """
+    Recompute the stale vectors of the partitioned Parquet catalog and switch it over to a new
+    esa_version partition.
+
+    The new vectors are written batch by batch as Parquet files to a generation directory next to the
+    catalog (`<catalog>.<esa_version>.partial/`), so an interrupted run resumes where it stopped. Rows
+    appended to stale partitions while the run was going are picked up by a further pass. Once every
+    stale row is done, the generation directory is moved into the catalog as
+    `esa_version=<version>/ingest_run=revectorize-<time>` and the stale esa_version partitions are
+    deleted. Tracks whose lyrics yield no vector under the new model are dropped with them, as the
+    ingestion job never stores a track without a vector. If an ESA transform failed, the catalog is
+    left as it was and the run can be repeated to retry.
+
+    Parameters:
+    -----------
+    catalog_dir : str
+        Root directory of the Parquet catalog.
+    batch_size : int
+        Tracks per ESA transform (and per progress update).
+    processes : int
+        Worker processes (defaults to the CPU count).
+
+    Returns:
+    --------
+    dict
+        Report with the ESA version, row counts, elapsed time and tracks per second.
+    """
+    esa_version = get_esa_version()
+    if esa_version is None:
+        raise RuntimeError("No compiled ESA model; run dvc_compile_esa_model.py first.")
+
+    generation_dir = f"{catalog_dir}.{esa_version}.partial"
+    rows = read_parquet_catalog(catalog_dir, ['artist']).num_rows
+    stale = read_parquet_catalog(catalog_dir, ['artist'], row_filter=stale_partitions_filter(esa_version)).num_rows
+    report = {"catalog": catalog_dir, "esa_version": esa_version, "rows": rows, "stale": stale}
+    if not stale and not os.path.isdir(generation_dir):
+        logging.info(f"{catalog_dir}: all {rows} rows are at ESA version {esa_version}.")
+        return report
+
+    os.makedirs(generation_dir, exist_ok=True)
+    part = len([name for name in os.listdir(generation_dir) if name.endswith(".parquet")])
+    if part:
+        logging.info(f"Resuming {catalog_dir}: {part} batches already recomputed.")
+
+    start = time.time()
+    processed = 0
+    written = 0
+    failed_batches = 0
+    attempted = set()
+    get_esa_model()     # map the model before forking so the workers share its pages
+    with multiprocessing.Pool(processes=processes or multiprocessing.cpu_count(), initializer=init_worker) as pool:
+        # later passes pick up rows appended to stale partitions while the previous pass ran
+        while True:
+            todo = pending_parquet_rows(catalog_dir, generation_dir, esa_version, attempted)
+            if not todo:
+                break
+            attempted.update((artist, track) for artist, track, _ in todo)
+            batches = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+            logging.info(f"{catalog_dir}: recomputing {len(todo)} stale rows in {len(batches)} batches.")
+            for batch, rows in zip(batches, pool.imap(revectorize_batch, batches)):
+                if rows is None:
+                    failed_batches += 1
+                elif rows:
+                    write_generation_part(generation_dir, part, rows)
+                    part += 1
+                    written += len(rows)
+                processed += len(batch)
+                elapsed = time.time() - start
+                rate = processed / elapsed if elapsed > 0 else 0.0
+                logging.info(f"{catalog_dir}: {processed} tracks recomputed ({rate:.1f} tracks/s)")
+
+    elapsed = time.time() - start
+    report.update({
+        "recomputed": written,
+        "failed": processed - written,
+        "seconds": elapsed,
+        "tracks_per_second": processed / elapsed if elapsed > 0 else None,
+    })
+    if failed_batches:
+        # keep the stale partitions; the next run retries the failed batches and reuses the rest
+        logging.error(f"{catalog_dir}: {failed_batches} batch(es) failed; not switching over.")
+        report["switched"] = False
+        return report
+
+    # Switch over: the new partition appears with one rename, then the stale partitions go
+    ingest_run = f"revectorize-{time.strftime('%Y%m%dT%H%M%S')}"
+    version_dir = os.path.join(catalog_dir, f"esa_version={esa_version}")
+    os.makedirs(version_dir, exist_ok=True)
+    if any(name.endswith(".parquet") for name in os.listdir(generation_dir)):
+        os.replace(generation_dir, os.path.join(version_dir, f"ingest_run={ingest_run}"))
+    else:
+        shutil.rmtree(generation_dir)
+    for name in os.listdir(catalog_dir):
+        if name.startswith("esa_version=") and name != f"esa_version={esa_version}":
+            shutil.rmtree(os.path.join(catalog_dir, name))
+
+    report["switched"] = True
+    logging.info(f"Switched {catalog_dir} to ESA version {esa_version}: {report}")
+    return report
+
+
+def main(catalog_files, batch_size, processes, rebuild_index=True):
+    reports = []
+    for catalog_file in catalog_files:
+        if not os.path.exists(catalog_file):
+            logging.warning(f"Catalog {catalog_file} not found; skipping.")
+            continue
+        if is_parquet_catalog(catalog_file):
+            reports.append(revectorize_parquet_catalog(catalog_file, batch_size, processes))
+        else:
+            reports.append(revectorize_catalog(catalog_file, batch_size, processes))
+
+    # The track index holds copies of the serving catalog's vectors, possibly of another dimension
+    serving = serving_catalog()
+    serving_report = next((r for r in reports if r["catalog"] == serving), None)
+    if serving_report and serving_report.get("recomputed") and serving_report.get("switched"):
+        if rebuild_index and os.path.exists(os.path.join(TRACK_INDEX_DIR, MANIFEST_FILE)):
+            logging.info(f"Rebuilding the track index from the re-vectorised catalog {serving}.")
+            build_track_index(serving, TRACK_INDEX_DIR)
+        publish_snapshot(serving)
+
+    with open('revectorize_metrics.json', 'w') as f:
+        json.dump(reports, f, indent=2)
+    return reports
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Recompute catalog ESA vectors built with an older ESA model.")
+    parser.add_argument("catalogs", nargs="*", default=CATALOG_FILES)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--no-index", action="store_true", help="do not rebuild the track index")
+    args = parser.parse_args()
+    main(args.catalogs, args.batch_size, args.processes, rebuild_index=not args.no_index)
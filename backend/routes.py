@@ -1,26 +1,50 @@
-from fastapi import FastAPI
+import thread_budget    # first: sizes the native thread pools before numpy, sklearn and torch load
+from fastapi import FastAPI, Header, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from genius_handler import get_artist_top_tracks
-from spotify_handler import get_access_token, get_track_data, search_track
-from process_storyline import split_into_scenes
-from esa import generate_esa_vectors
-import numpy as np
-from model import ArtistRecommender
-from generate_soundtrack import assign_songs_to_scenes
-from typing import Optional
+from fastapi.responses import JSONResponse, Response
+from spotify_handler import get_access_token, get_track_data, search_track, resolve_tracks
+from esa_model import get_esa_model
+from recommender_snapshots import get_artist_recommender, recommender_holder
+from pipeline import run_soundtrack_pipeline, run_soundtrack_batch
+from process_storyline import SEGMENTER_BACKEND, get_sentence_model
+from admission import AdmissionController, AdmissionRejected
+from deadline import Deadline, DeadlineExceeded
+from job_queue import JobWorkerPool, submit_job, get_job
+from profiling import get_request_profiler
+from tracing import configure_tracing, new_request_id, current_request_id, request_span, trace_id, trace_session
+from contextlib import nullcontext
+from typing import List, Literal, Optional
 from dotenv import load_dotenv
 import uvicorn
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, field_validator
 import requests
-import time 
-from prometheus_client import start_http_server, Gauge, Counter
+import os
+from prometheus_client import start_http_server, Gauge, Counter, CollectorRegistry, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import multiprocess
 
 import logging
-# setting up logging
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s", filename='debug.log', filemode='w')
+from log_setup import configure_logging
+
+# Started as a script (python routes.py), this module is re-imported as __mp_main__ by every spawned
+# job worker. Those set up their own logging and tracing (job_queue.worker_loop) and must not truncate
+# the log file, reload the models or start a second metrics server, so the process setup is skipped there.
+IN_SPAWNED_CHILD = __name__ == "__mp_main__"
+
 logger = logging.getLogger(__name__)
 load_dotenv()
+if not IN_SPAWNED_CHILD:
+    # setting up logging: records are queued and written to LOG_FILE by a background thread
+    configure_logging()
+    configure_tracing()
+
+    # Load the read-only models once at import. Under `gunicorn --preload` (gunicorn.conf.py) this
+    # runs in the master, so the forked workers share these pages instead of each loading a copy.
+    get_esa_model()
+    get_artist_recommender()
+    if SEGMENTER_BACKEND == "minilm":
+        get_sentence_model()    # deployments defaulting to the ESA segmenter never load torch
+    # torch, BLAS and OpenMP threads per pipeline; admission control caps the pipelines (see thread_budget.py)
+    thread_budget.apply_thread_budget()
 
 app = FastAPI() # Create FastAPI instance
 # CORS middleware to allow cross-origin requests
@@ -32,25 +56,109 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID", "X-Trace-ID", "X-Profile-Path"],
 )
 
+@app.middleware("http")
+async def trace_request(request: Request, call_next):
+    '''
+    Runs every request inside a root span (with the stage, ESA, Genius and Spotify spans as
+    descendants) and returns its request ID and trace ID, to look the spans up in the trace export.
+    '''
+    request_id = new_request_id(request.headers.get("X-Request-ID"))
+    with request_span(f"{request.method} {request.url.path}", request_id,
+                      **{"http.method": request.method, "http.route": request.url.path}) as span:
+        response = await call_next(request)
+        span.set_attribute("http.status_code", response.status_code)
+    response.headers["X-Request-ID"] = request_id
+    response.headers["X-Trace-ID"] = trace_id(span)
+    return response
+
 # Prometheus metrics
-start_http_server(9090)  # Start Prometheus metrics server on port 9090
+# With several workers, PROMETHEUS_MULTIPROC_DIR is set and every worker writes its samples there;
+# /metrics aggregates them. A single process keeps the standalone exporter on port 9090.
+PROMETHEUS_MULTIPROC = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+if not PROMETHEUS_MULTIPROC and not IN_SPAWNED_CHILD:
+    start_http_server(9090)  # Start Prometheus metrics server on port 9090
 request_counter = Counter('request_count', 'Total number of requests')
-scene_split_time = Gauge('scene_split_time', 'Time taken to split scenes')
-esa_vector_generation_time = Gauge('esa_vector_generation_time', 'Time taken to generate ESA vectors')
-story_esa_vector_time = Gauge('story_esa_vector_time', 'Time taken to generate story ESA vector')
-artist_recommendation_time = Gauge('artist_recommendation_time', 'Time taken to recommend artist')
-top_tracks_retrieval_time = Gauge('top_tracks_retrieval_time', 'Time taken to retrieve top tracks')
-top_track_lyrics_extraction_time = Gauge('top_track_lyrics_extraction_time', 'Time taken to extract top track lyrics')
-tracks_esa_vector_generation_time = Gauge('tracks_esa_vector_generation_time', 'Time taken to generate ESA vectors for tracks')
-song_assignment_time = Gauge('song_assignment_time', 'Time taken to assign songs to scenes')
+scene_split_time = Gauge('scene_split_time', 'Time taken to split scenes', multiprocess_mode='mostrecent')
+esa_vector_generation_time = Gauge('esa_vector_generation_time', 'Time taken to generate ESA vectors', multiprocess_mode='mostrecent')
+story_esa_vector_time = Gauge('story_esa_vector_time', 'Time taken to generate story ESA vector', multiprocess_mode='mostrecent')
+artist_recommendation_time = Gauge('artist_recommendation_time', 'Time taken to recommend artist', multiprocess_mode='mostrecent')
+top_tracks_retrieval_time = Gauge('top_tracks_retrieval_time', 'Time taken to retrieve top tracks', multiprocess_mode='mostrecent')
+top_track_lyrics_extraction_time = Gauge('top_track_lyrics_extraction_time', 'Time taken to extract top track lyrics', multiprocess_mode='mostrecent')
+tracks_esa_vector_generation_time = Gauge('tracks_esa_vector_generation_time', 'Time taken to generate ESA vectors for tracks', multiprocess_mode='mostrecent')
+song_assignment_time = Gauge('song_assignment_time', 'Time taken to assign songs to scenes', multiprocess_mode='mostrecent')
+
+recommender_snapshot_loaded = Gauge('recommender_snapshot_loaded', 'Recommender snapshot being served (1) by version', ['version'], multiprocess_mode='mostrecent')
+recommender_snapshot_loaded_at = Gauge('recommender_snapshot_loaded_at', 'Unix time the served recommender snapshot was loaded', multiprocess_mode='mostrecent')
+recommender_snapshot_build_time = Gauge('recommender_snapshot_build_time', 'Time taken to build the served recommender snapshot', multiprocess_mode='mostrecent')
+recommender_snapshot_vectors = Gauge('recommender_snapshot_vectors', 'Vectors in the served recommender snapshot', multiprocess_mode='mostrecent')
+
+def record_recommender_snapshot(holder):
+    '''
+    Publish the served recommender snapshot's version and build time as metrics.
+    '''
+    if holder.previous_version is not None:
+        recommender_snapshot_loaded.labels(version=holder.previous_version).set(0)
+    status = holder.status()
+    recommender_snapshot_loaded.labels(version=status["version"]).set(1)
+    recommender_snapshot_loaded_at.set(status["loaded_at"])
+    recommender_snapshot_build_time.set(status["build_seconds"])
+    recommender_snapshot_vectors.set(status["vectors"])
+
+if not IN_SPAWNED_CHILD:
+    recommender_holder.add_listener(record_recommender_snapshot)
+    record_recommender_snapshot(recommender_holder)
+
+@app.on_event("startup")
+def start_recommender_watcher():
+    # Per worker: the watcher thread builds new snapshots off the request path and swaps them in
+    recommender_holder.start_watching()
+
+@app.get("/recommender")
+def recommender_status():
+    '''
+    Version, load time, build time and size of the recommender snapshot this worker serves.
+    '''
+    return JSONResponse(content=recommender_holder.status())
+
+@app.get("/metrics")
+def metrics():
+    '''
+    Prometheus metrics, aggregated across all workers in multi-worker mode.
+    '''
+    if PROMETHEUS_MULTIPROC:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(content=generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+# Admission control: caps concurrent pipelines per worker and sheds excess load with 429/503
+admission_controller = AdmissionController()
+
+@app.on_event("startup")
+def limit_request_threads():
+    # Threads for the admitted and queued pipelines plus spare ones for the light endpoints; the
+    # default 40 would let more requests wait unseen in anyio instead of in the admission queue
+    thread_budget.limit_request_threads(admission_controller.max_concurrent + admission_controller.max_queue
+                                        + thread_budget.REQUEST_THREADS_SPARE)
+
+def rejection_response(rejection):
+    '''
+    Fast response for a request turned away by admission control.
+    '''
+    return JSONResponse(
+        content={"error": rejection.reason},
+        status_code=rejection.status_code,
+        headers={"Retry-After": str(rejection.retry_after)}
+    )
 
 @app.get("/get_track_data")
 def get_track_data_endpoint(track_name: str):
     try:
         # this is the spotify API (requires token)
-        session = requests.Session()
+        session = trace_session(requests.Session(), "spotify")
         token = get_access_token(session)
         track_id, track_name = search_track(track_name, token, session=session)
         track_data = get_track_data(track_id, token, session=session)
@@ -59,12 +167,47 @@ def get_track_data_endpoint(track_name: str):
         logger.error(f"Error retrieving track data: {e}")
         return JSONResponse(content={"error": str(e)}, status_code=500)
 
+class track_query(BaseModel):
+    track_name: str
+    artist: Optional[str] = None
+
+class track_batch_request(BaseModel):
+    tracks: List[track_query]
+
+@app.post("/get_track_data/batch")
+def get_track_data_batch(request: track_batch_request):
+    '''
+    Resolves many tracks in one call: cached tracks come from the local Spotify cache, the rest are
+    searched concurrently and fetched with a single multi-ID Spotify request.
+    Args:
+        request (track_batch_request): Track names, each with an optional artist.
+    Returns:
+        JSONResponse: Track data (or null if not found) per requested track, in request order.
+    '''
+    try:
+        session = trace_session(requests.Session(), "spotify")
+        track_data, cache_hits = resolve_tracks(
+            [(track.track_name, track.artist) for track in request.tracks], session
+        )
+        return JSONResponse(content={"track_data": track_data, "cache_hits": cache_hits})
+    except Exception as e:
+        logger.error(f"Error retrieving track data batch: {e}")
+        return JSONResponse(content={"error": str(e)}, status_code=500)
+
 class soundtrack_request(BaseModel):
     storyline: str
     artist: Optional[str] = None
+    candidate_pool: Optional[int] = None    # number of artist tracks to choose from (defaults to one per scene)
+    reuse_penalty: Optional[float] = Field(None, ge=0)   # allow a song in several scenes at this similarity penalty
+    segmenter: Optional[Literal["minilm", "esa"]] = None  # scene segmentation backend: "minilm" or the faster "esa"
+    max_scenes: Optional[int] = None        # scene budget: at most this many scenes (and Genius fetches)
+    target_scenes: Optional[int] = None     # split into exactly this many scenes, if the storyline is long enough
+    deadline_ms: Optional[int] = Field(None, gt=0)  # latency budget: degrade (fewer scenes, catalog tracks) rather than exceed it
 
 @app.post("/generate_soundtrack")
-def generate_soundtrack(request: soundtrack_request):
+def generate_soundtrack(request: soundtrack_request,
+                        x_profile_token: Optional[str] = Header(None),
+                        profile_token: Optional[str] = Query(None)):
     '''
     This is the main function that generates the soundtrack for the given storyline.
     Performs the following steps:
@@ -78,80 +221,41 @@ def generate_soundtrack(request: soundtrack_request):
     8. Assigns the top tracks to the scenes based on similarity.
     9. Returns the assigned tracks and their similarity to the scenes.
 
-    Tracking the time taken for each step using Prometheus metrics.
+    Tracking the time taken for each step using Prometheus metrics, and as spans of the request's
+    trace (with the ESA, Genius and Spotify calls inside each step; see tracing.py).
+    Sending the configured ARTISTIFY_PROFILE_TOKEN (X-Profile-Token header or profile_token query
+    parameter) also writes a per-stage cProfile and tracemalloc dump for this request to PROFILE_DIR.
+    A deadline_ms budget starts when the request arrives, so it also bounds the wait for a pipeline slot;
+    the response then lists the degradations applied to meet it and the time of each stage.
 
     Args:
         request (soundtrack_request): The request object containing the storyline and artist name.
+        x_profile_token (str): Optional profiling token header.
+        profile_token (str): Optional profiling token query parameter.
     Returns:
         JSONResponse: A JSON response containing the assigned tracks and their similarity to the scenes.
     '''
-    storyline = request.storyline
-    artist = request.artist
-
     # Increment the request counter
     request_counter.inc()
+    request_id = current_request_id()
+    deadline = Deadline(request.deadline_ms)
 
     try:
-        t1 = time.time()
-        scenes = split_into_scenes(storyline)
-
-        t2 = time.time()
-        scene_esa_vectors = [np.array(generate_esa_vectors(scene)) for scene in scenes]
-
-        t3 = time.time()
-        story_esa_vector = np.mean(scene_esa_vectors, axis=0)
-
-        t4 = time.time()
-        if not artist:
-            artist_recommender = ArtistRecommender()
-            best_artists = artist_recommender.predict(story_esa_vector)
-            best_artist = best_artists[0]
-        else:
-            best_artist = artist
-
-        t5 = time.time()
-        top_tracks = get_artist_top_tracks(best_artist, top_n=len(scenes))
-
-        t6 = time.time()
-        top_track_names = [track[1] for track in top_tracks]
-        top_track_lyrics = []
-        for track in top_tracks:
-            lyrics = track[2]
-            lyrics_start_index = lyrics.lower().find("lyrics")
-            if lyrics_start_index != -1:
-                lyrics = lyrics[lyrics_start_index + len("lyrics"):].strip()
-            top_track_lyrics.append(lyrics)
-
-        t7 = time.time()
-        tracks_esa_vectors = [np.array(generate_esa_vectors(lyrics)) for lyrics in top_track_lyrics]
-
-        t8 = time.time()
-        assignments, total_similarity, sim_matrix = assign_songs_to_scenes(scene_esa_vectors, tracks_esa_vectors)
-
-        t9 = time.time()
-        output_dict = {"Chosen Artist": best_artist}
-        for scene_index, track_index in assignments:
-            scene_text = scenes[scene_index]
-            assigned_song = top_track_names[track_index]
-            similarity_to_song = sim_matrix[scene_index, track_index]
-
-            # Fill in the output dictionary for each scene
-            output_dict[f"Scene {scene_index+1}"] = {
-                "scene_text": scene_text,
-                "assigned_song": assigned_song,
-                "similarity_to_song": similarity_to_song
-            }
-
-        performance_times = {
-            "scene_split_time": t2 - t1,
-            "esa_vector_generation_time": t3 - t2,
-            "story_esa_vector_time": t4 - t3,
-            "artist_recommendation_time": t5 - t4,
-            "top_tracks_retrieval_time": t6 - t5,
-            "top_track_lyrics_extraction_time": t7 - t6,
-            "tracks_esa_vector_generation_time": t8 - t7,
-            "song_assignment_time": t9 - t8
-        }
+        with admission_controller.admit(timeout=deadline.timeout()):
+            profiler = get_request_profiler(x_profile_token or profile_token, request_id)
+            with profiler or nullcontext():
+                output_dict, performance_times = run_soundtrack_pipeline(
+                    request.storyline,
+                    artist=request.artist,
+                    candidate_pool=request.candidate_pool,
+                    reuse_penalty=request.reuse_penalty,
+                    segmenter=request.segmenter,
+                    max_scenes=request.max_scenes,
+                    target_scenes=request.target_scenes,
+                    deadline_ms=request.deadline_ms,
+                    deadline_start=deadline.started_at,
+                    profiler=profiler
+                )
 
         # set the performance times to the Prometheus metrics
         scene_split_time.set(performance_times["scene_split_time"])
@@ -164,13 +268,101 @@ def generate_soundtrack(request: soundtrack_request):
         song_assignment_time.set(performance_times["song_assignment_time"])
 
         logger.info(f"Performance times: {performance_times}")
-        return JSONResponse(content=output_dict, status_code=200)
+        headers = {"X-Profile-Path": profiler.path} if profiler is not None else None
+        return JSONResponse(content=output_dict, status_code=200, headers=headers)
 
+    except AdmissionRejected as e:
+        return rejection_response(e)
+    except DeadlineExceeded as e:
+        logger.warning(f"Deadline exceeded: {e}")
+        return JSONResponse(content={"error": str(e)}, status_code=504)
     except Exception as e:
         logger.error(f"Error generating soundtrack: {e}")
         return JSONResponse(content={"error": str(e)}, status_code=500)
 
 
+class soundtrack_batch_request(BaseModel):
+    storylines: List[soundtrack_request]
+
+    @field_validator("storylines")
+    @classmethod
+    def no_deadlines(cls, storylines):
+        # the batch shares its stages across storylines, so a per-storyline budget cannot be honoured
+        if any(storyline.deadline_ms is not None for storyline in storylines):
+            raise ValueError("deadline_ms is not supported in batch requests; use /generate_soundtrack")
+        return storylines
+
+@app.post("/generate_soundtrack/batch")
+def generate_soundtrack_batch(request: soundtrack_batch_request):
+    '''
+    Generates soundtracks for many storylines at once, sharing the sentence encoding,
+    ESA transforms, recommender scoring and per-artist Genius fetches across them.
+    Args:
+        request (soundtrack_batch_request): The storylines (each with an optional artist).
+    Returns:
+        JSONResponse: The per-storyline results in request order and a batch throughput report.
+    '''
+    request_counter.inc(len(request.storylines))
+    try:
+        with admission_controller.admit():
+            results, batch_report = run_soundtrack_batch(request.storylines)
+        logger.info(f"Batch report: {batch_report}")
+        return JSONResponse(content={"results": results, "batch_report": batch_report}, status_code=200)
+    except AdmissionRejected as e:
+        return rejection_response(e)
+    except Exception as e:
+        logger.error(f"Error generating soundtrack batch: {e}")
+        return JSONResponse(content={"error": str(e)}, status_code=500)
+
+
+# Asynchronous jobs: long storylines are queued in SQLite and run by a separate worker pool,
+# so they do not hold an interactive slot. Under gunicorn the master runs the pool instead.
+JOB_WORKERS_IN_APP = os.getenv("JOB_WORKERS_IN_APP", "1") == "1"
+job_pool = JobWorkerPool() if JOB_WORKERS_IN_APP else None
+
+@app.on_event("startup")
+def start_job_workers():
+    if job_pool is not None:
+        job_pool.start()
+
+@app.on_event("shutdown")
+def stop_job_workers():
+    if job_pool is not None:
+        job_pool.stop()
+
+@app.post("/jobs/soundtrack", status_code=202)
+def submit_soundtrack_job(request: soundtrack_request):
+    '''
+    Queues a soundtrack job and returns immediately.
+    Args:
+        request (soundtrack_request): The same request as /generate_soundtrack.
+    Returns:
+        JSONResponse: The job ID to poll at /jobs/{job_id}.
+    '''
+    request_counter.inc()
+    try:
+        job_id = submit_job(request.model_dump())
+        return JSONResponse(content={"job_id": job_id, "status": "queued"}, status_code=202)
+    except Exception as e:
+        logger.error(f"Error queueing soundtrack job: {e}")
+        return JSONResponse(content={"error": str(e)}, status_code=500)
+
+@app.get("/jobs/{job_id}")
+def get_soundtrack_job(job_id: str):
+    '''
+    Status of a queued job: its partial results per finished stage, the final output when done,
+    and its queue wait and run time.
+    Args:
+        job_id (str): The ID returned by /jobs/soundtrack.
+    Returns:
+        JSONResponse: The job, or a 404 if the ID is unknown.
+    '''
+    job = get_job(job_id)
+    if job is None:
+        return JSONResponse(content={"error": "Unknown job"}, status_code=404)
+    return JSONResponse(content=job, status_code=200)
+
+
 @app.get("/")
 def root():
     return JSONResponse(content={"message": "Welcome to the Artistify API!"})
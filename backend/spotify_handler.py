@@ -1,19 +1,35 @@
 from dotenv import load_dotenv
 import os
+import re
+import time
+import sqlite3
 import requests
 import base64
 import json
 import logging
+import concurrent.futures
 from requests.adapters import HTTPAdapter, Retry
+from tracing import in_current_context, trace_session
+from log_setup import configure_logging, get_rate_limited_logger
 
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s", filename='debug.log', filemode='w')
 logger = logging.getLogger(__name__)
+per_item_logger = get_rate_limited_logger(__name__)     # messages logged once per track or API call
 
 load_dotenv()
 
 client_id = os.getenv("SPOTIFY_CLIENT_ID")
 client_secret = os.getenv("SPOTIFY_CLIENT_SECRET")
 
+# Point these at spotify_stub.py to run without Spotify credentials
+SPOTIFY_API_URL = os.getenv("SPOTIFY_API_URL", "https://api.spotify.com/v1")
+SPOTIFY_ACCOUNTS_URL = os.getenv("SPOTIFY_ACCOUNTS_URL", "https://accounts.spotify.com/api/token")
+
+# Persistent cache of resolved tracks, keyed by normalised "artist + title"
+SPOTIFY_CACHE_PATH = os.getenv("SPOTIFY_CACHE_PATH", "spotify_cache.sqlite3")
+SPOTIFY_CACHE_TTL = float(os.getenv("SPOTIFY_CACHE_TTL", str(7 * 24 * 3600)))
+SPOTIFY_SEARCH_WORKERS = int(os.getenv("SPOTIFY_SEARCH_WORKERS", "8"))
+MAX_IDS_PER_REQUEST = 50    # Spotify's limit for /v1/tracks?ids=
+
 def get_access_token(session):
     '''
     Get the access token for Spotify API using client credentials. 
@@ -34,7 +50,7 @@ def get_access_token(session):
     auth_b64 = str(base64.b64encode(auth_bytes), "utf-8")
 
     # make the request to get the access token
-    url = "https://accounts.spotify.com/api/token"
+    url = SPOTIFY_ACCOUNTS_URL
     headers = {
         "Authorization": "Basic " + auth_b64,
         "Content-Type": "application/x-www-form-urlencoded"
@@ -48,7 +64,7 @@ def get_access_token(session):
     
     if "access_token" in json_data:
         access_token = json_data["access_token"]
-        logger.info("Access token retrieved successfully.")
+        per_item_logger.info("Access token retrieved successfully.")
         return access_token
     else:
         logger.error("Failed to retrieve access token.")
@@ -71,21 +87,15 @@ def get_track_data(track_id, token, session):
         dict: A dictionary containing the track data, including image link, artist name, track name, and track ID.
     '''
     # make the request to get the track data
-    url = f'https://api.spotify.com/v1/tracks/{track_id}'
+    url = f'{SPOTIFY_API_URL}/tracks/{track_id}'
     headers = get_auth_header(token)
     response = session.get(url, headers=headers)
     json_data = json.loads(response.content)
-    image_link = json_data["album"]["images"][0]["url"]
 
     # create the output data dictionary
-    out_data = {
-        'image_link': image_link,
-        'artist': json_data["artists"][0]["name"],
-        'track_name': json_data["name"],
-        'id': json_data["id"],
-    }
+    out_data = track_summary(json_data)
     if "id" in out_data:
-        logger.info(f"Track data for track ID {track_id} retrieved successfully.")
+        per_item_logger.info(f"Track data for track ID {track_id} retrieved successfully.")
         return out_data
     else:
         logger.error(f"Failed to retrieve track data for track ID {track_id}.")
@@ -101,7 +111,7 @@ def search_track(track_name, token, session):
         tuple: A tuple containing the track ID and track name.
     '''
     # make the request to search for the track
-    url = 'https://api.spotify.com/v1/search'
+    url = f'{SPOTIFY_API_URL}/search'
     headers = get_auth_header(token)
 
     query = f"?q={track_name}&type=track&limit=1"
@@ -114,16 +124,197 @@ def search_track(track_name, token, session):
     if json_data:
         track_id = json_data["id"]
         track_name = json_data["name"]
-        logger.info(f"Track ID for {track_name} retrieved successfully.")
+        per_item_logger.info(f"Track ID for {track_name} retrieved successfully.")
         return track_id, track_name
     else:
         logger.error(f"Failed to retrieve track ID for {track_name}.")
         raise Exception(f"Failed to retrieve track ID for {track_name}.")
 
 
+def track_summary(json_data):
+    '''
+    The fields the frontend needs from a Spotify track object.
+    '''
+    images = json_data["album"]["images"]
+    return {
+        'image_link': images[0]["url"] if images else None,
+        'artist': json_data["artists"][0]["name"],
+        'track_name': json_data["name"],
+        'id': json_data["id"],
+    }
+
+def normalize_track_key(track_name, artist=None):
+    '''
+    Cache key for a track lookup: lowercased "artist + title" without punctuation or extra spaces.
+    '''
+    text = f"{artist or ''} {track_name}".lower()
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s]", " ", text)).strip()
+
+class TrackCache:
+    '''
+    SQLite cache mapping normalised track keys to Spotify track data, with a time-to-live.
+    Shared by all workers on the host; entries older than the TTL are refreshed from Spotify.
+    '''
+
+    def __init__(self, path=SPOTIFY_CACHE_PATH, ttl=SPOTIFY_CACHE_TTL):
+        '''
+        Args:
+            path (str): SQLite database file.
+            ttl (float): Seconds an entry stays valid.
+        '''
+        self.path = path
+        self.ttl = ttl
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS tracks (key TEXT PRIMARY KEY, data TEXT NOT NULL, fetched_at REAL NOT NULL)")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def get_many(self, keys):
+        '''
+        Args:
+            keys (list): Normalised track keys.
+        Returns:
+            dict: The unexpired cached track data per key found.
+        '''
+        if not keys:
+            return {}
+        keys = list(set(keys))
+        placeholders = ",".join("?" * len(keys))
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"SELECT key, data FROM tracks WHERE key IN ({placeholders}) AND fetched_at > ?",
+                keys + [time.time() - self.ttl]
+            ).fetchall()
+        finally:
+            conn.close()
+        return {key: json.loads(data) for key, data in rows}
+
+    def put_many(self, items):
+        '''
+        Args:
+            items (dict): Track data per normalised key.
+        '''
+        if not items:
+            return
+        now = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO tracks (key, data, fetched_at) VALUES (?, ?, ?)",
+                    [(key, json.dumps(data), now) for key, data in items.items()]
+                )
+        finally:
+            conn.close()
+
+_track_cache = None
+
+def get_track_cache():
+    '''
+    Per-process TrackCache on SPOTIFY_CACHE_PATH.
+    '''
+    global _track_cache
+    if _track_cache is None:
+        _track_cache = TrackCache()
+    return _track_cache
+
+def search_track_id(track_name, token, session, artist=None):
+    '''
+    Search for a track and return its Spotify ID, or None if nothing matches.
+    Args:
+        track_name (str): The track title.
+        token (str): The access token for Spotify API.
+        session (requests.Session): The requests session to use for the API call.
+        artist (str): Optional artist to narrow the search.
+    Returns:
+        str: The track ID, or None.
+    '''
+    query = f"track:{track_name} artist:{artist}" if artist else track_name
+    response = session.get(f'{SPOTIFY_API_URL}/search', headers=get_auth_header(token),
+                           params={"q": query, "type": "track", "limit": 1}, timeout=10)
+    response.raise_for_status()
+    items = response.json()["tracks"]["items"]
+    return items[0]["id"] if items else None
+
+def get_tracks_data(track_ids, token, session):
+    '''
+    Fetch track data for many IDs with Spotify's multi-ID endpoint (50 IDs per request).
+    Args:
+        track_ids (list): Spotify track IDs.
+        token (str): The access token for Spotify API.
+        session (requests.Session): The requests session to use for the API call.
+    Returns:
+        dict: Track data (see track_summary) per track ID found.
+    '''
+    tracks = {}
+    for start in range(0, len(track_ids), MAX_IDS_PER_REQUEST):
+        ids = track_ids[start:start + MAX_IDS_PER_REQUEST]
+        response = session.get(f'{SPOTIFY_API_URL}/tracks', headers=get_auth_header(token),
+                               params={"ids": ",".join(ids)}, timeout=10)
+        response.raise_for_status()
+        for json_data in response.json()["tracks"]:
+            if json_data:
+                tracks[json_data["id"]] = track_summary(json_data)
+    return tracks
+
+def resolve_tracks(queries, session, cache=None, max_workers=SPOTIFY_SEARCH_WORKERS):
+    '''
+    Resolve many tracks to Spotify track data: cached tracks are returned directly, the rest are
+    searched concurrently and fetched with one multi-ID call, then cached.
+    Args:
+        queries (list): (track_name, artist) pairs; artist may be None.
+        session (requests.Session): The requests session to use for the API calls.
+        cache (TrackCache): Cache to use (defaults to the per-process cache).
+        max_workers (int): Concurrent search requests.
+    Returns:
+        tuple: Track data (or None if not found) per query in input order, and the number of cache hits.
+    '''
+    cache = cache or get_track_cache()
+    keys = [normalize_track_key(track_name, artist) for track_name, artist in queries]
+    found = cache.get_many(keys)
+    cache_hits = sum(key in found for key in keys)
+
+    misses = {}
+    for key, query in zip(keys, queries):
+        if key not in found:
+            misses.setdefault(key, query)
+
+    if misses:
+        token = get_access_token(session)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                key: executor.submit(in_current_context(search_track_id), track_name, token, session, artist)
+                for key, (track_name, artist) in misses.items()
+            }
+        track_ids = {}
+        for key, future in futures.items():
+            try:
+                track_id = future.result()
+            except Exception as e:
+                logger.error(f"Search failed for {key}: {e}")
+                continue
+            if track_id:
+                track_ids[key] = track_id
+            else:
+                per_item_logger.warning(f"No Spotify track found for {key}.")
+
+        tracks = get_tracks_data(list(dict.fromkeys(track_ids.values())), token, session)
+        fetched = {key: tracks[track_id] for key, track_id in track_ids.items() if track_id in tracks}
+        cache.put_many(fetched)
+        found.update(fetched)
+
+    logger.info(f"Resolved {len(queries)} tracks ({cache_hits} from cache).")
+    return [found.get(key) for key in keys], cache_hits
+
+
 if __name__ == "__main__":
 
-    session = requests.Session()
+    configure_logging()
+    session = trace_session(requests.Session(), "spotify")
 
     retry_strategy = Retry(
     total=5,
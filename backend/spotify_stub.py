@@ -0,0 +1,93 @@
+from fastapi import FastAPI, Query
+from fastapi.responses import JSONResponse
+import argparse
+import uvicorn
+
+# Local stand-in for the parts of the Spotify Web API that spotify_handler.py calls.
+# Run it and point the handler at it:
+#   python spotify_stub.py --port 8090
+#   SPOTIFY_API_URL=http://localhost:8090/v1 SPOTIFY_ACCOUNTS_URL=http://localhost:8090/api/token \
+#   SPOTIFY_CLIENT_ID=stub SPOTIFY_CLIENT_SECRET=stub python routes.py
+# GET /stats reports how many calls each endpoint received, e.g. to check cache hits.
+
+CATALOG = [
+    ("Taylor Swift", "Love Story"),
+    ("Taylor Swift", "Shake It Off"),
+    ("Ed Sheeran", "Shape of You"),
+    ("Ed Sheeran", "Perfect"),
+    ("Adele", "Hello"),
+    ("Adele", "Someone Like You"),
+    ("Morgan Wallen", "Last Night"),
+    ("Eminem", "Lose Yourself"),
+]
+
+TRACKS = {
+    f"stub{i:04d}": {
+        "id": f"stub{i:04d}",
+        "name": title,
+        "artists": [{"name": artist}],
+        "album": {"images": [{"url": f"https://example.com/covers/stub{i:04d}.jpg"}]},
+    }
+    for i, (artist, title) in enumerate(CATALOG)
+}
+
+calls = {"token": 0, "search": 0, "track": 0, "tracks": 0}
+
+app = FastAPI()
+
+
+def parse_query(q):
+    '''
+    Split a search query into (title, artist); supports plain text and "track:... artist:..." filters.
+    '''
+    q = q.lower()
+    if "artist:" in q:
+        title, artist = q.split("artist:", 1)
+        return title.replace("track:", "").strip(), artist.strip()
+    return q.replace("track:", "").strip(), None
+
+
+@app.post("/api/token")
+def token():
+    calls["token"] += 1
+    return {"access_token": "stub-token", "token_type": "Bearer", "expires_in": 3600}
+
+
+@app.get("/v1/search")
+def search(q: str, type: str = "track", limit: int = 1):
+    calls["search"] += 1
+    title, artist = parse_query(q)
+    items = [
+        track for track in TRACKS.values()
+        if title in track["name"].lower() and (artist is None or artist in track["artists"][0]["name"].lower())
+    ]
+    return {"tracks": {"items": items[:limit]}}
+
+
+@app.get("/v1/tracks/{track_id}")
+def track(track_id: str):
+    calls["track"] += 1
+    if track_id not in TRACKS:
+        return JSONResponse(content={"error": {"status": 404, "message": "Not found"}}, status_code=404)
+    return TRACKS[track_id]
+
+
+@app.get("/v1/tracks")
+def tracks(ids: str = Query(...)):
+    calls["tracks"] += 1
+    requested = ids.split(",")
+    if len(requested) > 50:
+        return JSONResponse(content={"error": {"status": 400, "message": "Too many ids"}}, status_code=400)
+    return {"tracks": [TRACKS.get(track_id) for track_id in requested]}
+
+
+@app.get("/stats")
+def stats():
+    return calls
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Spotify Web API stub.")
+    parser.add_argument("--port", type=int, default=8090)
+    args = parser.parse_args()
+    uvicorn.run(app=app, host="127.0.0.1", port=args.port, log_level="warning")
@@ -0,0 +1,307 @@
+# synthetic_data.py
+# Deterministic synthetic datasets for scale tests: vocabularies, concept corpora, lyrics-like text,
+# storylines, ESA-like vectors and whole catalogs in the CSV and Parquet layouts the services read.
+#
+#   python synthetic_data.py --tracks 100000 --concepts 10000 --storylines 100 --out synthetic_data
+
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from model import CATALOG_PARTITIONING
+
+SEED = 5402
+CHUNK_SIZE = 100_000        # rows generated (and written) at a time, so 1M-row catalogs fit in memory
+SYNTHETIC_VERSION = "synthetic"
+
+# common words mixed into the text, like the function words and refrains of real lyrics and stories
+FILLER = ["i", "you", "the", "my", "and", "we", "oh", "baby", "yeah", "love", "night", "heart", "tonight",
+          "never", "she", "he", "was", "in", "to", "a", "of", "home", "time", "away"]
+SYLLABLES = ["ka", "lo", "mi", "ra", "ten", "su", "vor", "el", "an", "dri", "po", "nu", "sha", "ther", "ix", "qua"]
+
+_zipf_cdfs = {}
+
+
+def synthetic_vocabulary(size=20_000, seed=SEED):
+    """
+    Distinct pronounceable made-up words, all alphanumeric so preprocessing keeps them.
+
+    Parameters:
+    -----------
+    size : int
+        Number of words.
+    seed : int
+        Random seed.
+
+    Returns:
+    --------
+    np.ndarray
+        The words, in rank order for `zipf_choice`.
+    """
+    rng = np.random.default_rng(seed)
+    words, seen = [], set()
+    length = 2
+    while len(words) < size:
+        candidates = rng.integers(0, len(SYLLABLES), size=(size, length))
+        for syllables in candidates:
+            word = "".join(SYLLABLES[s] for s in syllables)
+            if word not in seen:
+                seen.add(word)
+                words.append(word)
+                if len(words) == size:
+                    break
+        length += 1
+    return np.array(words)
+
+
+def zipf_choice(rng, vocabulary, size, exponent=1.1):
+    """
+    Words drawn with Zipfian frequencies (word i has weight 1 / (i + 1) ** exponent), like natural text.
+    """
+    key = (len(vocabulary), exponent)
+    if key not in _zipf_cdfs:
+        cdf = np.cumsum(1.0 / np.arange(1, len(vocabulary) + 1) ** exponent)
+        _zipf_cdfs[key] = cdf / cdf[-1]
+    return vocabulary[np.searchsorted(_zipf_cdfs[key], rng.random(size))]
+
+
+def synthetic_text(rng, vocabulary, sentences, words_per_sentence=(6, 14), filler_share=0.4, separator=" "):
+    """
+    Text of `sentences` sentences mixing filler words with Zipfian vocabulary terms.
+
+    Parameters:
+    -----------
+    rng : np.random.Generator
+        Random generator.
+    vocabulary : np.ndarray
+        Words from `synthetic_vocabulary`.
+    sentences : int
+        Number of sentences.
+    words_per_sentence : tuple of int
+        Range of sentence lengths.
+    filler_share : float
+        Share of filler words.
+    separator : str
+        Joins the sentences (" " for prose, "\\n" for lyrics).
+
+    Returns:
+    --------
+    str
+        The text.
+    """
+    lengths = rng.integers(words_per_sentence[0], words_per_sentence[1] + 1, size=sentences)
+    words = np.where(rng.random(lengths.sum()) < filler_share,
+                     rng.choice(FILLER, lengths.sum()), zipf_choice(rng, vocabulary, lengths.sum()))
+    ends = np.cumsum(lengths)
+    return separator.join(" ".join(words[end - length:end]).capitalize() + "."
+                          for end, length in zip(ends, lengths))
+
+
+def synthetic_lyrics(rng, vocabulary, lines=16):
+    """
+    Lyrics-like text: short lines, one sentence each.
+    """
+    return synthetic_text(rng, vocabulary, lines, words_per_sentence=(4, 9), filler_share=0.6, separator="\n")
+
+
+def synthetic_storylines(n, vocabulary, sentences=40, seed=SEED):
+    """
+    Storylines of `sentences` sentences each.
+
+    Returns:
+    --------
+    list of str
+        The storylines.
+    """
+    rng = np.random.default_rng([seed, 1])
+    return [synthetic_text(rng, vocabulary, sentences) for _ in range(n)]
+
+
+def synthetic_corpus(n_concepts, vocabulary, terms_per_concept=60, home_terms=200, seed=SEED):
+    """
+    Concept corpus in the layout of corpus/lemmatized_corpus.json (concept name -> lemmatised text).
+
+    Every concept draws most of its terms from its own window of the vocabulary and the rest with
+    global Zipfian frequencies, so concepts are distinguishable and IDF weights are realistic.
+
+    Parameters:
+    -----------
+    n_concepts : int
+        Number of concepts (ESA dimensions).
+    vocabulary : np.ndarray
+        Words from `synthetic_vocabulary`.
+    terms_per_concept : int
+        Words per concept text.
+    home_terms : int
+        Size of each concept's own vocabulary window.
+    seed : int
+        Random seed.
+
+    Returns:
+    --------
+    dict
+        Concept name -> text.
+    """
+    rng = np.random.default_rng([seed, 2])
+    corpus = {}
+    for start in range(0, n_concepts, CHUNK_SIZE):
+        n = min(CHUNK_SIZE, n_concepts - start)
+        offsets = rng.integers(0, len(vocabulary) - home_terms, size=(n, 1))
+        home = vocabulary[offsets + rng.integers(0, home_terms, size=(n, terms_per_concept))]
+        common = zipf_choice(rng, vocabulary, n * terms_per_concept).reshape(n, terms_per_concept)
+        terms = np.where(rng.random((n, terms_per_concept)) < 0.7, home, common)
+        for i, row in enumerate(terms):
+            corpus[f"Concept {start + i:07d}"] = " ".join(row)
+    return corpus
+
+
+def esa_like_vectors(rng, n, dim, styles):
+    """
+    Non-negative vectors skewed towards a few strong concepts, scattered around the given style vectors.
+
+    Parameters:
+    -----------
+    rng : np.random.Generator
+        Random generator.
+    n : int
+        Number of vectors.
+    dim : int
+        Dimension (number of ESA concepts).
+    styles : np.ndarray
+        Centre vector of each row, shape (n, dim).
+
+    Returns:
+    --------
+    np.ndarray
+        Array of shape (n, dim).
+    """
+    return styles + 0.3 * rng.random((n, dim)) ** 4
+
+
+def iter_catalog_chunks(n_tracks, dim=75, vocabulary=None, tracks_per_artist=10, lyrics_lines=8, seed=SEED):
+    """
+    Synthetic catalog rows, CHUNK_SIZE at a time. Tracks of one artist share a style vector.
+
+    Parameters:
+    -----------
+    n_tracks : int
+        Number of tracks.
+    dim : int
+        ESA vector dimension.
+    vocabulary : np.ndarray, optional
+        Words for the lyrics; without it the lyrics column is empty.
+    tracks_per_artist : int
+        Tracks per artist.
+    lyrics_lines : int
+        Lines of lyrics per track.
+    seed : int
+        Random seed; each chunk has its own stream, so chunks can be generated independently.
+
+    Yields:
+    -------
+    pd.DataFrame
+        artist, track, lyrics, esa_vector (np.ndarray rows) and esa_version columns.
+    """
+    for start in range(0, n_tracks, CHUNK_SIZE):
+        rng = np.random.default_rng([seed, 3, start])
+        n = min(CHUNK_SIZE, n_tracks - start)
+        ids = np.arange(start, start + n)
+        artist_ids = ids // tracks_per_artist
+        first_artist = artist_ids[0]
+        artist_styles = np.random.default_rng([seed, 4, start]).random((artist_ids[-1] - first_artist + 1, dim)) ** 4
+        vectors = esa_like_vectors(rng, n, dim, artist_styles[artist_ids - first_artist])
+        lyrics = ([synthetic_lyrics(rng, vocabulary, lyrics_lines) for _ in range(n)]
+                  if vocabulary is not None else [""] * n)
+        yield pd.DataFrame({
+            "artist": [f"Artist {a:06d}" for a in artist_ids],
+            "track": [f"Track {i:07d}" for i in ids],
+            "lyrics": lyrics,
+            "esa_vector": list(vectors),
+            "esa_version": SYNTHETIC_VERSION,
+        })
+
+
+def write_catalog_csv(chunks, path):
+    """
+    Write catalog chunks as a catalog CSV (vectors as nested-list strings, like esa_vectors_all_lyrics.csv).
+    """
+    for i, chunk in enumerate(chunks):
+        chunk = chunk.assign(esa_vector=["[[" + ", ".join(map(str, vector.tolist())) + "]]"
+                                         for vector in chunk["esa_vector"]])
+        chunk.to_csv(path, index=False, mode="w" if i == 0 else "a", header=i == 0)
+
+
+def write_catalog_parquet(chunks, path, ingest_run=SYNTHETIC_VERSION):
+    """
+    Write catalog chunks as a Parquet catalog partitioned like the Spark ingestion job's output.
+    """
+    for i, chunk in enumerate(chunks):
+        vectors = np.stack(chunk["esa_vector"].to_numpy())
+        offsets = np.arange(0, vectors.size + 1, vectors.shape[1], dtype=np.int32)
+        table = pa.table({
+            "artist": chunk["artist"].to_numpy(dtype=object),
+            "track": chunk["track"].to_numpy(dtype=object),
+            "lyrics": chunk["lyrics"].to_numpy(dtype=object),
+            "esa_vector": pa.ListArray.from_arrays(pa.array(offsets), pa.array(vectors.astype(np.float64).ravel())),
+            "esa_version": chunk["esa_version"].to_numpy(dtype=object),
+            "ingest_run": np.full(len(chunk), ingest_run, dtype=object),
+        })
+        ds.write_dataset(table, path, format="parquet", partitioning=CATALOG_PARTITIONING,
+                         basename_template=f"part-{i:05d}-{{i}}.parquet", existing_data_behavior="overwrite_or_ignore")
+
+
+def write_synthetic_dataset(output_dir, n_tracks=None, n_concepts=None, n_storylines=None, dim=75,
+                            vocabulary_size=20_000, seed=SEED):
+    """
+    Write a synthetic catalog (CSV and Parquet), concept corpus and storylines to output_dir.
+
+    Parameters:
+    -----------
+    output_dir : str
+        Directory for catalog.csv, catalog.parquet/, corpus.json and storylines.json.
+    n_tracks, n_concepts, n_storylines : int, optional
+        Sizes of the parts to write; parts without a size are skipped.
+    dim : int
+        ESA vector dimension of the catalog.
+    vocabulary_size : int
+        Distinct words in the text.
+    seed : int
+        Random seed.
+
+    Returns:
+    --------
+    dict
+        Paths of the written files.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    vocabulary = synthetic_vocabulary(vocabulary_size, seed)
+    paths = {}
+    if n_tracks:
+        paths["catalog_csv"] = os.path.join(output_dir, "catalog.csv")
+        paths["catalog_parquet"] = os.path.join(output_dir, "catalog.parquet")
+        write_catalog_csv(iter_catalog_chunks(n_tracks, dim, vocabulary, seed=seed), paths["catalog_csv"])
+        write_catalog_parquet(iter_catalog_chunks(n_tracks, dim, vocabulary, seed=seed), paths["catalog_parquet"])
+    if n_concepts:
+        paths["corpus"] = os.path.join(output_dir, "corpus.json")
+        with open(paths["corpus"], "w") as file:
+            json.dump(synthetic_corpus(n_concepts, vocabulary, seed=seed), file)
+    if n_storylines:
+        paths["storylines"] = os.path.join(output_dir, "storylines.json")
+        with open(paths["storylines"], "w") as file:
+            json.dump(synthetic_storylines(n_storylines, vocabulary, seed=seed), file)
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a deterministic synthetic dataset for scale tests.")
+    parser.add_argument("--out", default="synthetic_data")
+    parser.add_argument("--tracks", type=int, default=None)
+    parser.add_argument("--concepts", type=int, default=None)
+    parser.add_argument("--storylines", type=int, default=None)
+    parser.add_argument("--dim", type=int, default=75)
+    parser.add_argument("--seed", type=int, default=SEED)
+    args = parser.parse_args()
+    print(write_synthetic_dataset(args.out, args.tracks, args.concepts, args.storylines, args.dim, seed=args.seed))
@@ -0,0 +1,77 @@
+import os
+import sys
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def available_cores():
+    """
+    Cores this process may run on (its CPU affinity, which container CPU pinning restricts).
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+# One core budget per worker process, split between concurrent pipelines and the threads each one uses:
+# PIPELINE_CONCURRENCY * PIPELINE_THREADS <= THREAD_BUDGET_CORES
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+THREAD_BUDGET_CORES = int(os.getenv("THREAD_BUDGET_CORES", "0")) or max(1, available_cores() // WEB_CONCURRENCY)
+# Threads one pipeline's native calls may use: torch intra-op (MiniLM), OpenBLAS/MKL and OpenMP (sklearn, scipy)
+PIPELINE_THREADS = int(os.getenv("PIPELINE_THREADS", "0")) or min(2, THREAD_BUDGET_CORES)
+# Pipelines admitted at once; an explicit ADMISSION_MAX_CONCURRENT takes precedence over the split
+PIPELINE_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENT", "0")) or max(1, THREAD_BUDGET_CORES // PIPELINE_THREADS)
+# Request threads beyond the admitted and queued pipelines, for /metrics, Spotify lookups and job polling
+REQUEST_THREADS_SPARE = int(os.getenv("REQUEST_THREADS_SPARE", "8"))
+
+# Native pools size themselves from these when they start, so numpy, sklearn and torch imported
+# after this module already start with the pipeline's share; apply_thread_budget covers those loaded earlier
+for variable in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "RAYON_NUM_THREADS"):
+    os.environ.setdefault(variable, str(PIPELINE_THREADS))
+
+
+def limit_torch_threads(threads=PIPELINE_THREADS):
+    """
+    Set torch's intra-op threads (process-wide, so every concurrent encode shares this setting).
+    """
+    import torch
+    torch.set_num_threads(threads)
+
+
+def apply_thread_budget(threads=PIPELINE_THREADS):
+    """
+    Limit the BLAS and OpenMP pools loaded so far, and torch's if it is loaded, to `threads` each.
+
+    Parameters:
+    -----------
+    threads : int
+        Threads per pipeline.
+
+    Returns:
+    --------
+    list of dict
+        The native thread pools and their limits, as reported by threadpoolctl.
+    """
+    from threadpoolctl import threadpool_limits, threadpool_info
+
+    threadpool_limits(limits=threads)
+    if "torch" in sys.modules:
+        limit_torch_threads(threads)
+    pools = threadpool_info()
+    logger.info(f"Thread budget: {THREAD_BUDGET_CORES} cores = {PIPELINE_CONCURRENCY} pipelines x {threads} threads "
+                f"({', '.join(sorted({pool['internal_api'] for pool in pools})) or 'no native pools loaded'}).")
+    if PIPELINE_CONCURRENCY * threads > THREAD_BUDGET_CORES:
+        logger.warning(f"{PIPELINE_CONCURRENCY} pipelines x {threads} threads oversubscribe the "
+                       f"{THREAD_BUDGET_CORES}-core budget.")
+    return pools
+
+
+def limit_request_threads(total):
+    """
+    Size the threadpool Starlette runs sync endpoints on (anyio's default limiter, 40 threads otherwise).
+    Must be called from the event loop, e.g. in a startup handler.
+    """
+    import anyio.to_thread
+    anyio.to_thread.current_default_thread_limiter().total_tokens = total
@@ -0,0 +1,160 @@
+import os
+import re
+import sys
+import uuid
+import logging
+import contextvars
+from contextlib import contextmanager
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider, SpanProcessor
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+from opentelemetry.trace import SpanKind, Status, StatusCode
+from profiling import profiled_call
+
+logger = logging.getLogger(__name__)
+
+# "file" appends one JSON span per line to TRACE_FILE, "console" prints spans to stdout, "none" disables export
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "file")
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "artistify")
+
+# Client-supplied request IDs are echoed back and used in file paths, so only plain tokens are accepted
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+# Spans are no-ops until configure_tracing() installs a provider, so batch jobs and scripts pay nothing
+tracer = trace.get_tracer("artistify")
+
+_request_id = contextvars.ContextVar("request_id", default=None)
+_configured = False
+
+
+class RequestIdSpanProcessor(SpanProcessor):
+    '''
+    Stamps every span with the ID of the request it belongs to, so one grep of the trace
+    file finds all spans of a request, including those started on worker threads.
+    '''
+
+    def on_start(self, span, parent_context=None):
+        request_id = _request_id.get()
+        if request_id is not None:
+            span.set_attribute("request.id", request_id)
+
+
+def configure_tracing(exporter=TRACE_EXPORTER, trace_file=TRACE_FILE):
+    '''
+    Install the process-wide tracer provider and exporter (once per process).
+    Args:
+        exporter (str): "file", "console" or "none".
+        trace_file (str): Output file for the "file" exporter.
+    Returns:
+        bool: True if spans are exported.
+    '''
+    global _configured
+    if _configured or exporter == "none":
+        return _configured
+
+    if exporter == "file":
+        out = open(trace_file, "a")
+        span_exporter = ConsoleSpanExporter(out=out, formatter=lambda span: span.to_json(indent=None) + "\n")
+    elif exporter == "console":
+        span_exporter = ConsoleSpanExporter(out=sys.stdout)
+    else:
+        raise ValueError(f"Unknown TRACE_EXPORTER {exporter!r}; expected 'file', 'console' or 'none'.")
+
+    provider = TracerProvider(resource=Resource.create({"service.name": TRACE_SERVICE_NAME}))
+    provider.add_span_processor(RequestIdSpanProcessor())
+    provider.add_span_processor(BatchSpanProcessor(span_exporter))
+    trace.set_tracer_provider(provider)
+    _configured = True
+    logger.info(f"Exporting trace spans to {trace_file if exporter == 'file' else exporter}.")
+    return True
+
+
+def new_request_id(client_request_id=None):
+    '''
+    The ID for a new request: the client's X-Request-ID if it is a plain token, else a fresh one.
+    '''
+    if client_request_id and REQUEST_ID_PATTERN.match(client_request_id):
+        return client_request_id
+    return uuid.uuid4().hex
+
+
+def current_request_id():
+    '''
+    ID of the request being handled in this context, or None outside a request.
+    '''
+    return _request_id.get()
+
+
+@contextmanager
+def request_span(name, request_id, **attributes):
+    '''
+    Root span of one request (or job); every span started inside it, on this thread or on threads
+    started through in_current_context, becomes its descendant and carries the request ID.
+    If the web framework already opened a server span for the request, that span is annotated
+    instead of nesting a duplicate under it.
+    Args:
+        name (str): Span name, e.g. "POST /generate_soundtrack".
+        request_id (str): ID returned to the client in X-Request-ID.
+        attributes: Extra span attributes.
+    Yields:
+        opentelemetry.trace.Span: The request span.
+    '''
+    token = _request_id.set(request_id)
+    try:
+        current = trace.get_current_span()
+        if current.is_recording() and getattr(current, "kind", None) == SpanKind.SERVER:
+            current.set_attributes({"request.id": request_id, **attributes})
+            yield current
+        else:
+            with tracer.start_as_current_span(name, kind=SpanKind.SERVER,
+                                              attributes={"request.id": request_id, **attributes}) as span:
+                yield span
+    finally:
+        _request_id.reset(token)
+
+
+def trace_id(span):
+    '''
+    Hex trace ID of a span (all zeros when tracing is not configured).
+    '''
+    return trace.format_trace_id(span.get_span_context().trace_id)
+
+
+def in_current_context(function):
+    '''
+    Wrap function so it runs in the caller's tracing context (current span and request ID)
+    when submitted to a thread pool; each call gets its own copy of the context. If the caller's
+    stage is being profiled, the call is added to that stage's profile (see profiling.py).
+    '''
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.copy().run(profiled_call, function, *args, **kwargs)
+    return run
+
+
+def trace_session(session, service):
+    '''
+    Record every HTTP call made through a requests session as a client span.
+    Args:
+        session (requests.Session): The session to instrument (e.g. the Genius client's, or a Spotify session).
+        service (str): Remote service name, used in the span name.
+    Returns:
+        requests.Session: The same session.
+    '''
+    send = session.request
+
+    def traced_request(method, url, *args, **kwargs):
+        with tracer.start_as_current_span(f"{service} {method}", kind=SpanKind.CLIENT,
+                                          attributes={"http.method": method, "http.url": url,
+                                                      "peer.service": service}) as span:
+            response = send(method, url, *args, **kwargs)
+            span.set_attribute("http.status_code", response.status_code)
+            if response.status_code >= 400:
+                span.set_status(Status(StatusCode.ERROR))
+            return response
+
+    session.request = traced_request
+    return session
@@ -0,0 +1,405 @@
+import os
+import json
+import shutil
+import logging
+import numpy as np
+from model import load_artist_esa_vectors, serving_catalog
+
+logger = logging.getLogger(__name__)
+
+TRACK_INDEX_DIR = os.getenv("TRACK_INDEX_DIR", "track_index")
+MANIFEST_FILE = "manifest.json"
+
+_loaded_indexes = {}
+
+
+def _normalise(vectors):
+    """
+    Unit-length float32 rows (zero rows are left as zeros).
+    """
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def spherical_kmeans(vectors, n_clusters, n_iter=10, seed=5402):
+    """
+    K-means on unit vectors using cosine similarity (centroids are re-normalised every step).
+
+    Parameters:
+    -----------
+    vectors : np.ndarray
+        Unit-length training vectors.
+    n_clusters : int
+        Number of centroids.
+    n_iter : int
+        Number of Lloyd iterations.
+    seed : int
+        Seed for the initial centroid sample.
+
+    Returns:
+    --------
+    np.ndarray
+        Centroids of shape (n_clusters, dim).
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        labels = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        empty = np.bincount(labels, minlength=n_clusters) == 0
+        # Re-seed empty clusters so every inverted list stays useful
+        sums[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()), replace=False)]
+        centroids = _normalise(sums)
+    return centroids
+
+
+class TrackIndex:
+    """
+    Inverted-file (IVF) approximate nearest-neighbour index over track ESA vectors.
+
+    Vectors are normalised and bucketed by their nearest k-means centroid. A query scans the
+    `nprobe` closest buckets on float16 copies of the vectors and optionally re-ranks the best
+    candidates against the exact float32 vectors.
+    """
+
+    def __init__(self, centroids, nprobe=8):
+        """
+        Parameters:
+        -----------
+        centroids : np.ndarray
+            Coarse quantiser centroids of shape (n_lists, dim).
+        nprobe : int
+            Default number of lists scanned per query.
+        """
+        self.centroids = _normalise(centroids)
+        self.nprobe = nprobe
+        self.keys = []
+        self._key_set = set()
+        self._size = 0
+        dim = self.centroids.shape[1]
+        self._vectors = np.zeros((0, dim), dtype=np.float32)
+        self._codes = np.zeros((0, dim), dtype=np.float16)
+        self._list_rows = [np.zeros(0, dtype=np.int64) for _ in range(self.n_lists)]
+        self._artist_rows = None
+
+    @classmethod
+    def train(cls, vectors, n_lists=None, nprobe=8, sample_size=100_000, seed=5402):
+        """
+        Train the coarse quantiser on (a sample of) `vectors` and return an empty index.
+
+        Parameters:
+        -----------
+        vectors : np.ndarray
+            Training vectors.
+        n_lists : int, optional
+            Number of inverted lists (defaults to about 4 * sqrt(n)).
+        nprobe : int
+            Default number of lists scanned per query.
+        sample_size : int
+            Maximum number of vectors used for k-means.
+        seed : int
+            Random seed for sampling and initialisation.
+
+        Returns:
+        --------
+        TrackIndex
+            An index with trained centroids and no entries.
+        """
+        vectors = _normalise(vectors)
+        if n_lists is None:
+            n_lists = max(1, int(4 * np.sqrt(len(vectors))))
+        n_lists = min(n_lists, len(vectors))
+        rng = np.random.default_rng(seed)
+        if len(vectors) > sample_size:
+            vectors = vectors[rng.choice(len(vectors), size=sample_size, replace=False)]
+        return cls(spherical_kmeans(vectors, n_lists, seed=seed), nprobe=nprobe)
+
+    @property
+    def n_lists(self):
+        return self.centroids.shape[0]
+
+    def __len__(self):
+        return self._size
+
+    def _reserve(self, extra):
+        """
+        Grow the vector stores geometrically so repeated inserts stay amortised O(1).
+        """
+        needed = self._size + extra
+        if needed <= len(self._vectors):
+            return
+        capacity = max(needed, 2 * len(self._vectors), 1024)
+        vectors = np.zeros((capacity, self.centroids.shape[1]), dtype=np.float32)
+        codes = np.zeros((capacity, self.centroids.shape[1]), dtype=np.float16)
+        vectors[:self._size] = self._vectors[:self._size]
+        codes[:self._size] = self._codes[:self._size]
+        self._vectors, self._codes = vectors, codes
+
+    def add(self, vectors, keys):
+        """
+        Insert vectors into the index. Keys already present are skipped.
+
+        Parameters:
+        -----------
+        vectors : np.ndarray
+            Vectors to insert, one row per key.
+        keys : list of tuple
+            Identifier per vector, e.g. (artist, track).
+
+        Returns:
+        --------
+        int
+            Number of vectors inserted.
+        """
+        keys = [tuple(key) for key in keys]
+        fresh = [i for i, key in enumerate(keys) if key not in self._key_set]
+        if not fresh:
+            return 0
+        vectors = _normalise(np.asarray(vectors)[fresh])
+        keys = [keys[i] for i in fresh]
+
+        self._reserve(len(keys))
+        rows = np.arange(self._size, self._size + len(keys))
+        self._vectors[rows] = vectors
+        self._codes[rows] = vectors.astype(np.float16)
+
+        labels = np.argmax(vectors @ self.centroids.T, axis=1)
+        for list_id in np.unique(labels):
+            self._list_rows[list_id] = np.concatenate([self._list_rows[list_id], rows[labels == list_id]])
+
+        self.keys.extend(keys)
+        self._key_set.update(keys)
+        self._size += len(keys)
+        self._artist_rows = None
+        return len(keys)
+
+    def artist_tracks(self, artist):
+        """
+        Track names and (normalised) vectors of one artist, matched case-insensitively.
+
+        The artist -> rows map is built on the first call and rebuilt after inserts.
+
+        Returns:
+        --------
+        names : list of str
+            The artist's tracks in insertion order.
+        vectors : np.ndarray
+            Their float32 vectors, one row per track.
+        """
+        if self._artist_rows is None:
+            artist_rows = {}
+            for row, (key_artist, _) in enumerate(self.keys):
+                artist_rows.setdefault(key_artist.strip().lower(), []).append(row)
+            self._artist_rows = artist_rows
+        rows = self._artist_rows.get(artist.strip().lower(), [])
+        return [self.keys[row][1] for row in rows], np.asarray(self._vectors[rows])
+
+    def search(self, queries, k=10, nprobe=None, rerank=True, rerank_factor=4):
+        """
+        Approximate top-k cosine search.
+
+        Parameters:
+        -----------
+        queries : np.ndarray
+            One query vector or a 2D array of queries.
+        k : int
+            Number of neighbours per query.
+        nprobe : int, optional
+            Lists scanned per query (defaults to the index setting).
+        rerank : bool
+            Re-score the best `rerank_factor * k` candidates against the exact float32 vectors.
+        rerank_factor : int
+            Candidate multiplier for re-ranking.
+
+        Returns:
+        --------
+        indices : np.ndarray
+            Row ids of shape (n_queries, k), -1 where fewer than k candidates were found.
+        scores : np.ndarray
+            Cosine similarities of shape (n_queries, k).
+        """
+        queries = _normalise(queries)
+        nprobe = min(nprobe or self.nprobe, self.n_lists)
+        probes = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for q, query in enumerate(queries):
+            rows = np.concatenate([self._list_rows[list_id] for list_id in probes[q]])
+            if len(rows) == 0:
+                continue
+            candidate_scores = self._codes[rows].astype(np.float32) @ query
+
+            n_keep = min(len(rows), rerank_factor * k if rerank else k)
+            keep = np.argpartition(-candidate_scores, n_keep - 1)[:n_keep]
+            rows, candidate_scores = rows[keep], candidate_scores[keep]
+            if rerank:
+                candidate_scores = self._vectors[rows] @ query
+
+            order = np.argsort(-candidate_scores)[:k]
+            indices[q, :len(order)] = rows[order]
+            scores[q, :len(order)] = candidate_scores[order]
+        return indices, scores
+
+    def exact_search(self, queries, k=10):
+        """
+        Brute-force top-k cosine search over every stored vector (ground truth for benchmarks).
+        """
+        queries = _normalise(queries)
+        sims = queries @ self._vectors[:self._size].T
+        k = min(k, self._size)
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(sims, top, axis=1), axis=1)
+        indices = np.take_along_axis(top, order, axis=1)
+        return indices, np.take_along_axis(sims, indices, axis=1)
+
+    def save(self, index_dir=TRACK_INDEX_DIR):
+        """
+        Write the index as a directory of raw .npy arrays plus a manifest, replacing `index_dir`.
+        """
+        list_sizes = np.array([len(rows) for rows in self._list_rows], dtype=np.int64)
+        arrays = {
+            "centroids": self.centroids,
+            "vectors": self._vectors[:self._size],
+            "codes": self._codes[:self._size],
+            "list_rows": np.concatenate(self._list_rows) if self._size else np.zeros(0, dtype=np.int64),
+            "list_offsets": np.concatenate([[0], np.cumsum(list_sizes)]),
+        }
+        manifest = {
+            "size": self._size,
+            "dim": self.centroids.shape[1],
+            "n_lists": self.n_lists,
+            "nprobe": self.nprobe,
+            "keys": self.keys,
+        }
+
+        tmp_dir = index_dir.rstrip("/") + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), array)
+        with open(os.path.join(tmp_dir, MANIFEST_FILE), "w") as file:
+            json.dump(manifest, file)
+
+        old_dir = index_dir.rstrip("/") + ".old"
+        if os.path.exists(index_dir):
+            shutil.rmtree(old_dir, ignore_errors=True)
+            os.replace(index_dir, old_dir)
+        os.replace(tmp_dir, index_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+        logger.info(f"Saved track index with {self._size} vectors in {self.n_lists} lists to {index_dir}.")
+
+    @classmethod
+    def load(cls, index_dir=TRACK_INDEX_DIR, mmap=True):
+        """
+        Load a saved index. With `mmap`, the vector stores are memory-mapped read-only until
+        the first insert copies them into memory.
+        """
+        with open(os.path.join(index_dir, MANIFEST_FILE), "r") as file:
+            manifest = json.load(file)
+        mmap_mode = "r" if mmap else None
+
+        def load_array(name):
+            return np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode=mmap_mode)
+
+        index = cls(np.load(os.path.join(index_dir, "centroids.npy")), nprobe=manifest["nprobe"])
+        index._vectors = load_array("vectors")
+        index._codes = load_array("codes")
+        list_rows = np.load(os.path.join(index_dir, "list_rows.npy"))
+        offsets = np.load(os.path.join(index_dir, "list_offsets.npy"))
+        index._list_rows = [list_rows[offsets[i]:offsets[i + 1]] for i in range(index.n_lists)]
+        index.keys = [tuple(key) for key in manifest["keys"]]
+        index._key_set = set(index.keys)
+        index._size = manifest["size"]
+        return index
+
+
+def catalog_vectors(entries):
+    """
+    Split catalog entries (as returned by `model.load_artist_esa_vectors`) into keys and a vector matrix.
+    """
+    entries = [entry for entry in entries if len(entry['esa_vector']) > 0]
+    keys = [(entry['artist'], entry['track']) for entry in entries]
+    vectors = np.array([np.asarray(entry['esa_vector'], dtype=np.float32).reshape(-1) for entry in entries])
+    return keys, vectors
+
+
+def build_track_index(catalog_file='esa_vectors_all_lyrics.csv', index_dir=TRACK_INDEX_DIR, n_lists=None):
+    """
+    Build the track index from every ESA vector in the catalog and save it.
+
+    Returns:
+    --------
+    TrackIndex
+        The built index.
+    """
+    keys, vectors = catalog_vectors(load_artist_esa_vectors(catalog_file))
+    index = TrackIndex.train(vectors, n_lists=n_lists)
+    index.add(vectors, keys)
+    index.save(index_dir)
+    return index
+
+
+def add_tracks_to_index(esa_df, index_dir=TRACK_INDEX_DIR):
+    """
+    Incrementally insert newly ingested tracks into the saved index (no-op if none has been built).
+
+    Parameters:
+    -----------
+    esa_df : pd.DataFrame
+        Rows with 'artist', 'track' and 'esa_vector' columns.
+    index_dir : str
+        Directory of the saved index.
+
+    Returns:
+    --------
+    int
+        Number of tracks inserted.
+    """
+    if not os.path.exists(os.path.join(index_dir, MANIFEST_FILE)):
+        logger.info(f"No track index at {index_dir}; skipping incremental insert.")
+        return 0
+    index = TrackIndex.load(index_dir, mmap=False)
+    entries = esa_df[['artist', 'track', 'esa_vector']].to_dict('records')
+    keys, vectors = catalog_vectors(entries)
+    added = index.add(vectors, keys)
+    if added:
+        index.save(index_dir)
+    logger.info(f"Inserted {added} track(s) into the track index.")
+    return added
+
+
+def get_track_index(index_dir=TRACK_INDEX_DIR):
+    """
+    Per-process cached, memory-mapped track index, or None if it has not been built.
+    """
+    key = os.path.abspath(index_dir)
+    if key not in _loaded_indexes:
+        if not os.path.exists(os.path.join(index_dir, MANIFEST_FILE)):
+            return None
+        _loaded_indexes[key] = TrackIndex.load(index_dir)
+    return _loaded_indexes[key]
+
+
+def recommend_tracks(text_vector, k=10, index_dir=TRACK_INDEX_DIR):
+    """
+    Recommend tracks from the whole library for an ESA vector.
+
+    Returns:
+    --------
+    list of tuple
+        (artist, track, similarity) for the nearest tracks, best first.
+    """
+    index = get_track_index(index_dir)
+    if index is None:
+        return []
+    indices, scores = index.search(text_vector, k=k)
+    return [(*index.keys[i], float(score)) for i, score in zip(indices[0], scores[0]) if i >= 0]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    build_track_index(serving_catalog())